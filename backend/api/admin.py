@@ -1,3 +1,4 @@
+from django import forms
 from django.contrib import admin
 
 from .models import (
@@ -10,14 +11,37 @@ from .models import (
     Bookshelf,
     BookshelfEntry,
     Comment,
+    bulk_operation,
 )
 
 admin.site.register(Author)
 admin.site.register(Publisher)
 admin.site.register(Genre)
-admin.site.register(Book)
 admin.site.register(ReadingStatus)
 admin.site.register(Review)
 admin.site.register(Bookshelf)
 admin.site.register(BookshelfEntry)
 admin.site.register(Comment)
+
+
+class BookAdminForm(forms.ModelForm):
+    class Meta:
+        model = Book
+        fields = '__all__'
+
+    def clean_authors(self):
+        authors = self.cleaned_data.get('authors')
+        if not authors:
+            raise forms.ValidationError('El libro debe tener al menos un autor.')
+        return authors
+
+
+@admin.register(Book)
+class BookAdmin(admin.ModelAdmin):
+    form = BookAdminForm
+
+    def save_related(self, request, form, formsets, change):
+        # El formulario ya ha comprobado los autores: save_m2m() usa authors.set(),
+        # que quita los anteriores antes de añadir los nuevos y haría saltar la señal
+        with bulk_operation():
+            super().save_related(request, form, formsets, change)
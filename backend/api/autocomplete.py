@@ -0,0 +1,197 @@
+"""
+Autocompletado de títulos y autores para el buscador del frontend.
+
+En PostgreSQL se usa pg_trgm (índices GIN ``gin_trgm_ops`` sobre
+``Book.title`` y ``Author.name``) con similitud por palabra, que tolera
+erratas y prefijos. En el resto de bases de datos (SQLite en los tests) se
+usa un índice de prefijos en memoria. En ambos casos las respuestas de los
+prefijos más consultados se sirven desde la caché de Django.
+"""
+import bisect
+import difflib
+import hashlib
+import unicodedata
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+
+from .models import Book
+
+CACHE_VERSION_KEY = 'autocomplete:version'
+MIN_QUERY_LENGTH = 2
+MAX_LIMIT = 20
+
+
+def get_setting(name, default):
+    return getattr(settings, 'BOOK_AUTOCOMPLETE', {}).get(name, default)
+
+
+def normalize(text):
+    """Minúsculas, sin tildes y con los espacios colapsados"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def invalidate():
+    """Invalida las respuestas cacheadas y el índice en memoria tras cambios en el catálogo"""
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, 1, None)
+
+
+def get_version():
+    return cache.get_or_set(CACHE_VERSION_KEY, 0, None)
+
+
+class PrefixIndex:
+    """
+    Índice de prefijos en memoria: una lista ordenada de (palabra, id_libro, es_titulo)
+    donde todas las palabras que empiezan por un prefijo ocupan un rango contiguo
+    que se localiza con búsqueda binaria.
+    """
+
+    def __init__(self, titles, authors):
+        entries = set()
+        for book_id, title in titles:
+            entries.update((token, book_id, True) for token in normalize(title).split())
+        for book_id, name in authors:
+            entries.update((token, book_id, False) for token in normalize(name).split())
+        self.entries = sorted(entries)
+        self.keys = [entry[0] for entry in self.entries]
+        self.vocabulary = sorted(set(self.keys))
+        self.titles = {book_id: normalize(title) for book_id, title in titles}
+
+    def _matches(self, prefix):
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff')
+        return self.entries[start:end]
+
+    def _expand(self, token):
+        """Prefijo exacto o, si no hay coincidencias, las palabras más parecidas (erratas)"""
+        matches = self._matches(token)
+        if matches:
+            return matches
+        close = difflib.get_close_matches(token, self.vocabulary, n=5, cutoff=0.75)
+        return [entry for word in close for entry in self._matches(word) if entry[0] == word]
+
+    def search(self, query, limit):
+        query = normalize(query)
+        scores = None
+        for token in query.split():
+            token_scores = {}
+            for _, book_id, is_title in self._expand(token):
+                token_scores[book_id] = max(token_scores.get(book_id, 0), 2 if is_title else 1)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {book_id: scores[book_id] + score for book_id, score in token_scores.items() if book_id in scores}
+        if not scores:
+            return []
+        for book_id in scores:
+            if self.titles.get(book_id, '').startswith(query):
+                scores[book_id] += 3
+        ranked = sorted(scores, key=lambda book_id: (-scores[book_id], len(self.titles.get(book_id, '')), book_id))
+        return ranked[:limit]
+
+
+_prefix_index = None
+_prefix_index_version = None
+
+
+def get_prefix_index():
+    global _prefix_index, _prefix_index_version
+    version = get_version()
+    if _prefix_index is None or _prefix_index_version != version:
+        _prefix_index = PrefixIndex(
+            list(Book.objects.values_list('id', 'title')),
+            list(Book.authors.through.objects.values_list('book_id', 'author__name')),
+        )
+        _prefix_index_version = version
+    return _prefix_index
+
+
+def search_postgres(query, limit):
+    """Busca por similitud de trigramas en títulos y autores dentro del presupuesto de tiempo"""
+    timeout_ms = int(get_setting('TIMEOUT_MS', 50))
+    scores = {}
+    # Dentro de otra transacción atomic() abre un savepoint y liberarlo no deshace
+    # el límite local: al salir se restaura el anterior para el resto de la transacción
+    previous = None
+    if connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('statement_timeout')")
+            previous = cursor.fetchone()[0]
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [f'{timeout_ms}ms'])
+            by_title = (
+                Book.objects.filter(title__trigram_word_similar=query)
+                .annotate(score=TrigramWordSimilarity(query, 'title'))
+                .order_by('-score')
+                .values_list('id', 'score')[:limit]
+            )
+            by_author = (
+                Book.objects.filter(authors__name__trigram_word_similar=query)
+                .annotate(score=TrigramWordSimilarity(query, 'authors__name'))
+                .order_by('-score')
+                .values_list('id', 'score')[:limit]
+            )
+            for book_id, score in list(by_title) + list(by_author):
+                scores[book_id] = max(scores.get(book_id, 0), score)
+    finally:
+        if previous is not None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", [previous])
+    return sorted(scores, key=lambda book_id: -scores[book_id])[:limit]
+
+
+def autocomplete(query, limit=10):
+    """
+    Devuelve hasta ``limit`` sugerencias ``{id, title, author, cover_image_url}``
+    ordenadas por relevancia. Las consultas que superan el presupuesto de tiempo
+    devuelven una lista vacía en lugar de bloquear el buscador.
+    """
+    query = ' '.join((query or '').lower().split())[:100]
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+
+    # El texto va resumido en un hash para que la clave sea válida en cualquier backend de caché
+    query_hash = hashlib.md5(query.encode()).hexdigest()
+    cache_key = f'autocomplete:{get_version()}:{limit}:{query_hash}'
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        if connection.vendor == 'postgresql':
+            book_ids = search_postgres(query, limit)
+        else:
+            book_ids = get_prefix_index().search(query, limit)
+    except OperationalError:
+        # statement_timeout: mejor sin sugerencias que una respuesta lenta
+        return []
+
+    books = {book['id']: book for book in Book.objects.filter(pk__in=book_ids).values('id', 'title', 'cover_image_url')}
+    first_authors = {}
+    authors = Book.authors.through.objects.filter(book_id__in=book_ids).order_by('id').values_list('book_id', 'author__name')
+    for book_id, name in authors:
+        first_authors.setdefault(book_id, name)
+
+    results = [
+        {
+            'id': book_id,
+            'title': books[book_id]['title'],
+            'author': first_authors.get(book_id),
+            'cover_image_url': books[book_id]['cover_image_url'],
+        }
+        for book_id in book_ids
+        if book_id in books
+    ]
+    cache.set(cache_key, results, get_setting('CACHE_TIMEOUT', 300))
+    return results
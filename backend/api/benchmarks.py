@@ -0,0 +1,395 @@
+"""
+Benchmarks de rendimiento de la API.
+
+Cada escenario se registra con ``@scenario`` y se ejecuta con el comando
+``python manage.py benchmark <escenario>``. Los escenarios generan un
+catálogo sintético y el comando revierte la transacción al terminar, así que
+se pueden lanzar contra una copia de la base de datos real sin dejar restos.
+"""
+import base64
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import autocomplete
+from .models import (
+    Author, Book, Genre, Publisher, ReadingStatus, bulk_operation, trusted_write, validate_books_have_authors,
+)
+from .search import BookSearchFilter, index_books
+
+SCENARIOS = {}
+
+SYLLABLES = [
+    'la', 'ra', 'ma', 'no', 'sol', 'mar', 'tie', 'rra', 'cie', 'lo', 'vi', 'da', 'luz', 'som', 'bra',
+    'cas', 'ti', 'llo', 'per', 'di', 'do', 'gue', 'rra', 'paz', 'rei', 'no', 'dra', 'gon', 'stel', 'ar',
+]
+
+
+def scenario(name):
+    """Registra una función como escenario del comando ``benchmark``"""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(func, items):
+    """Ejecuta ``func(item)`` para cada elemento y devuelve las latencias en milisegundos"""
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(stdout, label, samples):
+    stdout.write(
+        f'{label:<40} n={len(samples):<5} '
+        f'p50={percentile(samples, 50):8.2f} ms  p95={percentile(samples, 95):8.2f} ms  '
+        f'max={max(samples):8.2f} ms'
+    )
+
+
+def make_words(rng, count):
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+
+def create_synthetic_catalogue(n_books, batch_size=5000, seed=0, stdout=None):
+    """
+    Crea ``n_books`` libros sintéticos con editoriales, autores y géneros usando
+    inserciones masivas. No dispara señales, así que no indexa la búsqueda.
+    Devuelve la lista de ids de los libros creados.
+    """
+    rng = random.Random(seed)
+    vocabulary = make_words(rng, 5000)
+
+    publishers = Publisher.objects.bulk_create(
+        [Publisher(name=f'Editorial {word.title()} {i}') for i, word in enumerate(make_words(rng, 200))]
+    )
+    authors = Author.objects.bulk_create(
+        [Author(name=f'{a.title()} {b.title()}') for a, b in zip(make_words(rng, 20000), make_words(rng, 20000))],
+        batch_size=batch_size,
+    )
+    genres = Genre.objects.bulk_create(
+        [Genre(name=f'Género {word} {i}') for i, word in enumerate(make_words(rng, 50))]
+    )
+
+    book_ids = []
+    isbn_base = 9_780_000_000_000
+    for start in range(0, n_books, batch_size):
+        size = min(batch_size, n_books - start)
+        books = Book.objects.bulk_create([
+            Book(
+                title=' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5))).capitalize(),
+                isbn=str(isbn_base + start + i),
+                synopsis=' '.join(rng.choice(vocabulary) for _ in range(rng.randint(20, 60))),
+                pages=rng.randint(50, 1200),
+                publisher=rng.choice(publishers),
+            )
+            for i in range(size)
+        ])
+        Book.authors.through.objects.bulk_create([
+            Book.authors.through(book_id=book.pk, author_id=rng.choice(authors).pk) for book in books
+        ])
+        Book.genres.through.objects.bulk_create([
+            Book.genres.through(book_id=book.pk, genre_id=rng.choice(genres).pk) for book in books
+        ])
+        book_ids.extend(book.pk for book in books)
+        if stdout:
+            stdout.write(f'  -> {len(book_ids)}/{n_books} libros creados')
+
+    return book_ids
+
+
+def sample_queries(rng, count):
+    """Prefijos de palabras de títulos existentes, como los que envía el buscador al teclear"""
+    titles = list(Book.objects.order_by('?').values_list('title', flat=True)[:count])
+    queries = []
+    for title in titles:
+        word = rng.choice(title.split())
+        queries.append(word[:rng.randint(3, max(3, len(word)))])
+    return queries
+
+
+class _SearchView:
+    search_fields = ['title', 'synopsis', 'authors__name', 'publisher__name']
+
+
+def _search_page(backend, query, page_size=50):
+    request = Request(APIRequestFactory().get('/api/books/', {'search': query}))
+    queryset = Book.objects.select_related('publisher').order_by('title')
+    queryset = backend.filter_queryset(request, queryset, _SearchView())
+    # Igual que PageNumberPagination: COUNT(*) más la primera página
+    queryset.count()
+    list(queryset[:page_size])
+
+
+@scenario('search')
+def search_benchmark(command, options):
+    """Latencia de ?search= con ILIKE (SearchFilter) frente al índice de texto completo"""
+    rng = random.Random(1)
+    book_ids = create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    command.stdout.write('Indexando documentos de búsqueda...')
+    for start in range(0, len(book_ids), 5000):
+        index_books(book_ids[start:start + 5000])
+
+    queries = sample_queries(rng, options['queries'])
+    legacy, full_text = SearchFilter(), BookSearchFilter()
+    report(command.stdout, 'ILIKE (SearchFilter)', measure(lambda query: _search_page(legacy, query), queries))
+    report(command.stdout, 'Texto completo (BookSearchFilter)', measure(lambda query: _search_page(full_text, query), queries))
+
+
+@scenario('autocomplete')
+def autocomplete_benchmark(command, options):
+    """Latencia de /api/books/autocomplete/ sin caché (primer acceso) y con caché (prefijos calientes)"""
+    rng = random.Random(2)
+    create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    autocomplete.invalidate()
+    queries = sample_queries(rng, options['queries'])
+    # La primera consulta en SQLite construye el índice en memoria; no se mide
+    autocomplete.autocomplete(queries[0])
+    report(command.stdout, 'Autocompletado (sin caché)', measure(autocomplete.autocomplete, queries[1:]))
+    report(command.stdout, 'Autocompletado (con caché)', measure(autocomplete.autocomplete, queries[1:]))
+
+
+def call_list(viewset, user, params, path='/api/books/'):
+    """Ejecuta la acción list de un viewset como lo haría una petición GET"""
+    request = APIRequestFactory().get(path, params)
+    force_authenticate(request, user=user)
+    # Las peticiones sintéticas llegan con Host "testserver"
+    with override_settings(ALLOWED_HOSTS=['*']):
+        response = viewset.as_view({'get': 'list'})(request)
+        response.render()
+    return response
+
+
+@scenario('pagination')
+def pagination_benchmark(command, options):
+    """Latencia de la primera página y de la página 2000 con paginación por páginas y por clave"""
+    from .views import BookViewSet
+
+    create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    user = User.objects.create_user(username='benchmark-pagination')
+    page_size = 50
+    deep_page = max(2, min(2000, options['books'] // page_size))
+    repeat = range(max(1, options['queries'] // 10))
+
+    # Cursor equivalente a haber llegado a la página profunda siguiendo los enlaces "next"
+    last_title, last_id = Book.objects.order_by('title', 'pk').values_list('title', 'pk')[(deep_page - 1) * page_size - 1]
+    cursor = base64.urlsafe_b64encode(json.dumps({'v': [last_title, last_id], 'r': False}).encode()).decode()
+
+    cases = [
+        ('page=1 (OFFSET + COUNT)', {'page': 1}),
+        (f'page={deep_page} (OFFSET + COUNT)', {'page': deep_page}),
+        ('keyset, página 1', {'pagination': 'keyset'}),
+        (f'keyset, página {deep_page}', {'pagination': 'keyset', 'cursor': cursor}),
+    ]
+    for label, params in cases:
+        report(command.stdout, label, measure(lambda _: call_list(BookViewSet, user, params), repeat))
+
+
+def call_view(viewset, user, actions, path, params=None, data=None, **kwargs):
+    """
+    Como ``call_list`` pero para cualquier acción (p. ej. retrieve con ``pk``).
+    Con ``data`` se envía como JSON con el método de ``actions`` (POST, PATCH...)
+    """
+    factory = APIRequestFactory()
+    if data is None:
+        request = factory.get(path, params or {})
+    else:
+        request = getattr(factory, next(iter(actions)))(path, data, format='json')
+    force_authenticate(request, user=user)
+    with override_settings(ALLOWED_HOSTS=['*']):
+        response = viewset.as_view(actions)(request, **kwargs)
+        response.render()
+    return response
+
+
+@scenario('response_cache')
+def response_cache_benchmark(command, options):
+    """Rendimiento de los endpoints de catálogo con la caché de respuestas activada y desactivada"""
+    from .views import AuthorViewSet, BookViewSet
+
+    rng = random.Random(3)
+    book_ids = create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    user = User.objects.create_user(username='benchmark-response-cache')
+    last_page = max(1, min(len(book_ids) // 50, 20))
+    # Carga típica: las primeras páginas y detalles de un subconjunto de libros populares
+    popular = rng.sample(book_ids, min(len(book_ids), 50))
+    requests = []
+    for _ in range(options['queries']):
+        if rng.random() < 0.5:
+            requests.append((BookViewSet, 'list', '/api/books/', {'page': rng.randint(1, last_page)}, {}))
+        elif rng.random() < 0.8:
+            book_id = rng.choice(popular)
+            requests.append((BookViewSet, 'retrieve', f'/api/books/{book_id}/', {}, {'pk': book_id}))
+        else:
+            requests.append((AuthorViewSet, 'list', '/api/authors/', {'page': rng.randint(1, 5)}, {}))
+
+    def run(request):
+        viewset, action, path, params, kwargs = request
+        call_view(viewset, user, {'get': action}, path, params, **kwargs)
+
+    for label, enabled in (('Sin caché', False), ('Con caché', True)):
+        with override_settings(RESPONSE_CACHE={'ENABLED': enabled, 'TIMEOUT': 600}):
+            start = time.perf_counter()
+            samples = measure(run, requests)
+            elapsed = time.perf_counter() - start
+        report(command.stdout, label, samples)
+        command.stdout.write(f'{"":<40} {len(requests) / elapsed:8.1f} peticiones/s')
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` que cuenta las consultas (sin el límite de CaptureQueriesContext)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure_writes(command, label, func, items, validate=None):
+    """
+    Como ``measure`` más las escrituras por segundo y las consultas por escritura.
+    Con ``validate`` las escrituras van dentro de ``bulk_operation()`` y después
+    se llama a ``validate()`` una sola vez (se incluye en el tiempo total)
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        if validate:
+            with bulk_operation():
+                samples = measure(func, items)
+            validate()
+        else:
+            samples = measure(func, items)
+        elapsed = time.perf_counter() - start
+    report(command.stdout, label, samples)
+    command.stdout.write(
+        f'{"":<40} {len(items) / elapsed:8.1f} escrituras/s  {counter.count / len(items):5.1f} consultas/escritura'
+    )
+
+
+@scenario('book_write')
+def book_write_benchmark(command, options):
+    """Altas de libros por la API y reasignación de autores con y sin validación por lotes"""
+    from .views import BookViewSet
+
+    rng = random.Random(4)
+    book_ids = create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    user = User.objects.create_user(username='benchmark-book-write', is_staff=True, is_superuser=True)
+    author_ids = list(Author.objects.values_list('pk', flat=True)[:2000])
+    publisher_ids = list(Publisher.objects.values_list('pk', flat=True))
+    count = options['queries']
+
+    def create(index):
+        call_view(BookViewSet, user, {'post': 'create'}, '/api/books/', data={
+            'title': f'Libro de prueba {index}',
+            'isbn': f'{9_790_000_000_000 + index}',
+            'pages': rng.randint(50, 1200),
+            'publisher': rng.choice(publisher_ids),
+            'authors': rng.sample(author_ids, 2),
+        })
+
+    def update(book_id):
+        call_view(BookViewSet, user, {'patch': 'partial_update'}, f'/api/books/{book_id}/',
+                  data={'authors': rng.sample(author_ids, 2)}, pk=book_id)
+
+    measure_writes(command, 'POST /books/ (2 autores)', create, range(count))
+    measure_writes(command, 'PATCH /books/{id}/ (autores)', update, rng.sample(book_ids, min(count, len(book_ids))))
+
+    # Reasignación masiva por ORM: con la señal se consulta por cada cambio; en
+    # bulk_operation() se valida una sola vez al final
+    books = list(Book.objects.filter(pk__in=rng.sample(book_ids, min(count, len(book_ids)))))
+    for book in books:
+        book.authors.add(rng.choice(author_ids))
+
+    def reassign(book):
+        book.authors.set([book.authors.all()[0].pk, rng.choice(author_ids)])
+
+    measure_writes(command, 'authors.set() (validación por señal)', reassign, books)
+    measure_writes(command, 'authors.set() (bulk_operation)', reassign, books,
+                   validate=lambda: validate_books_have_authors([book.pk for book in books]))
+
+
+@scenario('reading_status_write')
+def reading_status_write_benchmark(command, options):
+    """Actualizaciones de estados de lectura con full_clean() completo y con trusted_write()"""
+    from .views import ReadingStatusViewSet
+
+    rng = random.Random(5)
+    book_ids = create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    user = User.objects.create_user(username='benchmark-reading-status')
+    started_at = date.today() - timedelta(days=30)
+    ReadingStatus.objects.bulk_create([
+        ReadingStatus(user=user, book_id=book_id, status='R', started_at=started_at)
+        for book_id in rng.sample(book_ids, min(options['queries'], len(book_ids)))
+    ])
+    statuses = list(ReadingStatus.objects.filter(user=user))
+    ratings = [0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5]
+
+    def update(reading_status):
+        reading_status.status = 'C'
+        reading_status.rating = rng.choice(ratings)
+        reading_status.finished_at = started_at + timedelta(days=rng.randint(1, 29))
+        reading_status.save()
+
+    def patch(reading_status):
+        call_view(ReadingStatusViewSet, user, {'patch': 'partial_update'}, f'/api/reading-statuses/{reading_status.pk}/',
+                  data={'rating': rng.choice(ratings)}, pk=reading_status.pk)
+
+    # La diferencia entre las dos primeras es lo que se ahorra cada escritura de los serializers
+    measure_writes(command, 'save() (full_clean)', update, statuses)
+    with trusted_write():
+        measure_writes(command, 'save() (trusted_write)', update, statuses)
+    measure_writes(command, 'PATCH /reading-statuses/{id}/', patch, statuses)
+
+
+@scenario('sparse_fieldsets')
+def sparse_fieldsets_benchmark(command, options):
+    """Tamaño, consultas y latencia de una página de estados de lectura completa y con ?fields="""
+    from .views import ReadingStatusViewSet
+
+    rng = random.Random(6)
+    book_ids = create_synthetic_catalogue(options['books'], stdout=command.stdout)
+    user = User.objects.create_user(username='benchmark-sparse-fieldsets')
+    started_at = date.today() - timedelta(days=30)
+    ReadingStatus.objects.bulk_create([
+        ReadingStatus(user=user, book_id=book_id, status='R', started_at=started_at)
+        for book_id in rng.sample(book_ids, min(100, len(book_ids)))
+    ])
+    repeat = range(max(1, options['queries'] // 10))
+
+    def fetch(params):
+        return call_list(ReadingStatusViewSet, user, params, path='/api/reading-statuses/')
+
+    cases = [
+        ('completa', {}),
+        ('?fields=biblioteca', {'fields': 'id,status,book_detail.title,book_detail.authors,book_detail.cover_image_url'}),
+        ('?fields=id,status', {'fields': 'id,status'}),
+    ]
+    for label, params in cases:
+        params = {**params, 'page_size': 100}
+        with CaptureQueriesContext(connection) as queries:
+            response = fetch(params)
+        command.stdout.write(f'  -> {label}: {len(response.content) / 1024:.1f} KiB, {len(queries)} consultas')
+        report(command.stdout, f'Estados de lectura ({label})', measure(lambda _: fetch(params), repeat))
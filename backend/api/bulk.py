@@ -0,0 +1,118 @@
+"""
+Escrituras masivas validadas en bloque.
+
+Las reglas son las de los modelos (``clean_fields`` y ``clean``), pero se
+aplican sin consultas por fila: las claves ajenas se comprueban con una sola
+consulta por lote y se escribe con ``bulk_create`` por lotes dentro de una
+transacción. Los errores se devuelven por fila sin abortar el resto.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import response_cache
+from .counters import recompute_book_counters
+from .models import Book, ReadingStatus
+from .summaries import rebuild_summaries
+
+READING_STATUS_FIELDS = ['status', 'rating', 'started_at', 'finished_at']
+BATCH_SIZE = 1000
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def to_python(record):
+    """
+    Valores de ``record`` convertidos con los campos del modelo. Con un tipo
+    inesperado (p. ej. una fecha numérica) ``to_python`` lanza TypeError o
+    ValueError en lugar de ValidationError: se convierten en errores del campo
+    """
+    values, field_errors = {}, {}
+    for name in READING_STATUS_FIELDS:
+        field = ReadingStatus._meta.get_field(name)
+        value = record.get(name)
+        try:
+            values[name] = field.to_python(value)
+        except ValidationError as exc:
+            field_errors[name] = exc.messages
+        except (TypeError, ValueError):
+            field_errors[name] = ValidationError(
+                field.error_messages['invalid'], code='invalid', params={'value': value}
+            ).messages
+    if field_errors:
+        raise ValidationError(field_errors)
+    return values
+
+
+def upsert_reading_statuses(user, records, batch_size=BATCH_SIZE):
+    """
+    Crea o actualiza los estados de lectura de ``user`` a partir de una lista de
+    diccionarios ``{book, status, rating, started_at, finished_at}``. Si un libro
+    aparece varias veces se usa el último registro y los anteriores se devuelven
+    como errores, así que cada fila se importa o aparece en ``errors``.
+    Devuelve ``{'created': n, 'updated': n, 'errors': [{'index', 'book', 'errors'}]}``.
+    """
+    errors = []
+    candidates = {}
+
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'book': None, 'errors': {'non_field_errors': ['Se esperaba un objeto']}})
+            continue
+        book_id = record.get('book')
+        if isinstance(book_id, bool) or not isinstance(book_id, int) or book_id < 1:
+            errors.append({'index': index, 'book': book_id, 'errors': {'book': ['Se esperaba el id de un libro']}})
+            continue
+        if book_id in candidates:
+            errors.append({
+                'index': candidates[book_id][0], 'book': book_id,
+                'errors': {'book': ['Libro repetido en la petición, se usa la última fila']},
+            })
+        candidates[book_id] = (index, record)
+
+    existing_books = set()
+    for batch in chunks(list(candidates), batch_size):
+        existing_books.update(Book.objects.filter(pk__in=batch).values_list('pk', flat=True))
+
+    statuses = []
+    for book_id, (index, record) in candidates.items():
+        if book_id not in existing_books:
+            errors.append({'index': index, 'book': book_id, 'errors': {'book': ['Libro no encontrado']}})
+            continue
+        try:
+            status = ReadingStatus(user=user, book_id=book_id, **to_python(record))
+            # Sin las claves ajenas (ya comprobadas) ni unique_together (es un upsert)
+            status.clean_fields(exclude=['user', 'book'])
+            status.clean()
+        except ValidationError as exc:
+            errors.append({'index': index, 'book': book_id, 'errors': exc.message_dict})
+            continue
+        statuses.append(status)
+
+    book_ids = [status.book_id for status in statuses]
+    with transaction.atomic():
+        already = set()
+        for batch in chunks(book_ids, batch_size):
+            already.update(
+                ReadingStatus.objects.filter(user=user, book_id__in=batch).values_list('book_id', flat=True)
+            )
+        ReadingStatus.objects.bulk_create(
+            statuses,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['user', 'book'],
+            update_fields=READING_STATUS_FIELDS,
+        )
+        # bulk_create no envía señales: contadores, resúmenes y versiones se actualizan aquí
+        for batch in chunks(book_ids, batch_size):
+            recompute_book_counters(Book.objects.filter(pk__in=batch))
+        if statuses:
+            rebuild_summaries([user.pk])
+
+    if statuses:
+        response_cache.invalidate(f'reading_status:user:{user.pk}')
+
+    errors.sort(key=lambda error: error['index'])
+    return {'created': len(statuses) - len(already), 'updated': len(already), 'errors': errors}
@@ -0,0 +1,26 @@
+"""
+Hilos de comentarios de una reseña (``?tree=1`` en /api/reviews/{id}/comments/).
+
+Se pagina por comentarios principales y las respuestas de los hilos de la
+página se traen con una sola consulta por rangos de la ruta materializada
+(``Comment.path``); el árbol se monta en memoria en O(n) indexando los
+comentarios por id, sin una consulta por nivel ni por respuesta.
+"""
+from itertools import chain
+
+
+def build_comment_tree(roots, replies):
+    """
+    Anida las respuestas (diccionarios serializados con ``parent_comment`` como
+    id, en orden de conversación) bajo sus padres en la lista ``replies`` de
+    cada uno. Devuelve las raíces; las respuestas de otras raíces se descartan
+    """
+    nodes = {}
+    for node in chain(roots, replies):
+        node['replies'] = []
+        nodes[node['id']] = node
+    for node in replies:
+        parent = nodes.get(node['parent_comment'])
+        if parent is not None:
+            parent['replies'].append(node)
+    return roots
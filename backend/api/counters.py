@@ -0,0 +1,126 @@
+"""
+Contadores desnormalizados de los libros (lectores, calificaciones y reseñas)
+y de las reseñas (comentarios y fecha del último).
+
+Se actualizan por diferencia con expresiones F (un único UPDATE por libro o
+reseña afectados) cada vez que se guarda o borra un ReadingStatus, una Review
+o un Comment, así que mostrar u ordenar por la media o por los comentarios no
+requiere agregar sobre esas tablas. ``recompute_book_counters`` y
+``recompute_review_counters`` los recalculan desde cero para reparar
+desviaciones, por ejemplo tras inserciones masivas que no disparan señales.
+"""
+from decimal import Decimal
+
+from django.db.models import Avg, Count, DecimalField, F, FloatField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf
+
+from . import response_cache
+from .models import Book, Comment, ReadingStatus, Review
+
+
+def as_decimal(value):
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+
+def update_book_counters(book_id, readers=0, ratings=0, rating_sum=Decimal(0), reviews=0):
+    """Aplica los incrementos indicados a los contadores de un libro"""
+    if not book_id or not any((readers, ratings, rating_sum, reviews)):
+        return
+    new_rating_count = F('rating_count') + ratings
+    new_rating_sum = F('rating_sum') + rating_sum
+    Book.objects.filter(pk=book_id).update(
+        reader_count=F('reader_count') + readers,
+        rating_count=new_rating_count,
+        rating_sum=new_rating_sum,
+        # En un UPDATE las F() valen lo anterior al cambio, así que la media usa los valores nuevos
+        rating_avg=Cast(new_rating_sum, FloatField()) / NullIf(new_rating_count, 0),
+        review_count=F('review_count') + reviews,
+    )
+    response_cache.invalidate_objects('book', [book_id], content=False)
+
+
+def reading_status_changed(old, new):
+    """
+    Actualiza los contadores tras guardar o borrar un ReadingStatus.
+    ``old`` y ``new`` son tuplas (book_id, rating), o None si no existía / ya no existe.
+    """
+    if old == new:
+        return
+    if old and new and old[0] == new[0]:
+        old_rating, new_rating = old[1], new[1]
+        update_book_counters(
+            new[0],
+            ratings=(new_rating is not None) - (old_rating is not None),
+            rating_sum=as_decimal(new_rating) - as_decimal(old_rating),
+        )
+        return
+    if old:
+        update_book_counters(old[0], readers=-1, ratings=-(old[1] is not None), rating_sum=-as_decimal(old[1]))
+    if new:
+        update_book_counters(new[0], readers=1, ratings=int(new[1] is not None), rating_sum=as_decimal(new[1]))
+
+
+def review_changed(old_book_id, new_book_id):
+    """Actualiza review_count tras guardar o borrar una Review"""
+    if old_book_id == new_book_id:
+        return
+    update_book_counters(old_book_id, reviews=-1)
+    update_book_counters(new_book_id, reviews=1)
+
+
+def comment_added(review_id, created_at):
+    """Suma un comentario (o respuesta) a su reseña"""
+    Review.objects.filter(pk=review_id).update(
+        comment_count=F('comment_count') + 1,
+        last_comment_at=Greatest(Coalesce('last_comment_at', Value(created_at)), Value(created_at)),
+    )
+
+
+def comment_removed(review_id):
+    """Resta un comentario borrado; la fecha del último sale del índice (review, created_at)"""
+    latest = Comment.objects.filter(review=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    Review.objects.filter(pk=review_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1,
+        last_comment_at=Subquery(latest),
+    )
+
+
+def recompute_book_counters(books=None):
+    """
+    Recalcula desde cero los contadores de los libros indicados (todos por defecto)
+    con un único UPDATE con subconsultas correlacionadas. Devuelve el número de libros.
+    """
+    if books is None:
+        books = Book.objects.all()
+        response_cache.invalidate_table('book')
+    else:
+        response_cache.invalidate_objects('book', books.values_list('pk', flat=True), content=False)
+    statuses = ReadingStatus.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    rated = statuses.filter(rating__isnull=False)
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    decimal_field = DecimalField(max_digits=12, decimal_places=1)
+
+    return books.update(
+        reader_count=Coalesce(Subquery(statuses.annotate(total=Count('pk')).values('total')), 0),
+        rating_count=Coalesce(Subquery(rated.annotate(total=Count('pk')).values('total')), 0),
+        rating_sum=Coalesce(
+            Subquery(rated.annotate(total=Sum('rating')).values('total'), output_field=decimal_field),
+            Value(Decimal(0), output_field=decimal_field),
+        ),
+        rating_avg=Subquery(rated.annotate(average=Avg('rating')).values('average'), output_field=FloatField()),
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+    )
+
+
+def recompute_review_counters(reviews=None):
+    """
+    Recalcula desde cero los contadores de comentarios de las reseñas indicadas
+    (todas por defecto) con un único UPDATE. Devuelve el número de reseñas.
+    """
+    if reviews is None:
+        reviews = Review.objects.all()
+    comments = Comment.objects.filter(review=OuterRef('pk')).order_by().values('review')
+    return reviews.update(
+        comment_count=Coalesce(Subquery(comments.annotate(total=Count('pk')).values('total')), 0),
+        last_comment_at=Subquery(comments.annotate(latest=Max('created_at')).values('latest')),
+    )
@@ -44,6 +44,16 @@ def custom_exception_handler(exc, context):
             custom_response_data['message'] = 'Error interno del servidor'
         
         response.data = custom_response_data
+
+    elif isinstance(exc, BookTrackerException):
+        response = Response(
+            {
+                'error': True,
+                'message': exc.message,
+                'details': {}
+            },
+            status=exc.status_code
+        )
     
     return response
 
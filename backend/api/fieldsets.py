@@ -0,0 +1,149 @@
+"""
+Respuestas parciales de los serializadores de lectura (sparse fieldsets).
+
+``?fields=id,status,book_detail.title`` limita los campos de la respuesta: los
+de los serializadores anidados van con punto y un anidado sin subcampos se
+devuelve completo. ``?expand=authors`` cambia las relaciones que se muestran
+como texto por el objeto completo (``expandable_fields`` de cada serializador;
+también con punto, p. ej. ``?expand=book.publisher``). Sin estos parámetros
+las respuestas no cambian; los nombres desconocidos se ignoran.
+
+Las vistas recortan además la consulta (``prune_queryset``): only() con las
+columnas que leen los campos pedidos y solo los select_related y
+prefetch_related de las relaciones que se muestran, así que una respuesta más
+estrecha es también una consulta más barata.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.filters import OrderingFilter
+
+
+def parse_fieldset(value):
+    """'id,book_detail.title' -> {'id': {}, 'book_detail': {'title': {}}}; {} si no se pide nada"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+# Serializador que atiende ?fields= y ?expand=. El serializador raíz los lee de la
+# petición y pasa a cada anidado su parte del árbol. Los mixins de este módulo no
+# llevan docstring: drf-spectacular la usaría como descripción de los
+# serializadores y vistas que no tienen la suya
+class SparseFieldsetMixin:
+    # Campo -> (serializador, kwargs) que lo sustituye con ?expand=campo
+    expandable_fields = {}
+
+    def get_fieldset(self):
+        """(campos pedidos o None si son todos, relaciones a expandir)"""
+        if hasattr(self, '_fieldset'):
+            return self._fieldset, self._expand
+        # Solo el serializador raíz (o el hijo de la lista raíz) lee la petición:
+        # anidado en otro serializador, los parámetros no son suyos
+        request = self.context.get('request')
+        if request is None or self.root not in (self, self.parent):
+            return None, {}
+        return (
+            parse_fieldset(request.query_params.get('fields', '')) or None,
+            parse_fieldset(request.query_params.get('expand', '')),
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset, expand = self.get_fieldset()
+        for name, (serializer_class, kwargs) in self.expandable_fields.items():
+            if name in expand:
+                fields[name] = serializer_class(read_only=True, **kwargs)
+        if fieldset is not None:
+            fields = {name: field for name, field in fields.items() if name in fieldset}
+        for name, field in fields.items():
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, SparseFieldsetMixin):
+                nested._fieldset = (fieldset or {}).get(name) or None
+                nested._expand = expand.get(name, {})
+        return fields
+
+
+def concrete_fields(model, prefix):
+    return [prefix + field.name for field in model._meta.concrete_fields]
+
+
+def collect_lookups(serializer, model, prefix, only, related, prefetch):
+    """
+    Recorre los campos del serializador y apunta las columnas (``only``), las
+    relaciones a unir (``related``) y las que se precargan (``prefetch``). Dentro
+    de una precarga ``only`` es None: allí se cargan los objetos completos
+    """
+    for field in serializer.fields.values():
+        nested = getattr(field, 'child', field)
+        try:
+            if field.source == '*' or len(field.source_attrs) != 1:
+                raise FieldDoesNotExist
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # Método, propiedad o anotación: no sabemos qué columnas lee
+            if only is not None:
+                only.update(concrete_fields(model, prefix))
+            continue
+
+        path = prefix + model_field.name
+        if not model_field.is_relation:
+            if only is not None:
+                only.add(path)
+        elif model_field.many_to_many or model_field.one_to_many:
+            prefetch.append(path)
+            if isinstance(nested, serializers.BaseSerializer):
+                collect_lookups(nested, model_field.related_model, path + '__', None, prefetch, prefetch)
+        elif isinstance(field, serializers.PrimaryKeyRelatedField):
+            if only is not None:
+                only.add(path)  # Basta con la clave ajena
+        else:
+            related.append(path)
+            if only is not None:
+                # La clave ajena siempre: si del anidado solo se piden relaciones
+                # ManyToMany, select_related no puede recorrer un campo diferido
+                only.add(path)
+            if isinstance(nested, serializers.BaseSerializer):
+                collect_lookups(nested, model_field.related_model, path + '__', only, related, prefetch)
+            elif only is not None:
+                # StringRelatedField y similares usan el objeto completo
+                only.update(concrete_fields(model_field.related_model, path + '__'))
+
+
+def prune_queryset(queryset, serializer, extra_fields=()):
+    """
+    Ajusta la consulta a los campos que va a leer ``serializer``: sustituye sus
+    select_related y prefetch_related (solo cadenas, no Prefetch) y la limita
+    con only(). ``extra_fields`` añade columnas, p. ej. las de ordenación
+    """
+    serializer = getattr(serializer, 'child', serializer)
+    only, related, prefetch = {queryset.model._meta.pk.name, *extra_fields}, [], []
+    collect_lookups(serializer, queryset.model, '', only, related, prefetch)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.prefetch_related(*prefetch).only(*only)
+
+
+# Vista cuyos list y retrieve recortan la consulta cuando se pide ?fields= (si su
+# serializador de lectura atiende el parámetro). Lo hace en filter_queryset, que
+# ambas acciones llaman tras get_queryset
+class PrunedQuerysetMixin:
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve') and issubclass(self.get_serializer_class(), SparseFieldsetMixin):
+            queryset = self.prune_queryset(queryset, self.get_serializer())
+        return queryset
+
+    def prune_queryset(self, queryset, serializer):
+        if not self.request.query_params.get('fields'):
+            return queryset
+        # Columnas de ordenación propias: la paginación por clave las lee del último objeto
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        ordering = OrderingFilter().get_ordering(self.request, queryset, self) or []
+        return prune_queryset(queryset, serializer, [
+            field.lstrip('-') for field in ordering if field.lstrip('-') in columns
+        ])
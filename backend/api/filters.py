@@ -28,9 +28,18 @@ class BookFilter(django_filters.FilterSet):
     # Filtro por ISBN
     isbn = django_filters.CharFilter(field_name='isbn', lookup_expr='icontains')
     
+    # Filtros por contadores (calificación media, número de calificaciones y reseñas)
+    min_rating = django_filters.NumberFilter(field_name='rating_avg', lookup_expr='gte')
+    max_rating = django_filters.NumberFilter(field_name='rating_avg', lookup_expr='lte')
+    min_rating_count = django_filters.NumberFilter(field_name='rating_count', lookup_expr='gte')
+    min_review_count = django_filters.NumberFilter(field_name='review_count', lookup_expr='gte')
+    
     class Meta:
         model = Book
-        fields = ['title', 'genres', 'authors', 'publisher', 'publication_year', 'min_pages', 'max_pages', 'isbn']
+        fields = [
+            'title', 'genres', 'authors', 'publisher', 'publication_year', 'min_pages', 'max_pages', 'isbn',
+            'min_rating', 'max_rating', 'min_rating_count', 'min_review_count',
+        ]
 
 
 class ReviewFilter(django_filters.FilterSet):
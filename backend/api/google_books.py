@@ -0,0 +1,142 @@
+"""
+Cliente de la API de Google Books para enriquecer el catálogo (populate_db).
+
+- Las peticiones se hacen en paralelo con un pool de hilos que comparte una
+  única ``requests.Session`` (conexiones reutilizadas).
+- Un limitador global reparte las peticiones para no superar ``rate_limit``
+  por segundo entre todos los hilos.
+- Los errores temporales (429, 5xx y fallos de conexión) se reintentan con
+  espera exponencial, respetando ``Retry-After`` si viene en la respuesta.
+- La respuesta en bruto de cada ISBN se guarda en disco (``<cache_dir>/<isbn>.json``),
+  así que al repetir o reanudar una importación no se vuelve a pedir nada.
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_URL = 'https://www.googleapis.com/books/v1/volumes'
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Espacia las llamadas a ``wait()`` para no superar ``rate`` por segundo entre todos los hilos"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate and rate > 0 else 0
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class GoogleBooksError(Exception):
+    """La API no ha respondido correctamente tras agotar los reintentos"""
+
+
+class GoogleBooksClient:
+
+    def __init__(self, api_url=DEFAULT_API_URL, cache_dir=None, workers=8, rate_limit=10,
+                 max_retries=5, backoff=1.0, timeout=10):
+        self.api_url = api_url
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate_limit)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def cache_path(self, isbn):
+        return self.cache_dir / f'{isbn}.json'
+
+    def read_cache(self, isbn):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.cache_path(isbn), encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_cache(self, isbn, data):
+        if not self.cache_dir:
+            return
+        # Escritura atómica: un proceso interrumpido no deja ficheros a medias
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(data, tmp_file)
+        os.replace(tmp_path, self.cache_path(isbn))
+
+    def retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        return self.backoff * 2 ** attempt * (1 + random.random() / 2)
+
+    def request(self, isbn):
+        """Respuesta en bruto de la API para un ISBN, con reintentos"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            response = None
+            try:
+                response = self.session.get(self.api_url, params={'q': f'isbn:{isbn}'}, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                error = GoogleBooksError(f'HTTP {response.status_code}')
+            except requests.exceptions.HTTPError as exc:
+                raise GoogleBooksError(str(exc)) from exc
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+                error = GoogleBooksError(str(exc))
+            except ValueError as exc:
+                raise GoogleBooksError(f'Respuesta no válida: {exc}') from exc
+            if attempt < self.max_retries:
+                time.sleep(self.retry_delay(attempt, response))
+        raise error
+
+    def fetch(self, isbn):
+        """
+        ``volumeInfo`` del primer resultado para el ISBN, o None si Google Books no lo
+        conoce. Lanza GoogleBooksError si la API falla tras los reintentos.
+        """
+        data = self.read_cache(isbn)
+        if data is None:
+            data = self.request(isbn)
+            self.write_cache(isbn, data)
+        items = data.get('items') or []
+        return items[0].get('volumeInfo') if items else None
+
+    def fetch_many(self, isbns):
+        """
+        Genera ``(isbn, volume_info, error)`` en el mismo orden que ``isbns``
+        descargando en paralelo
+        """
+        def fetch(isbn):
+            try:
+                return isbn, self.fetch(isbn), None
+            except GoogleBooksError as exc:
+                return isbn, None, exc
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(fetch, isbns)
@@ -0,0 +1,365 @@
+"""
+Ingesta masiva de libros (populate_db, import_openlibrary).
+
+Las filas se acumulan en bloques y cada bloque se escribe con unas pocas
+sentencias: ``bulk_create`` de editoriales, autores, géneros, libros y filas
+de ``Book.authors.through`` y ``Book.genres.through``. Los ISBN, editoriales,
+autores y géneros ya existentes se cargan una vez en diccionarios en memoria,
+así que no hay consultas por fila.
+
+``bulk_create`` no envía señales: al escribir cada bloque se indexan los
+libros nuevos para la búsqueda (con los datos que ya están en memoria) y se
+invalidan el autocompletado y la caché de respuestas. Las validaciones de los
+modelos que importan aquí (longitudes, rango de páginas, fechas no futuras) se
+aplican al normalizar cada fila.
+
+Con varios procesos (``parse_csv_parallel``) el CSV se reparte en tramos de
+bytes que se leen y normalizan en un pool; el proceso principal recibe los
+tramos en orden y es el único que escribe y asigna ids, así que no hay
+carreras por el nombre de la editorial ni por el ISBN.
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import autocomplete, response_cache
+from .models import Author, Book, Genre, Publisher
+from .search import index_documents
+
+
+def clip(value, model, field):
+    """Recorta un texto a la longitud máxima del campo"""
+    value = (value or '').strip()
+    max_length = model._meta.get_field(field).max_length
+    return value[:max_length] if max_length else value
+
+
+def text(value):
+    """Texto de una celda del CSV (pandas usa NaN para las vacías)"""
+    if value is None or value != value:
+        return ''
+    return str(value)
+
+
+def clean_isbn(value):
+    """ISBN sin guiones ni espacios y con la X de control en mayúscula"""
+    return ''.join(char for char in text(value) if char not in '- ').upper()
+
+
+def parse_date(value):
+    """Fecha de publicación a partir de 'YYYY-MM-DD', 'YYYY-MM' o 'YYYY' (None si no es válida)"""
+    value = str(value or '').strip()
+    if len(value) == 4:
+        value = f'{value}-01-01'
+    elif len(value) == 7:
+        value = f'{value}-01'
+    try:
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def csv_book(row, book_info=None):
+    """
+    Datos de un libro a partir de una fila de BX_Books (``dict`` por columna) y,
+    si lo hay, del ``volumeInfo`` de Google Books, que tiene prioridad
+    """
+    book_info = book_info or {}
+    authors = book_info.get('authors') or [row.get('Book-Author')]
+    return {
+        'isbn': row.get('ISBN'),
+        'title': book_info.get('title') or text(row.get('Book-Title')),
+        'publisher': book_info.get('publisher') or text(row.get('Publisher')),
+        'authors': [text(name) for name in authors],
+        'synopsis': book_info.get('description', ''),
+        'publication_date': book_info.get('publishedDate') or text(row.get('Year-Of-Publication')),
+        'pages': book_info.get('pageCount'),
+        'cover_image_url': book_info.get('imageLinks', {}).get('thumbnail', ''),
+    }
+
+
+def normalize_book(isbn, title, publisher, authors, synopsis='', publication_date=None, pages=None, cover_image_url='',
+                   genres=()):
+    """
+    Limpia y valida los datos de un libro con las reglas de los modelos que
+    importan aquí (longitudes, rango de páginas, fechas no futuras). Devuelve un
+    ``dict`` con tipos simples (se puede enviar entre procesos) o None si falta
+    algún dato obligatorio. ``publication_date`` puede ser una fecha o un texto.
+    """
+    isbn = clip(clean_isbn(isbn), Book, 'isbn')
+    title = clip(title, Book, 'title')
+    publisher = clip(publisher, Publisher, 'name')
+    authors = list(dict.fromkeys(clip(name, Author, 'name') for name in authors if name and name.strip()))
+    genres = list(dict.fromkeys(clip(name, Genre, 'name') for name in genres if name and name.strip()))
+    if not isbn or not title or not publisher or not authors:
+        return None
+
+    if isinstance(publication_date, str):
+        publication_date = parse_date(publication_date)
+    if publication_date and publication_date > timezone.now().date():
+        publication_date = None
+    if not isinstance(pages, int) or not 1 <= pages <= 10000:
+        pages = None
+    if len(cover_image_url or '') > Book._meta.get_field('cover_image_url').max_length:
+        cover_image_url = ''
+
+    return {
+        'isbn': isbn, 'title': title, 'publisher': publisher, 'authors': authors, 'synopsis': synopsis or '',
+        'publication_date': publication_date, 'pages': pages, 'cover_image_url': cover_image_url or '',
+        'genres': genres,
+    }
+
+
+PARTITION_SIZE = 4 * 1024 * 1024  # Bytes del CSV por tarea en modo multiproceso
+CSV_ENCODING = 'latin-1'
+CSV_DELIMITER = ';'
+
+
+def csv_header(path):
+    """Columnas del CSV y posición (en bytes) de la primera fila de datos"""
+    with open(path, 'rb') as csv_file:
+        line = csv_file.readline().decode(CSV_ENCODING)
+        return next(csv.reader([line], delimiter=CSV_DELIMITER)), csv_file.tell()
+
+
+def csv_partitions(path, offset, size=None):
+    """Tramos ``(inicio, fin)`` de unos ``size`` bytes desde ``offset``, cortados en finales de línea"""
+    size = size or PARTITION_SIZE
+    file_size = os.path.getsize(path)
+    partitions = []
+    with open(path, 'rb') as csv_file:
+        while offset < file_size:
+            csv_file.seek(min(offset + size, file_size))
+            csv_file.readline()
+            partitions.append((offset, csv_file.tell()))
+            offset = csv_file.tell()
+    return partitions
+
+
+def read_csv_partition(path, start, end, columns):
+    """
+    Lee y normaliza las filas de un tramo del CSV (se ejecuta en los procesos
+    del pool). Como ``on_bad_lines='skip'`` de pandas, descarta las líneas con
+    más columnas de la cuenta; las filas incompletas quedan como None para que
+    el número de fila siga siendo el mismo. Los campos entre comillas no pueden
+    contener saltos de línea (BX_Books no los tiene).
+    """
+    with open(path, 'rb') as csv_file:
+        csv_file.seek(start)
+        data = csv_file.read(end - start).decode(CSV_ENCODING)
+    records = []
+    for values in csv.reader(io.StringIO(data), delimiter=CSV_DELIMITER):
+        if not values or len(values) > len(columns):
+            continue
+        records.append(normalize_book(**csv_book(dict(zip(columns, values)))))
+    return records
+
+
+def parse_csv_parallel(path, offset, workers):
+    """
+    Genera ``((inicio, fin), registros)`` para cada tramo del CSV desde ``offset``,
+    en orden, leyendo en paralelo con ``workers`` procesos. Como mucho hay dos
+    tramos por proceso en vuelo, así que la memoria no depende del tamaño del
+    fichero aunque la escritura vaya más lenta que la lectura.
+    """
+    columns, data_start = csv_header(path)
+    partitions = iter(csv_partitions(path, max(offset, data_start)))
+    # spawn: los procesos no heredan las conexiones a la base de datos del principal.
+    # Heredan DJANGO_SETTINGS_MODULE y se inicializan antes de recibir la primera tarea
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, initializer=django.setup) as pool:
+        in_flight = deque()
+
+        def submit():
+            partition = next(partitions, None)
+            if partition:
+                in_flight.append((partition, pool.apply_async(read_csv_partition, (path, *partition, columns))))
+
+        for _ in range(workers * 2):
+            submit()
+        while in_flight:
+            partition, result = in_flight.popleft()
+            submit()
+            yield partition, result.get()
+
+
+class BookIngestor:
+    """
+    Acumula libros con ``add()`` y los escribe en bloques de ``chunk_size``.
+    Llamar a ``flush()`` al terminar para escribir el último bloque.
+    ``on_flush`` se llama tras confirmar cada bloque (p. ej. para guardar el punto de control).
+
+    Es el único que asigna ids a editoriales, autores y libros: con varios
+    procesos (``read_csv_partition``) los trabajadores solo normalizan las filas
+    y el proceso principal las pasa por ``add_record()``.
+    """
+
+    def __init__(self, chunk_size=5000, stdout=None, on_flush=None):
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.on_flush = on_flush
+        self.pending = []
+        self.isbns = set(Book.objects.values_list('isbn', flat=True))
+        self.publishers = dict(Publisher.objects.values_list('name', 'pk'))
+        self.authors = {}
+        for name, pk in Author.objects.order_by('-pk').values_list('name', 'pk'):
+            self.authors[name] = pk  # Con nombres repetidos se queda el más antiguo
+        self.genres = dict(Genre.objects.values_list('name', 'pk'))
+        self.rows = self.created = self.skipped = 0
+        self.started = time.perf_counter()
+
+    def add(self, **book):
+        """Añade un libro al bloque actual. Devuelve False si se descarta (duplicado o incompleto)"""
+        return self.add_record(normalize_book(**book))
+
+    def add_record(self, record):
+        """Como ``add()``, con un libro ya normalizado por ``normalize_book()`` (o None)"""
+        self.rows += 1
+        if record is None or record['isbn'] in self.isbns:
+            self.skipped += 1
+            return False
+
+        self.isbns.add(record['isbn'])
+        self.pending.append(record)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+
+        with transaction.atomic():
+            new_publishers = {item['publisher'] for item in pending} - self.publishers.keys()
+            if new_publishers:
+                # ignore_conflicts: otro proceso puede haber creado la misma editorial
+                Publisher.objects.bulk_create([Publisher(name=name) for name in new_publishers], ignore_conflicts=True)
+                self.publishers.update(Publisher.objects.filter(name__in=new_publishers).values_list('name', 'pk'))
+
+            new_genres = {name for item in pending for name in item['genres']} - self.genres.keys()
+            if new_genres:
+                Genre.objects.bulk_create([Genre(name=name) for name in new_genres], ignore_conflicts=True)
+                self.genres.update(Genre.objects.filter(name__in=new_genres).values_list('name', 'pk'))
+
+            new_authors = list(dict.fromkeys(
+                name for item in pending for name in item['authors'] if name not in self.authors
+            ))
+            if new_authors:
+                created = Author.objects.bulk_create([Author(name=name) for name in new_authors])
+                self.authors.update((author.name, author.pk) for author in created)
+
+            books = [
+                Book(
+                    isbn=item['isbn'], title=item['title'], synopsis=item['synopsis'],
+                    publication_date=item['publication_date'], pages=item['pages'],
+                    cover_image_url=item['cover_image_url'], publisher_id=self.publishers[item['publisher']],
+                )
+                for item in pending
+            ]
+            Book.objects.bulk_create(books, ignore_conflicts=True)
+            book_ids = dict(Book.objects.filter(isbn__in=[book.isbn for book in books]).values_list('isbn', 'pk'))
+
+            Book.authors.through.objects.bulk_create(
+                [
+                    Book.authors.through(book_id=book_ids[item['isbn']], author_id=self.authors[name])
+                    for item in pending
+                    for name in item['authors']
+                ],
+                ignore_conflicts=True,
+            )
+            Book.genres.through.objects.bulk_create(
+                [
+                    Book.genres.through(book_id=book_ids[item['isbn']], genre_id=self.genres[name])
+                    for item in pending
+                    for name in item['genres']
+                ],
+                ignore_conflicts=True,
+            )
+            index_documents({
+                book_ids[item['isbn']]: {
+                    'title': item['title'],
+                    'authors': ' '.join(item['authors']),
+                    'publisher': item['publisher'],
+                    'genres': ' '.join(item['genres']),
+                    'synopsis': item['synopsis'],
+                }
+                for item in pending
+            })
+
+        autocomplete.invalidate()
+        response_cache.invalidate_table('book')
+        response_cache.invalidate_table('author')
+        response_cache.invalidate_table('publisher')
+        response_cache.invalidate_table('genre')
+
+        self.created += len(pending)
+        if self.on_flush:
+            self.on_flush()
+        if self.stdout:
+            self.stdout.write(
+                f'  -> {self.rows} filas procesadas, {self.created} libros creados ({self.rows_per_second():.0f} filas/s)'
+            )
+
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0
+
+
+class Checkpoint:
+    """
+    Fichero con la siguiente fila del CSV por importar. Se escribe después de
+    confirmar cada bloque, así que una importación interrumpida se reanuda
+    justo después de la última fila guardada. Guarda también las filas
+    anteriores que fallaron en la API, para reintentarlas al reanudar
+    """
+
+    def __init__(self, path, csv_path):
+        self.path = Path(path)
+        self.csv_path = os.path.abspath(csv_path)
+
+    def read(self):
+        try:
+            with open(self.path, encoding='utf-8') as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return data if data.get('csv') == self.csv_path else {}
+
+    def load(self):
+        """Fila guardada, o None si no hay punto de control para este CSV"""
+        return self.read().get('next_row')
+
+    def load_partition(self):
+        """
+        ``(byte, fila)`` del comienzo del tramo que contiene la fila guardada (modo
+        multiproceso), o None si el punto de control no lo incluye
+        """
+        partition = self.read().get('partition')
+        return tuple(partition) if partition else None
+
+    def load_failed_rows(self):
+        """Filas anteriores a la guardada cuya petición a la API falló"""
+        return set(self.read().get('failed_rows', []))
+
+    def save(self, next_row, partition=None, failed_rows=()):
+        # Escritura atómica: una interrupción no deja el fichero a medias
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        data = {'csv': self.csv_path, 'next_row': next_row, 'partition': partition, 'failed_rows': sorted(failed_rows)}
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            json.dump(data, tmp_file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run a performance benchmark on a synthetic catalogue (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS), help='Escenario a ejecutar')
+        parser.add_argument('--books', type=int, default=1_000_000, help='Tamaño del catálogo sintético')
+        parser.add_argument('--queries', type=int, default=200, help='Número de peticiones medidas')
+
+    def handle(self, *args, **options):
+        scenario = options['scenario']
+        self.stdout.write(self.style.SUCCESS(f'--- Benchmark "{scenario}" ({options["books"]} libros) ---'))
+
+        # Todo se ejecuta en una transacción que se revierte al final
+        with transaction.atomic():
+            SCENARIOS[scenario](self, options)
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('--- Benchmark finalizado (datos sintéticos descartados) ---'))
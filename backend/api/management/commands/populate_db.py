@@ -1,133 +1,155 @@
-import requests
+import os
 import pandas as pd
-import time
-from django.core.management.base import BaseCommand
-from django.core.exceptions import ValidationError
-from django.db import transaction
-from api.models import Author, Publisher, Book
-from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from api.google_books import DEFAULT_API_URL, GoogleBooksClient
+from api.ingest import BookIngestor, Checkpoint, csv_book, parse_csv_parallel
 
 # --- CONFIGURACIÓN ---
 CSV_PATH = 'datasets/BX_Books.csv'  # Ruta a tu archivo CSV dentro del proyecto
-START_ROW = 0  # Fila desde la que empezar (0 es el inicio)
-END_ROW = 500  # Fila en la que parar (¡empieza con un número pequeño como 500 para probar!)
+CACHE_DIR = 'datasets/google_books_cache'  # Respuestas de Google Books ya descargadas (una por ISBN)
 
 
 class Command(BaseCommand):
     help = 'Populate the database with books from a CSV file using Google Books API for enrichment'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=CSV_PATH, help='Ruta al CSV de libros')
+        parser.add_argument('--start', type=int, help='Fila desde la que empezar (por defecto, la del punto de control o 0)')
+        parser.add_argument('--end', type=int, help='Fila en la que parar, sin incluirla (por defecto, hasta el final)')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Filas del CSV leídas en cada bloque')
+        parser.add_argument('--checkpoint', help='Fichero del punto de control (por defecto, <csv>.checkpoint)')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos que leen y normalizan el CSV (requiere --offline)')
+        parser.add_argument('--api-workers', type=int, default=8, help='Peticiones simultáneas a Google Books')
+        parser.add_argument('--rate-limit', type=float, default=10, help='Máximo de peticiones por segundo (0 = sin límite)')
+        parser.add_argument('--max-retries', type=int, default=5, help='Reintentos con espera exponencial por ISBN')
+        parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directorio de la caché de respuestas de la API')
+        parser.add_argument('--api-url', default=DEFAULT_API_URL, help='URL de la API de Google Books')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por bloque de inserciones')
+        parser.add_argument('--offline', action='store_true', help='No llamar a la API: importar solo los datos del CSV')
+
+    def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('--- Iniciando el script de población de la base de datos ---'))
-
-        # Leemos el CSV con pandas
-        try:
-            df = pd.read_csv(
-                CSV_PATH,
-                sep=';',
-                encoding='latin-1',  # Esta codificación suele funcionar bien con este dataset
-                on_bad_lines='skip',
-                low_memory=False
-            )
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f'Error: No se encontró el archivo CSV en la ruta: {CSV_PATH}'))
+        csv_path = options['csv']
+        self.verbosity = options['verbosity']
+        self.offline = options['offline']
+        self.client = GoogleBooksClient(
+            api_url=options['api_url'],
+            cache_dir=options['cache_dir'],
+            workers=options['api_workers'],
+            rate_limit=options['rate_limit'],
+            max_retries=options['max_retries'],
+        )
+
+        if options['workers'] > 1 and not self.offline:
+            # Con la API el límite son las peticiones por segundo, no la CPU
+            raise CommandError('--workers solo se puede usar con --offline (para la API usa --api-workers)')
+
+        # Sin --start se continúa desde el punto de control de una ejecución anterior
+        checkpoint = Checkpoint(options['checkpoint'] or f'{csv_path}.checkpoint', csv_path)
+        start = options['start']
+        # Filas que fallaron en la API en ejecuciones anteriores: se conservan en el punto
+        # de control y, al reanudar, se reintentan antes de seguir
+        self.failed_rows = checkpoint.load_failed_rows()
+        self.retry_rows = []
+        if start is None:
+            start = checkpoint.load() or 0
+            self.retry_rows = sorted(row for row in self.failed_rows if row < start)
+            if start:
+                self.stdout.write(f'  -> Reanudando desde la fila {start} (punto de control: {checkpoint.path})')
+            if self.retry_rows:
+                self.stdout.write(f'  -> Reintentando {len(self.retry_rows)} filas con errores de la API')
+        end = options['end']
+
+        if not os.path.exists(csv_path):
+            self.stdout.write(self.style.ERROR(f'Error: No se encontró el archivo CSV en la ruta: {csv_path}'))
             return
 
-        # Seleccionamos el rango de filas a procesar
-        df_subset = df.iloc[START_ROW:END_ROW]
-
-        # Iteramos sobre cada libro en nuestro subconjunto del CSV
-        for index, row in df_subset.iterrows():
-            isbn = str(row['ISBN']).strip()
+        # El punto de control se guarda cada vez que se confirma un bloque de inserciones
+        self.next_row = start
+        self.partition = None
+        self.ingestor = BookIngestor(
+            chunk_size=options['batch_size'],
+            stdout=self.stdout,
+            on_flush=lambda: checkpoint.save(self.next_row, self.partition, self.failed_rows),
+        )
+
+        if options['workers'] > 1:
+            resume = checkpoint.load_partition() if options['start'] is None else None
+            self.import_parallel(csv_path, start, end, options['workers'], resume)
+        else:
+            self.import_sequential(csv_path, start, end, options['chunk_size'])
+
+        self.ingestor.flush()
+        checkpoint.save(self.next_row, self.partition, self.failed_rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'--- ¡Script finalizado! {self.ingestor.created} libros creados y {self.ingestor.skipped} filas descartadas '
+            f'(duplicadas o incompletas) a {self.ingestor.rows_per_second():.0f} filas/s ---'
+        ))
+
+    def import_sequential(self, csv_path, start, end, chunk_size):
+        # Leemos el CSV con pandas por bloques: la memoria no depende del tamaño del fichero
+        reader = pd.read_csv(
+            csv_path,
+            sep=';',
+            dtype={'ISBN': str, 'Year-Of-Publication': str},  # Sin convertir a número (se perderían los ceros iniciales)
+            encoding='latin-1',  # Esta codificación suele funcionar bien con este dataset
+            on_bad_lines='skip',
+            chunksize=chunk_size,
+        )
+        with reader:
+            for chunk in reader:
+                # El índice de cada bloque continúa el del anterior: es el número de fila
+                if end is not None and chunk.index[0] >= end:
+                    break
+                selected = chunk.index >= start
+                if end is not None:
+                    selected &= chunk.index < end
+                selected |= chunk.index.isin(self.retry_rows)
+                if selected.any():
+                    self.import_chunk(chunk[selected])
+
+    def import_parallel(self, csv_path, start, end, workers, resume):
+        # Los procesos leen y normalizan tramos del CSV; aquí solo se deduplica y se escribe.
+        # El punto de control guarda también el tramo en curso para retomar la lectura en él
+        offset, row = resume or (0, 0)
+        for (partition_start, _), records in parse_csv_parallel(csv_path, offset, workers):
+            self.partition = (partition_start, row)
+            for record in records:
+                if end is not None and row >= end:
+                    return
+                row += 1
+                if row > start:
+                    self.next_row = row
+                    self.ingestor.add_record(record)
+
+    def import_chunk(self, chunk):
+        # --- 1. LLAMADAS A LA API DE GOOGLE BOOKS ---
+        # Se descargan en paralelo (o se leen de la caché) y se devuelven en orden
+        isbns = [str(isbn).strip() for isbn in chunk['ISBN']]
+        fetched = ((isbn, None, None) for isbn in isbns) if self.offline else self.client.fetch_many(isbns)
+
+        # --- 2. ESCRITURA POR BLOQUES ---
+        # Las editoriales, autores y libros nuevos se insertan con bulk_create cada
+        # --batch-size filas, sin consultas por fila
+        rows = zip(chunk.index, chunk.to_dict('records'))  # Mucho más rápido que iterrows()
+        for (index, row), (isbn, book_info, error) in zip(rows, fetched):
+            # Las filas reintentadas son anteriores: no hacen retroceder el punto de control
+            self.next_row = max(self.next_row, index + 1)
             book_title_csv = row['Book-Title']
-            
-            self.stdout.write(f"\nProcesando fila {index}: ISBN {isbn} - Título (CSV): {book_title_csv}")
 
-            # --- 1. LLAMADA A LA API DE GOOGLE BOOKS ---
-            try:
-                response = requests.get(f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}")
-                response.raise_for_status()
-                data = response.json()
+            if self.verbosity > 1:
+                self.stdout.write(f"Procesando fila {index}: ISBN {isbn} - Título (CSV): {book_title_csv}")
 
-                if 'items' not in data or not data['items']:
-                    self.stdout.write(self.style.WARNING(f'  -> No se encontró información en Google Books para el ISBN {isbn}'))
-                    continue
+            if error:
+                self.stdout.write(self.style.ERROR(f'  -> Error en la API para el ISBN {isbn}: {error}'))
+                self.failed_rows.add(index)
+                continue
+            self.failed_rows.discard(index)
 
-                book_info = data['items'][0]['volumeInfo']
-                
-            except requests.exceptions.RequestException as e:
-                self.stdout.write(self.style.ERROR(f'  -> Error en la API para el ISBN {isbn}: {e}'))
-                time.sleep(5) # Esperamos 5 segundos si la API falla
+            if book_info is None and not self.offline:
+                if self.verbosity > 1:
+                    self.stdout.write(self.style.WARNING(f'  -> No se encontró información en Google Books para el ISBN {isbn}'))
                 continue
-            
-            # --- 2. USAMOS UNA TRANSACCIÓN ATÓMICA ---
-            # Esto asegura que si algo falla, no se guarde nada a medias para este libro.
-            try:
-                with transaction.atomic():
-                    # --- 3. OBTENER O CREAR LA EDITORIAL (Publisher) ---
-                    publisher_name = book_info.get('publisher', row['Publisher'])
-                    if not publisher_name or pd.isna(publisher_name):
-                        self.stdout.write(self.style.WARNING(f'  -> Editorial no encontrada. Saltando libro.'))
-                        continue
-
-                    publisher, created = Publisher.objects.get_or_create(name=publisher_name)
-                    if created:
-                        self.stdout.write(f'  -> Editorial creada: "{publisher.name}"')
-
-                    # --- 4. OBTENER O CREAR AUTORES (Authors) ---
-                    author_names = book_info.get('authors', [row['Book-Author']])
-                    if not author_names or pd.isna(author_names[0]):
-                         self.stdout.write(self.style.WARNING(f'  -> Autor no encontrado. Saltando libro.'))
-                         continue
-
-                    book_authors = []
-                    for author_name in author_names:
-                        author, created = Author.objects.get_or_create(name=author_name)
-                        book_authors.append(author)
-                        if created:
-                            self.stdout.write(f'  -> Autor creado: "{author.name}"')
-
-                    # --- 5. CREAR EL LIBRO (Book) ---
-                    # Evitamos duplicados por ISBN
-                    if Book.objects.filter(isbn=isbn).exists():
-                        self.stdout.write(self.style.NOTICE(f'  -> El libro con ISBN {isbn} ya existe en la BD.'))
-                        continue
-
-                    # Limpiamos la fecha de publicación
-                    publication_date_str = book_info.get('publishedDate')
-                    publication_date = None
-                    if publication_date_str:
-                        try:
-                            # La API puede devolver 'YYYY-MM-DD', 'YYYY-MM', or 'YYYY'
-                            if len(publication_date_str) == 4:
-                                publication_date = datetime.strptime(f'{publication_date_str}-01-01', '%Y-%m-%d').date()
-                            elif len(publication_date_str) == 7:
-                                publication_date = datetime.strptime(f'{publication_date_str}-01', '%Y-%m-%d').date()
-                            else:
-                                publication_date = datetime.strptime(publication_date_str, '%Y-%m-%d').date()
-                        except ValueError:
-                            publication_date = None # Si la fecha está mal formateada
-
-                    book = Book.objects.create(
-                        title=book_info.get('title', book_title_csv),
-                        isbn=isbn,
-                        synopsis=book_info.get('description', ''),
-                        publication_date=publication_date,
-                        pages=book_info.get('pageCount'),
-                        cover_image_url=book_info.get('imageLinks', {}).get('thumbnail', ''),
-                        publisher=publisher
-                    )
-
-                    # Asignamos los autores a la relación ManyToMany
-                    book.authors.set(book_authors)
-                    
-                    self.stdout.write(self.style.SUCCESS(f'  -> ¡Libro "{book.title}" guardado con éxito!'))
-
-            except ValidationError as e:
-                self.stdout.write(self.style.ERROR(f'  -> Error de validación de Django para el ISBN {isbn}: {e}'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  -> Error inesperado guardando en BD para el ISBN {isbn}: {e}'))
-
-            # Pausa para no saturar la API
-            time.sleep(0.5)
-
-        self.stdout.write(self.style.SUCCESS('--- ¡Script finalizado! ---'))
\ No newline at end of file
+
+            # Sin API (--offline) solo se usan los datos del CSV
+            self.ingestor.add(**csv_book(row, book_info))
@@ -0,0 +1,41 @@
+import multiprocessing
+import os
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from api.summaries import compute_summaries, write_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the yearly reading summaries of every user from their reading statuses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Usuarios por bloque')
+        parser.add_argument('--workers', type=int, default=1, help='Procesos que calculan los bloques')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Reconstruyendo los resúmenes anuales de lectura ---'))
+        chunk_size = options['chunk_size']
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+
+        # Los procesos solo leen y calculan; aquí se escribe cada bloque en una transacción
+        if options['workers'] > 1 and len(chunks) > 1:
+            # spawn: los procesos no heredan las conexiones a la base de datos del principal
+            os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(options['workers'], initializer=django.setup) as pool:
+                self.write_chunks(chunks, pool.imap(compute_summaries, chunks))
+        else:
+            self.write_chunks(chunks, map(compute_summaries, chunks))
+
+    def write_chunks(self, chunks, results):
+        users = total = 0
+        for chunk, summaries in zip(chunks, results):
+            write_summaries(chunk, summaries)
+            users += len(chunk)
+            total += len(summaries)
+            self.stdout.write(f'  -> {users} usuarios procesados')
+        self.stdout.write(self.style.SUCCESS(f'--- Resúmenes reconstruidos ({total} resúmenes de {users} usuarios) ---'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from api.models import Book
+from api.search import index_books
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search document of every book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Libros reindexados por lote')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+
+        for start in range(0, len(book_ids), batch_size):
+            index_books(book_ids[start:start + batch_size])
+            self.stdout.write(f'  -> {min(start + batch_size, len(book_ids))}/{len(book_ids)} libros indexados')
+
+        self.stdout.write(self.style.SUCCESS(f'--- Índice de búsqueda reconstruido ({len(book_ids)} libros) ---'))
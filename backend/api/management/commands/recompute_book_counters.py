@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.counters import recompute_book_counters
+from api.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized reader, rating and review counters of every book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Libros recalculados por UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Book.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        total = 0
+
+        # Por rangos de id para no bloquear toda la tabla en un único UPDATE
+        for start in range(0, last_id, batch_size):
+            total += recompute_book_counters(Book.objects.filter(pk__gt=start, pk__lte=start + batch_size))
+            self.stdout.write(f'  -> {total} libros recalculados')
+
+        self.stdout.write(self.style.SUCCESS(f'--- Contadores recalculados ({total} libros) ---'))
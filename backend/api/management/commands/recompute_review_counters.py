@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.counters import recompute_review_counters
+from api.models import Review
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized comment counters of every review'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Reseñas recalculadas por UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Review.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        total = 0
+
+        # Por rangos de id para no bloquear toda la tabla en un único UPDATE
+        for start in range(0, last_id, batch_size):
+            total += recompute_review_counters(Review.objects.filter(pk__gt=start, pk__lte=start + batch_size))
+            self.stdout.write(f'  -> {total} reseñas recalculadas')
+
+        self.stdout.write(self.style.SUCCESS(f'--- Contadores recalculados ({total} reseñas) ---'))
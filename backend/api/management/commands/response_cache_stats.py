@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from api.response_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Show the hit/miss counters of the catalogue response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Poner los contadores a cero después de mostrarlos')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(self.style.SUCCESS('--- Caché de respuestas ---'))
+        self.stdout.write(f'  -> Aciertos: {stats["hits"]}')
+        self.stdout.write(f'  -> Fallos: {stats["misses"]}')
+        self.stdout.write(f'  -> Tasa de aciertos: {ratio:.1f}%')
+        if options['reset']:
+            reset_stats()
+            self.stdout.write('  -> Contadores reiniciados')
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:21
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Crea el índice de búsqueda y lo rellena con los libros existentes:
+    índice GIN sobre search_vector en PostgreSQL, tabla FTS5 en SQLite
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        search_config = getattr(settings, 'BOOK_SEARCH_CONFIG', 'simple')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS api_book_search_vector_gin ON api_book USING gin (search_vector)'
+        )
+        schema_editor.execute(
+            """
+            UPDATE api_book b SET search_vector =
+                setweight(to_tsvector(%(config)s::regconfig, coalesce(b.title, '')), 'A')
+                || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+                    SELECT string_agg(a.name, ' ') FROM api_author a
+                    JOIN api_book_authors ba ON ba.author_id = a.id WHERE ba.book_id = b.id
+                ), '')), 'B')
+                || setweight(to_tsvector(%(config)s::regconfig, coalesce(p.name, '') || ' ' || coalesce((
+                    SELECT string_agg(g.name, ' ') FROM api_genre g
+                    JOIN api_book_genres bg ON bg.genre_id = g.id WHERE bg.book_id = b.id
+                ), '')), 'C')
+                || setweight(to_tsvector(%(config)s::regconfig, coalesce(b.synopsis, '')), 'D')
+            FROM api_publisher p WHERE p.id = b.publisher_id
+            """,
+            {'config': search_config},
+        )
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS api_book_fts USING fts5("
+            "title, authors, publisher, genres, synopsis, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            """
+            INSERT INTO api_book_fts (rowid, title, authors, publisher, genres, synopsis)
+            SELECT b.id, b.title,
+                coalesce((SELECT group_concat(a.name, ' ') FROM api_author a
+                    JOIN api_book_authors ba ON ba.author_id = a.id WHERE ba.book_id = b.id), ''),
+                coalesce(p.name, ''),
+                coalesce((SELECT group_concat(g.name, ' ') FROM api_genre g
+                    JOIN api_book_genres bg ON bg.genre_id = g.id WHERE bg.book_id = b.id), ''),
+                coalesce(b.synopsis, '')
+            FROM api_book b LEFT JOIN api_publisher p ON p.id = b.publisher_id
+            """
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS api_book_search_vector_gin')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS api_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_bookshelf_cover_image_bookshelf_visibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Índices GIN de trigramas para el autocompletado (solo PostgreSQL)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS api_book_title_trgm ON api_book USING gin (title gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS api_author_name_trgm ON api_author USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS api_book_title_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS api_author_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_book_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
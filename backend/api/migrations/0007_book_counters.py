@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:43
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_book_counters(apps, schema_editor):
+    """Calcula los contadores de los libros existentes"""
+    Book = apps.get_model('api', 'Book')
+    ReadingStatus = apps.get_model('api', 'ReadingStatus')
+    Review = apps.get_model('api', 'Review')
+
+    statuses = ReadingStatus.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    rated = statuses.filter(rating__isnull=False)
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    decimal_field = models.DecimalField(max_digits=12, decimal_places=1)
+
+    Book.objects.update(
+        reader_count=Coalesce(Subquery(statuses.annotate(total=Count('pk')).values('total')), 0),
+        rating_count=Coalesce(Subquery(rated.annotate(total=Count('pk')).values('total')), 0),
+        rating_sum=Coalesce(
+            Subquery(rated.annotate(total=Sum('rating')).values('total'), output_field=decimal_field),
+            Value(Decimal(0), output_field=decimal_field),
+        ),
+        rating_avg=Subquery(rated.annotate(average=Avg('rating')).values('average'), output_field=FloatField()),
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_avg',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Calificación media', max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Número de calificaciones'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reader_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Usuarios con estado de lectura'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Número de reseñas'),
+        ),
+        migrations.RunPython(backfill_book_counters, migrations.RunPython.noop),
+    ]
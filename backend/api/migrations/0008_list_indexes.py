@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_book_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookshelf',
+            index=models.Index(fields=['user', '-created_at'], name='bookshelf_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookshelfentry',
+            index=models.Index(fields=['bookshelf', 'added_at'], name='shelfentry_shelf_added_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['review', 'created_at'], name='comment_review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readingstatus',
+            index=models.Index(fields=['user', '-started_at'], name='readingstatus_user_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-created_at'], name='review_book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-created_at'], name='review_user_created_idx'),
+        ),
+    ]
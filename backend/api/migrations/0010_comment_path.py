@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+BACKFILL_BATCH_SIZE = 1000
+PATH_DIGITS = 10
+
+
+def backfill_comment_paths(apps, schema_editor):
+    """
+    Calcula la ruta y el nivel de los comentarios existentes por lotes: en cada
+    pasada, los que aún no tienen ruta y cuyo padre ya la tiene (o no tienen padre)
+    """
+    Comment = apps.get_model('api', 'Comment')
+    pending = Comment.objects.filter(
+        Q(parent_comment__isnull=True) | ~Q(parent_comment__path=''), path='',
+    ).order_by('pk')
+
+    while True:
+        batch = [
+            Comment(
+                pk=pk,
+                path=(parent_path or '') + f'{pk:0{PATH_DIGITS}d}',
+                depth=parent_depth + 1 if parent_path else 0,
+            )
+            for pk, parent_path, parent_depth in pending.values_list(
+                'pk', 'parent_comment__path', 'parent_comment__depth'
+            )[:BACKFILL_BATCH_SIZE]
+        ]
+        if not batch:
+            break
+        Comment.objects.bulk_update(batch, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_reading_year_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Nivel de respuesta (0 = principal)'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, help_text='Ids de los ancestros y del propio comentario', max_length=500),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['review', 'path'], name='comment_review_path_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_review_counters(apps, schema_editor):
+    """Calcula los contadores de comentarios de las reseñas existentes"""
+    Review = apps.get_model('api', 'Review')
+    Comment = apps.get_model('api', 'Comment')
+
+    comments = Comment.objects.filter(review=OuterRef('pk')).order_by().values('review')
+    Review.objects.update(
+        comment_count=Coalesce(Subquery(comments.annotate(total=Count('pk')).values('total')), 0),
+        last_comment_at=Subquery(comments.annotate(latest=Max('created_at')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_comment_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Número de comentarios y respuestas'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Fecha del último comentario', null=True),
+        ),
+        migrations.RunPython(backfill_review_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-comment_count'], name='review_book_comments_idx'),
+        ),
+    ]
@@ -1,10 +1,41 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.db import models
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
+from django.contrib.postgres.search import SearchVectorField
+
+# Validación en save(): completa salvo para escrituras de confianza
+_trusted_write = ContextVar('trusted_write', default=False)
+
+
+@contextmanager
+def trusted_write():
+    """
+    Los ``save()`` hechos dentro del bloque no repiten la validación de campos ni
+    las consultas de unicidad y de claves ajenas de ``full_clean()``: solo se
+    ejecuta ``clean()``. Para quien ya ha validado los datos (los serializers de
+    escritura); la unicidad la sigue garantizando la base de datos (IntegrityError)
+    """
+    token = _trusted_write.set(True)
+    try:
+        yield
+    finally:
+        _trusted_write.reset(token)
+
+
+def validate_model(instance):
+    """``full_clean()`` de la instancia, o solo ``clean()`` dentro de ``trusted_write()``"""
+    if _trusted_write.get():
+        instance.clean()
+    else:
+        instance.full_clean()
 
 # Create your models here.
 class Author(models.Model):
@@ -45,7 +76,7 @@ class Author(models.Model):
             })
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate_model(self)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -82,7 +113,7 @@ class Publisher(models.Model):
                 })
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate_model(self)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -113,6 +144,18 @@ class Book(models.Model):
     authors = models.ManyToManyField(Author, related_name='books', blank=True)
     genres = models.ManyToManyField(Genre, related_name='books', blank=True)
 
+    # Documento de búsqueda ponderado (se mantiene desde api.signals, ver api.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Contadores desnormalizados (se mantienen desde api.signals, ver api.counters)
+    reader_count = models.PositiveIntegerField(default=0, editable=False, help_text="Usuarios con estado de lectura")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, help_text="Número de calificaciones")
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0, editable=False)
+    rating_avg = models.DecimalField(
+        max_digits=3, decimal_places=2, null=True, blank=True, editable=False, help_text="Calificación media"
+    )
+    review_count = models.PositiveIntegerField(default=0, editable=False, help_text="Número de reseñas")
+
     class Meta:
         ordering = ['title']
         verbose_name = 'Libro'
@@ -171,6 +214,8 @@ class ReadingStatus(models.Model):
 
     class Meta:
         unique_together = ['user', 'book']
+        # Listado de /api/reading-statuses/: los del usuario, más recientes primero
+        indexes = [models.Index(fields=['user', '-started_at'], name='readingstatus_user_started_idx')]
         verbose_name = 'Estado de Lectura'
         verbose_name_plural = 'Estados de Lectura'
 
@@ -229,13 +274,59 @@ class ReadingStatus(models.Model):
                 'status': 'Un libro en lectura debe tener fecha de inicio.'
             })
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado cargado de la BD, para actualizar los contadores del libro por diferencia
+        if 'book_id' in instance.__dict__ and 'rating' in instance.__dict__:
+            instance._counted_state = (instance.book_id, instance.rating)
+        # Y para el resumen anual (api.summaries)
+        if all(field in instance.__dict__ for field in ('user_id', 'book_id', 'status', 'finished_at', 'rating')):
+            instance._summary_state = instance.summary_state()
+        return instance
+
+    def summary_state(self):
+        """(usuario, año, libro, calificación) con que cuenta en el resumen anual, o None si no está terminado"""
+        if self.status == 'C' and self.finished_at:
+            return (self.user_id, self.finished_at.year, self.book_id, self.rating)
+        return None
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate_model(self)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title} - {self.get_status_display()}"
 
+class ReadingYearSummary(models.Model):
+    """
+    Resumen de un año de lectura de un usuario ("year in books"): libros
+    terminados en el año con sus páginas, géneros, autores y calificaciones.
+    Se mantiene por diferencia desde las señales de ReadingStatus (api.summaries)
+    y se reconstruye con ``rebuild_reading_summaries``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_summaries')
+    year = models.PositiveSmallIntegerField()
+    books = models.PositiveIntegerField(default=0)
+    pages = models.PositiveIntegerField(default=0)
+    # {nombre: libros} y {calificación: libros}
+    genre_counts = models.JSONField(default=dict)
+    author_counts = models.JSONField(default=dict)
+    rating_histogram = models.JSONField(default=dict)
+    longest_book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    longest_pages = models.PositiveIntegerField(null=True, blank=True)
+    shortest_book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    shortest_pages = models.PositiveIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'year']
+        verbose_name = 'Resumen Anual de Lectura'
+        verbose_name_plural = 'Resúmenes Anuales de Lectura'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.year}"
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
@@ -243,8 +334,19 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Contadores desnormalizados, mantenidos desde las señales de Comment (ver api/counters.py)
+    comment_count = models.PositiveIntegerField(default=0, editable=False, help_text="Número de comentarios y respuestas")
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="Fecha del último comentario")
+
     class Meta:
         unique_together = ['user', 'book']
+        # Reseñas de un libro y del usuario, más recientes primero
+        indexes = [
+            models.Index(fields=['book', '-created_at'], name='review_book_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='review_user_created_idx'),
+            # Reseñas más comentadas de un libro
+            models.Index(fields=['book', '-comment_count'], name='review_book_comments_idx'),
+        ]
         verbose_name = 'Reseña'
         verbose_name_plural = 'Reseñas'
     
@@ -266,8 +368,16 @@ class Review(models.Model):
                 'review_text': 'La reseña debe tener al menos 10 caracteres.'
             })
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Libro cargado de la BD, para actualizar review_count si la reseña cambia de libro
+        if 'book_id' in instance.__dict__:
+            instance._counted_book_id = instance.book_id
+        return instance
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate_model(self)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -298,6 +408,7 @@ class Bookshelf(models.Model):
 
     class Meta:
         unique_together = ['user', 'name']
+        indexes = [models.Index(fields=['user', '-created_at'], name='bookshelf_user_created_idx')]
     
     def get_auto_cover_books(self):
         """
@@ -306,17 +417,25 @@ class Bookshelf(models.Model):
         - 2-3 libros: el que más tiempo lleva en la estantería
         - 4+ libros: los 4 más antiguos
         """
-        books = self.entries.select_related('book').order_by('added_at')
-        book_count = books.count()
+        if hasattr(self, 'cover_entries'):
+            # Primeras 4 entradas precargadas con una función de ventana (vista resumen)
+            entries = self.cover_entries
+        elif 'entries' in getattr(self, '_prefetched_objects_cache', {}):
+            # Entradas ya precargadas (BookshelfViewSet): sin consultas adicionales
+            entries = sorted(self.entries.all(), key=lambda entry: (entry.added_at, entry.pk))
+        else:
+            # Para aplicar las reglas basta con saber si hay 0, 1-3 o 4+ libros
+            entries = list(self.entries.select_related('book').order_by('added_at', 'id')[:4])
+        book_count = len(entries)
         
         if book_count == 0:
             return []
         elif book_count == 1:
-            return [books.first().book]
+            return [entries[0].book]
         elif book_count <= 3:
-            return [books.first().book]  # El más antiguo
+            return [entries[0].book]  # El más antiguo
         else:
-            return [entry.book for entry in books[:4]]  # Los 4 más antiguos
+            return [entry.book for entry in entries[:4]]  # Los 4 más antiguos
     
     def get_cover_display(self):
         """
@@ -340,10 +459,26 @@ class BookshelfEntry(models.Model):
 
     class Meta:
         unique_together = ['bookshelf', 'book']
+        # Libros de una estantería por fecha en que se añadieron (?ordering=added_at y portada automática)
+        indexes = [models.Index(fields=['bookshelf', 'added_at'], name='shelfentry_shelf_added_idx')]
 
     def __str__(self):
         return f"{self.book.title} in {self.bookshelf.name}"
 
+# Ruta materializada de los comentarios: el id de cada ancestro y el del propio
+# comentario con PATH_DIGITS cifras, p. ej. "0000000012" + "0000000045"
+PATH_DIGITS = 10
+MAX_COMMENT_DEPTH = 50
+
+
+def subtree_range(path):
+    """
+    Filtro de un comentario y sus descendientes: las rutas en [ruta, ruta + 1).
+    Es un rango (no LIKE), así que usa el índice (review, path) con cualquier collation
+    """
+    return {'path__gte': path, 'path__lt': str(int(path) + 1).zfill(len(path))}
+
+
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name="comments")
@@ -352,11 +487,29 @@ class Comment(models.Model):
 
     # Para respuestas a comentarios
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, related_name="replies", null=True, blank=True)
+    # Se calculan al guardar: ordenar por path recorre el hilo en profundidad
+    path = models.CharField(max_length=PATH_DIGITS * MAX_COMMENT_DEPTH, blank=True, editable=False,
+                            help_text="Ids de los ancestros y del propio comentario")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, help_text="Nivel de respuesta (0 = principal)")
 
     class Meta:
+        indexes = [
+            # Comentarios de una reseña en orden de conversación
+            models.Index(fields=['review', 'created_at'], name='comment_review_created_idx'),
+            # Subárboles y orden en profundidad con un rango sobre la ruta
+            models.Index(fields=['review', 'path'], name='comment_review_path_idx'),
+        ]
         verbose_name = 'Comentario'
         verbose_name_plural = 'Comentarios'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Padre cargado de la BD, para mover la ruta del subárbol si cambia
+        if 'parent_comment_id' in instance.__dict__:
+            instance._loaded_parent_id = instance.parent_comment_id
+        return instance
+
     def clean(self):
         """
         Validaciones de negocio para el modelo Comment
@@ -381,22 +534,110 @@ class Comment(models.Model):
                 'parent_comment': 'Un comentario no puede ser su propio padre.'
             })
 
+        # Ni responda a una de sus respuestas (se formaría un ciclo)
+        if self.parent_comment and self.path and self.parent_comment.path.startswith(self.path):
+            raise ValidationError({
+                'parent_comment': 'Un comentario no puede responder a una de sus respuestas.'
+            })
+
+        if self.parent_comment and self.parent_comment.depth + 1 + self.subtree_height() >= MAX_COMMENT_DEPTH:
+            raise ValidationError({
+                'parent_comment': f'Los hilos admiten como máximo {MAX_COMMENT_DEPTH} niveles de respuesta.'
+            })
+
+    def subtree_height(self):
+        """
+        Niveles de respuestas por debajo del comentario si cambia de padre (se
+        mueven con él), con un agregado sobre el rango de su ruta; 0 si no se mueve
+        """
+        if not self.path or self.parent_comment_id == getattr(self, '_loaded_parent_id', self.parent_comment_id):
+            return 0
+        max_depth = Comment.objects.filter(review_id=self.review_id, **subtree_range(self.path)).aggregate(
+            max_depth=models.Max('depth')
+        )['max_depth']
+        return max_depth - self.depth if max_depth is not None else 0
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate_model(self)
+        moved = self.path and self.parent_comment_id != getattr(self, '_loaded_parent_id', self.parent_comment_id)
         super().save(*args, **kwargs)
+        if not self.path or moved:
+            self.update_path()
+        self._loaded_parent_id = self.parent_comment_id
+
+    def update_path(self):
+        """
+        Calcula la ruta con el id ya asignado y la guarda. Si el comentario ha
+        cambiado de padre, mueve también la de sus descendientes con un UPDATE
+        """
+        old_path, old_depth = self.path, self.depth
+        parent = self.parent_comment
+        self.path = (parent.path if parent else '') + f'{self.pk:0{PATH_DIGITS}d}'
+        self.depth = parent.depth + 1 if parent else 0
+        if not old_path:
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            return
+        Comment.objects.filter(review_id=self.review_id, **subtree_range(old_path)).update(
+            path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1)),
+            depth=models.F('depth') + (self.depth - old_depth),
+        )
+
+    def descendants(self):
+        """Respuestas a cualquier nivel, en orden de hilo (un rango sobre el índice)"""
+        return Comment.objects.filter(review_id=self.review_id, **subtree_range(self.path)).exclude(pk=self.pk).order_by('path')
 
     def __str__(self):
         return f"Comment ID: {self.id}"
 
 
-# Señal para validar que un libro tenga al menos un autor
+# Validación de que un libro tenga al menos un autor
+_bulk_operation = ContextVar('bulk_operation', default=False)
+
+
+@contextmanager
+def bulk_operation():
+    """
+    Desactiva la validación por señal de los autores mientras dura el bloque.
+    Quien lo usa valida el resultado una sola vez (``validate_books_have_authors``
+    o, en los serializers, con los datos de la petición)
+    """
+    token = _bulk_operation.set(True)
+    try:
+        yield
+    finally:
+        _bulk_operation.reset(token)
+
+
+def validate_books_have_authors(book_ids):
+    """Comprueba con una sola consulta que ninguno de los libros se ha quedado sin autores"""
+    book_ids = [pk for pk in book_ids if pk is not None]
+    if book_ids and Book.objects.filter(pk__in=book_ids, authors__isnull=True).exists():
+        raise ValidationError({
+            'authors': 'El libro debe tener al menos un autor.'
+        })
+
+
 @receiver(m2m_changed, sender=Book.authors.through)
-def validate_book_authors(sender, instance, action, **kwargs):
+def validate_book_authors(sender, instance, action, reverse, pk_set, **kwargs):
     """
-    Valida que un libro tenga al menos un autor después de cambios en la relación ManyToMany
+    Valida que un libro tenga al menos un autor después de cambios en la relación
+    ManyToMany hechos fuera de ``bulk_operation()``. Añadir autores nunca deja un
+    libro sin ellos, así que solo se comprueba al quitarlos.
+
+    ``authors.set()`` quita los autores anteriores antes de añadir los nuevos, así
+    que sustituir el único autor de un libro con set() falla aquí: el serializer y
+    el admin validan los datos y guardan dentro de ``bulk_operation()``; desde el
+    ORM hay que hacer lo mismo (y validar con ``validate_books_have_authors``) o
+    añadir antes de quitar.
     """
-    if action in ['post_add', 'post_remove', 'post_clear'] and instance.pk:
-        if not instance.authors.exists():
-            raise ValidationError({
-                'authors': 'El libro debe tener al menos un autor.'
-            })
+    if action not in ('post_remove', 'post_clear') or _bulk_operation.get():
+        return
+    if reverse:
+        # author.books.remove(...) / author.books.clear(): los ids de los libros
+        # afectados (en clear los guarda api.signals en pre_clear)
+        book_ids = pk_set if action == 'post_remove' else getattr(instance, '_related_book_ids', [])
+        validate_books_have_authors(book_ids)
+    elif instance.pk and (action == 'post_clear' or not instance.authors.exists()):
+        raise ValidationError({
+            'authors': 'El libro debe tener al menos un autor.'
+        })
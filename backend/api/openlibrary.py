@@ -0,0 +1,126 @@
+"""
+Lectura de los volcados de Open Library (import_openlibrary).
+
+Los volcados oficiales (``ol_dump_authors``, ``ol_dump_works``,
+``ol_dump_editions``) son ficheros comprimidos con gzip con un registro por
+línea: columnas separadas por tabuladores cuya última columna es el JSON del
+registro. También se aceptan ficheros JSONL (solo el JSON) y sin comprimir.
+
+Se leen línea a línea. De los autores se guarda solo ``clave -> nombre`` y de
+las obras sus autores, materias y una descripción recortada, que es lo que
+necesitan las ediciones para convertirse en libros.
+"""
+import gzip
+import json
+import re
+from datetime import datetime
+
+COVER_URL = 'https://covers.openlibrary.org/b/id/{}-L.jpg'
+MAX_SUBJECTS = 5  # Materias de cada obra que se importan como géneros
+MAX_DESCRIPTION = 2000  # Caracteres de la descripción de cada obra que se guardan en memoria
+DATE_FORMATS = ('%Y', '%Y-%m-%d', '%Y-%m', '%B %d, %Y', '%b %d, %Y', '%d %B %Y', '%B %Y', '%b %Y')
+YEAR_RE = re.compile(r'(?<!\d)(1\d{3}|20\d{2})(?!\d)')
+
+
+def open_dump(path):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def iter_dump(path):
+    """Genera los registros (``dict``) de un volcado, saltando las líneas que no son JSON válido"""
+    with open_dump(path) as dump:
+        for line in dump:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith('{'):
+                line = line.rsplit('\t', 1)[-1]
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def text_value(value):
+    """Las descripciones vienen como texto o como ``{"type": "/type/text", "value": ...}``"""
+    if isinstance(value, dict):
+        value = value.get('value')
+    return value if isinstance(value, str) else ''
+
+
+def reference_key(reference):
+    """Clave de una referencia: ``{"key": ...}``, ``{"author": {"key": ...}}`` o el texto de la clave"""
+    if isinstance(reference, dict):
+        reference = reference.get('author', reference)
+        if isinstance(reference, dict):
+            reference = reference.get('key')
+    return reference if isinstance(reference, str) else None
+
+
+def parse_publish_date(value):
+    """Las fechas de Open Library son texto libre ('1999', 'March 5, 1999'...): si no, se usa el año"""
+    value = (value or '').strip().rstrip('.')
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    match = YEAR_RE.search(value)
+    return datetime(int(match.group(1)), 1, 1).date() if match else None
+
+
+def load_authors(path):
+    """``{clave: nombre}`` de los autores"""
+    return {
+        record['key']: record['name']
+        for record in iter_dump(path)
+        if isinstance(record.get('key'), str) and isinstance(record.get('name'), str)
+    }
+
+
+def load_works(path):
+    """``{clave: (claves de autores, materias, descripción)}`` de las obras"""
+    works = {}
+    for record in iter_dump(path):
+        if not isinstance(record.get('key'), str):
+            continue
+        author_keys = tuple(filter(None, (reference_key(author) for author in record.get('authors') or [])))
+        subjects = tuple(subject for subject in record.get('subjects') or [] if isinstance(subject, str))
+        description = text_value(record.get('description'))[:MAX_DESCRIPTION]
+        works[record['key']] = (author_keys, subjects[:MAX_SUBJECTS], description)
+    return works
+
+
+def edition_book(edition, authors, works):
+    """
+    Datos de un libro (argumentos de ``BookIngestor.add``) a partir de una
+    edición, o None si no tiene ISBN. Los autores, materias y descripción que
+    falten en la edición se toman de su obra.
+    """
+    isbns = (edition.get('isbn_13') or []) + (edition.get('isbn_10') or [])
+    if not isbns or not isinstance(isbns[0], str):
+        return None
+
+    work_key = next(filter(None, (reference_key(work) for work in edition.get('works') or [])), None)
+    work_authors, work_subjects, work_description = works.get(work_key, ((), (), ''))
+    author_keys = [reference_key(author) for author in edition.get('authors') or []] or work_authors
+    subjects = [subject for subject in edition.get('subjects') or [] if isinstance(subject, str)]
+    publishers = [name for name in edition.get('publishers') or [] if isinstance(name, str)]
+    covers = [cover for cover in edition.get('covers') or [] if isinstance(cover, int) and cover > 0]
+    publish_date = edition.get('publish_date')
+
+    return {
+        'isbn': isbns[0],
+        'title': edition.get('title') if isinstance(edition.get('title'), str) else '',
+        'publisher': publishers[0] if publishers else '',
+        'authors': [authors[key] for key in author_keys if key in authors],
+        'synopsis': text_value(edition.get('description')) or work_description,
+        'publication_date': parse_publish_date(publish_date if isinstance(publish_date, str) else ''),
+        'pages': edition.get('number_of_pages'),
+        'cover_image_url': COVER_URL.format(covers[0]) if covers else '',
+        'genres': subjects[:MAX_SUBJECTS] or list(work_subjects),
+    }
@@ -0,0 +1,284 @@
+"""
+Paginación de la API.
+
+Por defecto se pagina por número de página (``?page=N``), que es lo que usa
+el frontend. Cualquier listado puede paginarse por clave (keyset) con
+``?pagination=keyset`` o poniendo ``pagination_mode = 'keyset'`` en la vista:
+las páginas se recorren con un cursor sobre los campos de ordenación más
+``id`` como desempate, sin OFFSET y sin COUNT(*) salvo que se pida con
+``?count=true``. Las respuestas mantienen ``next``/``previous`` como URLs.
+Los resultados de una búsqueda ordenados por relevancia se paginan siempre
+por número de página.
+"""
+import base64
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def encode_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def is_nullable(model, path):
+    """Indica si un campo de ordenación (p. ej. ``book__title``) puede valer NULL"""
+    for name in path.split('__'):
+        try:
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return True  # Anotaciones: no sabemos, asumimos que sí
+        if field.null:
+            return True
+        model = field.related_model
+    return False
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def queryset_ordering(queryset):
+        """Orden de la consulta ya filtrada (el de OrderingFilter y la búsqueda) o el del modelo"""
+        return list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+
+    @classmethod
+    def supports(cls, queryset):
+        """
+        Indica si la consulta se puede recorrer por clave: el orden debe ser de
+        campos con nombre y no por relevancia (``search_rank`` de api.search),
+        que es un valor calculado (con SQLite, un select extra que no se puede filtrar)
+        """
+        return all(
+            isinstance(field, str) and field.lstrip('-') != 'search_rank'
+            and field.lstrip('-') not in queryset.query.extra_select
+            for field in cls.queryset_ordering(queryset)
+        )
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Campos de ordenación de la consulta terminados en pk como desempate. Si ya
+        ordena por id se respeta su dirección y lo que le sigue sobra
+        """
+        ordering = []
+        for field in self.queryset_ordering(queryset):
+            if field.lstrip('-') in ('id', 'pk'):
+                return ordering + ['-pk' if field.startswith('-') else 'pk']
+            ordering.append(field)
+        return ordering + ['pk']
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            return list(data['v']), bool(data.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound('Cursor inválido')
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'v': position, 'r': reverse}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(data.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = obj
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr, None) if value is not None else None
+            position.append(encode_value(value))
+        return position
+
+    def order_by(self, reverse):
+        """
+        Orden SQL con los NULL siempre al final (o al principio si se recorre hacia atrás).
+        Los campos NOT NULL se ordenan sin NULLS FIRST/LAST para que puedan usar índices.
+        """
+        expressions = []
+        for field in self.ordering:
+            descending = field.startswith('-') != reverse
+            expression = F(field.lstrip('-'))
+            if field not in self.nullable:
+                expressions.append(expression.desc() if descending else expression.asc())
+            elif reverse:
+                expressions.append(expression.desc(nulls_first=True) if descending else expression.asc(nulls_first=True))
+            else:
+                expressions.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_last=True))
+        return expressions
+
+    def seek(self, position, reverse):
+        """
+        Condición de las filas posteriores (o anteriores) a la posición del cursor:
+        (a > va) OR (a = va AND b > vb) OR ... teniendo en cuenta la dirección y los NULL
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            if value is None:
+                beyond = Q(**{f'{name}__isnull': False}) if reverse else None
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                lookup = 'lt' if descending != reverse else 'gt'
+                beyond = Q(**{f'{name}__{lookup}': value})
+                if not reverse and field in self.nullable:
+                    beyond |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            if beyond is not None:
+                condition |= equal & beyond
+            equal &= same
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.nullable = {field for field in self.ordering if is_nullable(queryset.model, field.lstrip('-'))}
+
+        position, reverse = self.decode_cursor(request)
+        if position is not None and len(position) != len(self.ordering):
+            raise NotFound('Cursor inválido')
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, reverse))
+        rows = list(queryset.order_by(*self.order_by(reverse))[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursor de paginación (modo keyset)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Incluir el total de resultados (modo keyset)',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+
+
+class ApiPagination(BasePagination):
+    """
+    Paginación por defecto: delega en la paginación por páginas o por clave según
+    ``?pagination=page|keyset`` o el atributo ``pagination_mode`` de la vista
+    """
+    mode_query_param = 'pagination'
+    paginators = {
+        'page': StandardPageNumberPagination,
+        'keyset': KeysetPagination,
+    }
+
+    def get_mode(self, request, view):
+        mode = request.query_params.get(self.mode_query_param)
+        if mode not in self.paginators:
+            mode = getattr(view, 'pagination_mode', 'page')
+        return mode
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = self.get_mode(request, view)
+        if mode == 'keyset' and not KeysetPagination.supports(queryset):
+            mode = 'page'  # Resultados de una búsqueda ordenados por relevancia
+        self.paginator = self.paginators[mode]()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return StandardPageNumberPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Modo de paginación: page (por defecto) o keyset',
+                'schema': {'type': 'string', 'enum': list(self.paginators)},
+            },
+            *StandardPageNumberPagination().get_schema_operation_parameters(view),
+            *KeysetPagination().get_schema_operation_parameters(view),
+        ]
@@ -0,0 +1,30 @@
+"""
+Parsers adicionales de la API
+"""
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Un objeto JSON por línea (application/x-ndjson). Permite enviar importaciones
+    grandes sin tener que construir un único array JSON en el cliente.
+    Devuelve la lista de objetos.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        records = []
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'Línea {number}: JSON inválido ({exc})')
+        return records
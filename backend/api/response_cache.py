@@ -0,0 +1,224 @@
+"""
+Caché de respuestas de los endpoints de catálogo (autores, editoriales, géneros y libros).
+
+Se guardan los datos ya serializados de ``list`` y ``retrieve`` con una clave
+formada por el host, la ruta, los parámetros normalizados y las versiones de
+las que depende la respuesta:
+
+- cada tabla tiene una versión (``author``, ``book``...) que cambia con
+  cualquier alta, baja o modificación y de la que dependen los listados;
+- cada objeto tiene la suya (``author:7``) de la que depende su detalle, más la
+  de la tabla completa (``author:*``) que solo cambia con operaciones masivas.
+
+Las versiones se renuevan desde api.signals, así que cambiar un autor invalida
+los listados de autores y de libros, su detalle y el de sus libros, pero no el
+resto de detalles ni las respuestas de editoriales o géneros. Las versiones son
+una marca de tiempo con un sufijo aleatorio, no contadores: si el backend
+descarta una, la nueva nunca coincide con la de una respuesta antigua.
+
+Las mismas versiones sirven para el ETag y el Last-Modified de las respuestas
+(``ConditionalGetMixin``), también en endpoints por usuario como los estados
+de lectura o las estanterías, que usan etiquetas como ``bookshelf:user:3``.
+"""
+import functools
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+KEY_PREFIX = 'response-cache'
+STATS_KEYS = {'hits': f'{KEY_PREFIX}:hits', 'misses': f'{KEY_PREFIX}:misses'}
+
+
+def get_setting(name, default):
+    return getattr(settings, 'RESPONSE_CACHE', {}).get(name, default)
+
+
+def version_key(tag):
+    return f'{KEY_PREFIX}:version:{tag}'
+
+
+def new_version():
+    """Marca de tiempo (para Last-Modified) más un sufijo aleatorio"""
+    return f'{time.time():.6f}-{uuid.uuid4().hex[:12]}'
+
+
+def version_timestamp(version):
+    try:
+        return float(version.split('-', 1)[0])
+    except (AttributeError, ValueError):
+        return 0
+
+
+def get_versions(tags):
+    """Versiones actuales de las etiquetas, creando las que falten"""
+    keys = [version_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        for key, value in missing.items():
+            # add() no pisa la versión que haya creado otro proceso entre medias
+            cache.add(key, value, None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, '') for key in keys]
+
+
+def _renew(tags):
+    cache.set_many({version_key(tag): new_version() for tag in tags}, None)
+
+
+def invalidate(*tags):
+    """
+    Renueva las versiones indicadas. Se repite al confirmar la transacción para
+    descartar lo que otra petición haya cacheado con los datos anteriores
+    """
+    tags = list(tags)
+    if not tags:
+        return
+    _renew(tags)
+    transaction.on_commit(lambda: _renew(tags))
+
+
+def invalidate_objects(table, pks, content=True):
+    """
+    Invalida los listados de una tabla y el detalle de los objetos indicados.
+    ``content=False`` indica que solo han cambiado datos agregados (contadores):
+    se renueva ``<tabla>:counters`` en lugar de ``<tabla>:content``, así que los
+    endpoints por usuario que no muestran los contadores (resúmenes,
+    estadísticas) conservan su ETag y los que los muestran lo cambian
+    """
+    tags = [f'{table}:{pk}' for pk in pks if pk is not None]
+    if tags:
+        invalidate(table, *tags, f'{table}:content' if content else f'{table}:counters')
+
+
+def invalidate_table(table):
+    """Invalida todas las respuestas de una tabla (tras operaciones masivas)"""
+    invalidate(table, f'{table}:*', f'{table}:content', f'{table}:counters')
+
+
+def record(result):
+    key = STATS_KEYS[result]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_stats():
+    values = cache.get_many(list(STATS_KEYS.values()))
+    return {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    cache.delete_many(list(STATS_KEYS.values()))
+
+
+def cached_response(cache_key, handler):
+    """
+    Respuesta con los datos guardados en ``cache_key`` (``X-Cache: HIT``) o la de
+    ``handler()``, que se guarda si es un 200. La clave debe incluir las
+    versiones de las que dependen los datos (``get_response_hash``)
+    """
+    if not get_setting('ENABLED', True):
+        return handler()
+
+    data = cache.get(cache_key)
+    if data is not None:
+        record('hits')
+        return Response(data, headers={'X-Cache': 'HIT'})
+
+    record('misses')
+    response = handler()
+    if response.status_code == 200:
+        cache.set(cache_key, response.data, get_setting('TIMEOUT', 600))
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def conditional(method):
+    """Aplica ConditionalGetMixin a una acción extra (``@action``) de un viewset"""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.conditional_response(functools.partial(method, self), request, *args, **kwargs)
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """
+    ETag y Last-Modified en ``list`` y ``retrieve`` calculados a partir de las
+    versiones de ``get_cache_tags()``: si el cliente ya tiene la versión actual
+    (If-None-Match / If-Modified-Since) se responde 304 sin consultar la base
+    de datos ni serializar nada.
+    """
+
+    def get_cache_tags(self):
+        raise NotImplementedError
+
+    def get_versions(self):
+        if not hasattr(self, '_response_versions'):
+            self._response_versions = get_versions(self.get_cache_tags())
+        return self._response_versions
+
+    def get_response_hash(self, request, *extra):
+        """
+        Resumen de la petición (host, ruta, formato y parámetros) y de las versiones.
+        ``extra`` añade valores de los que depende la respuesta y que no están en la petición
+        """
+        params = sorted((key, request.query_params.getlist(key)) for key in request.query_params)
+        renderer = getattr(request, 'accepted_renderer', None)
+        raw = repr((request.get_host(), request.path, renderer and renderer.format, params, self.get_versions(), *extra))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def get_last_modified(self):
+        return max((version_timestamp(version) for version in self.get_versions()), default=0)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = f'"{self.get_response_hash(request)}"'
+        last_modified = int(self.get_last_modified())
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.get_fresh_response(handler, request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # El navegador guarda la respuesta pero la revalida en cada petición
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_fresh_response(self, handler, request, *args, **kwargs):
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+
+class CachedResponseMixin(ConditionalGetMixin):
+    """
+    Además de ETag y Last-Modified, cachea las respuestas de ``list`` y
+    ``retrieve``. ``cache_tables`` son las tablas de las que dependen sus
+    listados; la primera es la del propio modelo. Las respuestas llevan
+    ``X-Cache: HIT|MISS``.
+    """
+    cache_tables = ()
+
+    def get_cache_tags(self):
+        table = self.cache_tables[0]
+        if self.action == 'retrieve':
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            return [f'{table}:{lookup}', f'{table}:*']
+        return list(self.cache_tables)
+
+    def get_fresh_response(self, handler, request, *args, **kwargs):
+        cache_key = f'{KEY_PREFIX}:{self.cache_tables[0]}:{self.get_response_hash(request)}'
+        return cached_response(cache_key, functools.partial(handler, request, *args, **kwargs))
@@ -0,0 +1,172 @@
+"""
+Búsqueda de texto completo para libros.
+
+Cada libro tiene un documento de búsqueda ponderado (título > autores >
+editorial y géneros > sinopsis) que se precalcula al guardar el libro o al
+cambiar sus relaciones. En PostgreSQL el documento se guarda en
+``Book.search_vector`` (tsvector con índice GIN) y en SQLite, que es la base de
+datos de los tests, en una tabla virtual FTS5 paralela.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Value
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+FTS_TABLE = 'api_book_fts'
+FTS_COLUMNS = ('title', 'authors', 'publisher', 'genres', 'synopsis')
+# Pesos de bm25 para cada columna de FTS_COLUMNS (equivalen a los pesos A-D de PostgreSQL)
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 2.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_search_config():
+    """Configuración de texto de PostgreSQL usada para el documento y las consultas"""
+    return getattr(settings, 'BOOK_SEARCH_CONFIG', 'simple')
+
+
+def supports_full_text():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def tokenize(text):
+    """Divide la consulta en términos alfanuméricos (descarta operadores y signos)"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def build_document(book):
+    """
+    Devuelve los campos del documento de búsqueda de un libro.
+    El libro debe venir con publisher, authors y genres precargados.
+    """
+    return {
+        'title': book.title,
+        'authors': ' '.join(author.name for author in book.authors.all()),
+        'publisher': book.publisher.name if book.publisher_id else '',
+        'genres': ' '.join(genre.name for genre in book.genres.all()),
+        'synopsis': book.synopsis or '',
+    }
+
+
+def document_vector(document):
+    """Construye el tsvector ponderado de un documento (solo PostgreSQL)"""
+    config = get_search_config()
+    return (
+        SearchVector(Value(document['title']), weight='A', config=config)
+        + SearchVector(Value(document['authors']), weight='B', config=config)
+        + SearchVector(Value(f"{document['publisher']} {document['genres']}"), weight='C', config=config)
+        + SearchVector(Value(document['synopsis']), weight='D', config=config)
+    )
+
+
+def ensure_fts_table(cursor):
+    """Crea la tabla FTS5 si no existe (los tests crean el esquema sin migraciones)"""
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(FTS_COLUMNS)}, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def index_books(book_ids):
+    """Recalcula el documento de búsqueda de los libros indicados"""
+    from .models import Book
+
+    book_ids = list(book_ids)
+    if not book_ids or not supports_full_text():
+        return
+
+    books = Book.objects.filter(pk__in=book_ids).select_related('publisher').prefetch_related('authors', 'genres')
+    index_documents({book.pk: build_document(book) for book in books}, replace=book_ids)
+
+
+def index_documents(documents, replace=None):
+    """
+    Guarda documentos de búsqueda ya construidos (``{pk: documento}``), p. ej.
+    en importaciones masivas que tienen los datos en memoria. ``replace`` son
+    los ids cuyo documento anterior se descarta (por defecto, los de ``documents``)
+    """
+    from .models import Book
+
+    if not documents or not supports_full_text():
+        return
+
+    if connection.vendor == 'postgresql':
+        # bulk_update acepta expresiones: un único UPDATE ... CASE para todo el lote
+        books = [Book(pk=pk, search_vector=document_vector(document)) for pk, document in documents.items()]
+        Book.objects.bulk_update(books, ['search_vector'])
+        return
+
+    replace = documents.keys() if replace is None else replace
+    rows = [(pk, *(document[column] for column in FTS_COLUMNS)) for pk, document in documents.items()]
+    with connection.cursor() as cursor:
+        ensure_fts_table(cursor)
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in replace])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_books(book_ids):
+    """Elimina del índice los libros borrados (en PostgreSQL se borran con la fila)"""
+    book_ids = list(book_ids)
+    if not book_ids or connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        ensure_fts_table(cursor)
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in book_ids])
+
+
+def search_books(queryset, text):
+    """
+    Filtra el queryset de libros por texto completo y anota la relevancia
+    en ``search_rank`` (mayor es más relevante). Cada término se busca como
+    prefijo para que funcione mientras el usuario escribe.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=get_search_config())
+        return queryset.filter(search_vector=query).annotate(search_rank=SearchRank(F('search_vector'), query))
+
+    match = ' '.join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        ensure_fts_table(cursor)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    book_table = queryset.model._meta.db_table
+    # bm25() solo está disponible dentro de la consulta MATCH, así que unimos la
+    # tabla FTS5 directamente (una subconsulta correlacionada repite el MATCH por fila)
+    return queryset.extra(
+        select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = "{book_table}"."id"'],
+        params=[match],
+    )
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    SearchFilter que usa el índice de texto completo en lugar de ILIKE sobre
+    varias tablas. Si el cliente no pide un orden explícito, los resultados
+    se ordenan por relevancia. Debe ir después de OrderingFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not supports_full_text():
+            return super().filter_queryset(request, queryset, view)
+
+        text = ' '.join(terms)
+        if not tokenize(text):
+            return queryset
+
+        queryset = search_books(queryset, text)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('-search_rank', *queryset.query.order_by)
+        return queryset
@@ -1,4 +1,7 @@
 from rest_framework import serializers
+from rest_framework.serializers import as_serializer_error
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 import re
 from .models import (
     Author,
@@ -10,7 +13,10 @@ from .models import (
     Bookshelf,
     Comment,
     BookshelfEntry,
+    bulk_operation,
+    trusted_write,
 )
+from .fieldsets import SparseFieldsetMixin
 
 # Validadores personalizados
 def validate_isbn(value):
@@ -54,8 +60,22 @@ def validate_url(value):
     
     return value
 
+class TrustedSaveMixin:
+    """
+    Para modelos que validan en save(): los campos ya vienen validados por el
+    serializer, así que el modelo solo ejecuta clean() (ver ``trusted_write``),
+    cuyos errores se devuelven como errores de validación. El savepoint deja la
+    transacción usable si la base de datos rechaza un duplicado
+    """
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic(), trusted_write():
+                return super().save(**kwargs)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(as_serializer_error(exc))
+
 # Author Serializers
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorSerializer(TrustedSaveMixin, serializers.ModelSerializer):
     picture_url = serializers.URLField(validators=[validate_url], required=False, allow_blank=True)
     
     class Meta:
@@ -91,7 +111,7 @@ class AuthorSerializer(serializers.ModelSerializer):
         return data
 
 # Publisher Serializers
-class PublisherSerializer(serializers.ModelSerializer):
+class PublisherSerializer(TrustedSaveMixin, serializers.ModelSerializer):
     logo_url = serializers.URLField(validators=[validate_url], required=False, allow_blank=True)
     
     class Meta:
@@ -100,7 +120,7 @@ class PublisherSerializer(serializers.ModelSerializer):
 
 # Book Serializers
 # Serializador solo para leer datos de Books (GET)
-class BookReadSerializer(serializers.ModelSerializer):
+class BookReadSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # Usamos StringRelatedField para mostrar nombres legibles
     publisher = serializers.StringRelatedField()
     authors = serializers.StringRelatedField(many=True)
@@ -108,7 +128,7 @@ class BookReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Book
-        fields = '__all__'
+        exclude = ['search_vector', 'rating_sum']
 
 # Serializador para crear y actualizar Books (POST, PUT, PATCH)
 class BookWriteSerializer(serializers.ModelSerializer):
@@ -125,22 +145,40 @@ class BookWriteSerializer(serializers.ModelSerializer):
             'publisher', 'authors', 'genres',
         ]
 
+    def save(self, **kwargs):
+        """
+        Un libro debe tener al menos un autor. Se comprueba una vez aquí con los
+        datos validados, sin consultas, en lugar de en cada cambio de la relación
+        """
+        if (self.instance is None or 'authors' in self.validated_data) and not self.validated_data.get('authors'):
+            raise serializers.ValidationError({'authors': 'El libro debe tener al menos un autor.'})
+        with bulk_operation():
+            return super().save(**kwargs)
+
 # Genre Serializers
 class GenreSerializer(serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = '__all__'
 
+# Con ?expand= las relaciones del libro se devuelven como objetos
+BookReadSerializer.expandable_fields = {
+    'publisher': (PublisherSerializer, {}),
+    'authors': (AuthorSerializer, {'many': True}),
+    'genres': (GenreSerializer, {'many': True}),
+}
+
 # Review Serializers
-class ReviewReadSerializer(serializers.ModelSerializer):
+class ReviewReadSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     book = serializers.StringRelatedField()
+    expandable_fields = {'book': (BookReadSerializer, {})}
     
     class Meta:
         model = Review
         fields = '__all__'
 
-class ReviewWriteSerializer(serializers.ModelSerializer):
+class ReviewWriteSerializer(TrustedSaveMixin, serializers.ModelSerializer):
     class Meta: 
         model = Review
         fields = ['review_text']
@@ -164,7 +202,7 @@ class ReviewWriteSerializer(serializers.ModelSerializer):
         return data
 
 # ReadingStatus Serializers
-class ReadingStatusReadSerializer(serializers.ModelSerializer):
+class ReadingStatusReadSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     book_detail = BookReadSerializer(source='book', read_only=True)
 
@@ -172,7 +210,7 @@ class ReadingStatusReadSerializer(serializers.ModelSerializer):
         model = ReadingStatus
         fields = ['id', 'user', 'book', 'book_detail', 'status', 'rating', 'started_at', 'finished_at']
 
-class ReadingStatusWriteSerializer(serializers.ModelSerializer):
+class ReadingStatusWriteSerializer(TrustedSaveMixin, serializers.ModelSerializer):
     class Meta:
         model = ReadingStatus
         fields = ['book', 'status', 'rating', 'started_at', 'finished_at']
@@ -263,8 +301,26 @@ class BookshelfReadSerializer(serializers.ModelSerializer):
     
     def get_book_count(self, obj):
         """Retorna el número de libros en la estantería"""
+        # Anotado en BookshelfViewSet.get_queryset para no contar estantería a estantería
+        book_count = getattr(obj, 'book_count', None)
+        if book_count is not None:
+            return book_count
         return obj.entries.count()
 
+class BookshelfSummarySerializer(BookshelfReadSerializer):
+    """
+    Representación ligera para las tarjetas de estantería (``?view=summary``):
+    sin las entradas, que se obtienen paginadas desde la acción ``books``
+    """
+    last_updated = serializers.DateTimeField(read_only=True)
+
+    class Meta:
+        model = Bookshelf
+        fields = [
+            'id', 'name', 'description', 'visibility', 'cover_image_url', 'auto_cover_books',
+            'book_count', 'created_at', 'last_updated',
+        ]
+
 class BookshelfWriteSerializer(serializers.ModelSerializer):
     cover_image = serializers.ImageField(required=False, allow_null=True)
     remove_cover_image = serializers.BooleanField(write_only=True, required=False)
@@ -296,6 +352,18 @@ class BookshelfWriteSerializer(serializers.ModelSerializer):
         
         return super().update(instance, validated_data)
 
+class BookshelfBulkBooksSerializer(serializers.Serializer):
+    """Lista de libros para añadir o quitar de una estantería en una sola petición"""
+    MAX_BOOKS = 1000
+
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_BOOKS
+    )
+
+    def validate_book_ids(self, value):
+        # Sin duplicados, conservando el orden en que llegan
+        return list(dict.fromkeys(value))
+
 # Comment Serializers
 class CommentReadSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
@@ -305,7 +373,15 @@ class CommentReadSerializer(serializers.ModelSerializer):
         model = Comment
         fields = '__all__'
 
-class CommentWriteSerializer(serializers.ModelSerializer):
+class CommentTreeSerializer(serializers.ModelSerializer):
+    """Nodo del árbol de comentarios (``?tree=1``): el padre como id, las respuestas se anidan después"""
+    user = serializers.StringRelatedField()
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'user', 'comment_text', 'created_at', 'parent_comment', 'depth']
+
+class CommentWriteSerializer(TrustedSaveMixin, serializers.ModelSerializer):
     parent_comment = serializers.PrimaryKeyRelatedField(
         queryset=Comment.objects.none(),  # Se establecerá dinámicamente
         required=False,
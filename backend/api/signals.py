@@ -0,0 +1,216 @@
+"""
+Receptores de señales que mantienen datos derivados de los modelos
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import autocomplete, counters, response_cache, summaries
+from .models import Author, Book, Bookshelf, BookshelfEntry, Comment, Genre, Publisher, ReadingStatus, Review
+from .search import index_books, remove_books
+
+
+# --- Índice de búsqueda de libros ---
+
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book_on_delete(sender, instance, **kwargs):
+    remove_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.genres.through)
+def index_book_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Reindexa los libros afectados al cambiar sus autores o géneros,
+    tanto desde el libro (book.authors.add) como desde el otro lado (author.books.add)
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            index_books([instance.pk])
+        return
+
+    if action == 'pre_clear':
+        instance._related_book_ids = list(instance.books.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        index_books(pk_set)
+    elif action == 'post_clear':
+        index_books(getattr(instance, '_related_book_ids', []))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Genre)
+def index_related_books_on_save(sender, instance, created, raw=False, **kwargs):
+    """Un cambio de nombre en autor, editorial o género cambia el documento de sus libros"""
+    if created or raw:
+        return
+    index_books(instance.books.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def collect_books_before_delete(sender, instance, **kwargs):
+    instance._related_book_ids = list(instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def index_books_after_delete(sender, instance, **kwargs):
+    index_books(getattr(instance, '_related_book_ids', []))
+
+
+# --- Autocompletado ---
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_autocomplete(sender, **kwargs):
+    autocomplete.invalidate()
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def invalidate_autocomplete_on_authors_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        autocomplete.invalidate()
+
+
+# --- Contadores de libros ---
+
+@receiver(post_save, sender=ReadingStatus)
+def count_reading_status_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = (instance.book_id, instance.rating)
+    if created:
+        counters.reading_status_changed(None, new_state)
+    elif hasattr(instance, '_counted_state'):
+        counters.reading_status_changed(instance._counted_state, new_state)
+    # Sin estado previo conocido (carga con only/defer) no se puede calcular la diferencia
+    instance._counted_state = new_state
+
+
+@receiver(post_delete, sender=ReadingStatus)
+def count_reading_status_on_delete(sender, instance, **kwargs):
+    old_state = getattr(instance, '_counted_state', (instance.book_id, instance.rating))
+    counters.reading_status_changed(old_state, None)
+
+
+@receiver(post_save, sender=Review)
+def count_review_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.review_changed(None, instance.book_id)
+    elif hasattr(instance, '_counted_book_id'):
+        counters.review_changed(instance._counted_book_id, instance.book_id)
+    instance._counted_book_id = instance.book_id
+
+
+@receiver(post_delete, sender=Review)
+def count_review_on_delete(sender, instance, **kwargs):
+    counters.review_changed(getattr(instance, '_counted_book_id', instance.book_id), None)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.comment_added(instance.review_id, instance.created_at)
+
+
+@receiver(post_delete, sender=Comment)
+def count_comment_on_delete(sender, instance, **kwargs):
+    counters.comment_removed(instance.review_id)
+
+
+# --- Resumen anual de lectura ---
+
+@receiver(post_save, sender=ReadingStatus)
+def summarize_reading_status_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = instance.summary_state()
+    if created:
+        summaries.reading_status_changed(None, new_state)
+    elif hasattr(instance, '_summary_state'):
+        summaries.reading_status_changed(instance._summary_state, new_state)
+    else:
+        # Sin estado previo conocido se recalculan los resúmenes del usuario
+        summaries.rebuild_summaries([instance.user_id])
+    instance._summary_state = new_state
+
+
+@receiver(post_delete, sender=ReadingStatus)
+def summarize_reading_status_on_delete(sender, instance, **kwargs):
+    summaries.reading_status_changed(getattr(instance, '_summary_state', instance.summary_state()), None)
+
+
+# --- Caché de respuestas del catálogo ---
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_responses(sender, instance, **kwargs):
+    response_cache.invalidate_objects('book', [instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.genres.through)
+def invalidate_book_responses_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        response_cache.invalidate_objects('book', [instance.pk])
+    elif action == 'post_clear':
+        response_cache.invalidate_objects('book', getattr(instance, '_related_book_ids', []))
+    else:
+        response_cache.invalidate_objects('book', pk_set)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Genre)
+def invalidate_related_responses_on_save(sender, instance, created, **kwargs):
+    """Los libros muestran el nombre de sus autores, editorial y géneros"""
+    response_cache.invalidate_objects(sender._meta.model_name, [instance.pk])
+    if not created:
+        response_cache.invalidate_objects('book', instance.books.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_delete, sender=Genre)
+def invalidate_related_responses_on_delete(sender, instance, **kwargs):
+    # Las editoriales con libros no se pueden borrar (PROTECT)
+    response_cache.invalidate_objects(sender._meta.model_name, [instance.pk])
+    response_cache.invalidate_objects('book', getattr(instance, '_related_book_ids', []))
+
+
+# --- Versiones por usuario (ETag de estados de lectura y estanterías) ---
+
+@receiver(post_save, sender=ReadingStatus)
+@receiver(post_delete, sender=ReadingStatus)
+def invalidate_user_reading_statuses(sender, instance, **kwargs):
+    response_cache.invalidate(f'reading_status:user:{instance.user_id}')
+
+
+@receiver(post_save, sender=Bookshelf)
+@receiver(post_delete, sender=Bookshelf)
+def invalidate_user_bookshelves(sender, instance, **kwargs):
+    response_cache.invalidate(f'bookshelf:user:{instance.user_id}')
+
+
+@receiver(post_save, sender=BookshelfEntry)
+@receiver(post_delete, sender=BookshelfEntry)
+def invalidate_user_bookshelves_on_entry_change(sender, instance, **kwargs):
+    if BookshelfEntry.bookshelf.is_cached(instance):
+        user_id = instance.bookshelf.user_id
+    else:
+        user_id = Bookshelf.objects.filter(pk=instance.bookshelf_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        response_cache.invalidate(f'bookshelf:user:{user_id}')
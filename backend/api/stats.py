@@ -0,0 +1,73 @@
+"""
+Estadísticas de lectura de un usuario (/api/reading-statuses/stats/).
+
+Se calculan con agregaciones en la base de datos, una consulta por bloque:
+estados, totales del año, meses del año y los géneros y autores más leídos.
+La vista las cachea por usuario (ver ``ReadingStatusViewSet.stats``).
+"""
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import ReadingStatus
+
+TOP_LIMIT = 10  # Géneros y autores devueltos
+
+
+def rounded(value, digits=2):
+    return round(float(value), digits) if value is not None else None
+
+
+def top_groups(completed, field):
+    """Libros terminados y calificación media por ``field`` (género o autor), los más leídos primero"""
+    rows = completed.exclude(**{f'{field}__isnull': True}).values(field).annotate(
+        books=Count('pk'),
+        average_rating=Avg('rating'),
+    ).order_by('-books', field)[:TOP_LIMIT]
+    return [
+        {'name': row[field], 'books': row['books'], 'average_rating': rounded(row['average_rating'])}
+        for row in rows
+    ]
+
+
+def reading_stats(user, year):
+    statuses = ReadingStatus.objects.filter(user=user).order_by()
+    completed = statuses.filter(status='C')
+    in_year = completed.filter(finished_at__year=year)
+
+    counts = dict(statuses.values_list('status').annotate(total=Count('pk')))
+    totals = in_year.aggregate(
+        books=Count('pk'),
+        pages=Coalesce(Sum('book__pages'), 0),
+        average_rating=Avg('rating'),
+    )
+    months = {
+        row['month'].month: row
+        for row in in_year.annotate(month=TruncMonth('finished_at')).values('month').annotate(
+            books=Count('pk'),
+            pages=Coalesce(Sum('book__pages'), 0),
+        )
+    }
+
+    return {
+        'statuses': {
+            'not_started': counts.get('N', 0),
+            'reading': counts.get('R', 0),
+            'completed': counts.get('C', 0),
+        },
+        'year': {
+            'year': year,
+            'books': totals['books'],
+            'pages': totals['pages'],
+            'average_rating': rounded(totals['average_rating']),
+        },
+        'months': [
+            {
+                'month': f'{year}-{month:02d}',
+                'books': months[month]['books'] if month in months else 0,
+                'pages': months[month]['pages'] if month in months else 0,
+            }
+            for month in range(1, 13)
+        ],
+        'genres': top_groups(completed, 'book__genres__name'),
+        'authors': top_groups(completed, 'book__authors__name'),
+    }
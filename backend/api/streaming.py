@@ -0,0 +1,41 @@
+"""
+Respuestas JSON en streaming para listados completos.
+
+El queryset se recorre con ``iterator()`` por bloques y cada bloque se
+serializa y se envía en cuanto está listo, así que la memoria usada no
+depende del tamaño del listado. Se usa cuando el cliente pide el conjunto
+completo en lugar de una página.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def iter_json_array(queryset, serializer_class, context=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Genera un array JSON serializando el queryset bloque a bloque"""
+    encoder = JSONEncoder(ensure_ascii=False)
+    yield '['
+    separator = ''
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) < chunk_size:
+            continue
+        for item in serializer_class(chunk, many=True, context=context).data:
+            yield separator + encoder.encode(item)
+            separator = ','
+        chunk = []
+    for item in serializer_class(chunk, many=True, context=context).data:
+        yield separator + encoder.encode(item)
+        separator = ','
+    yield ']'
+
+
+def streaming_json_response(queryset, serializer_class, context=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    return StreamingHttpResponse(
+        iter_json_array(queryset, serializer_class, context, chunk_size),
+        content_type='application/json',
+    )
@@ -0,0 +1,189 @@
+"""
+Resumen anual de lectura de cada usuario (ReadingYearSummary, "year in books").
+
+Cuenta los libros terminados (estado 'C') en cada año según ``finished_at``:
+número de libros y páginas, libros por género y por autor, histograma de
+calificaciones y libros más largo y más corto. Se mantiene por diferencia
+desde las señales de ReadingStatus: al terminar un libro se suman sus datos a
+la fila de (usuario, año) y al deshacerlo se restan, así que leer el resumen
+es leer una fila.
+
+Los nombres de géneros y autores y las páginas son los del libro en el momento
+de contarlo. ``rebuild_summaries`` recalcula desde cero los resúmenes de un
+grupo de usuarios (tras cargas masivas o si cambian los datos de los libros);
+el comando ``rebuild_reading_summaries`` lo hace para todos en paralelo.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from . import response_cache
+from .models import Book, ReadingStatus, ReadingYearSummary
+
+TOP_LIMIT = 5  # Géneros y autores del resumen
+
+
+def rating_key(rating):
+    """Clave del histograma: '4', '4.5'..."""
+    return f'{float(rating):g}'
+
+
+def book_facts(book_id):
+    """Páginas, géneros y autores de un libro"""
+    pages = Book.objects.filter(pk=book_id).values_list('pages', flat=True).first()
+    genres = list(Book.genres.through.objects.filter(book_id=book_id).values_list('genre__name', flat=True))
+    authors = list(Book.authors.through.objects.filter(book_id=book_id).values_list('author__name', flat=True))
+    return pages, genres, authors
+
+
+def add_counts(counts, names, delta):
+    for name in names:
+        counts[name] = counts.get(name, 0) + delta
+        if counts[name] <= 0:
+            del counts[name]
+
+
+def update_extremes(summary, book_id, pages):
+    if pages is None:
+        return
+    if summary.longest_pages is None or pages > summary.longest_pages:
+        summary.longest_book_id, summary.longest_pages = book_id, pages
+    if summary.shortest_pages is None or pages < summary.shortest_pages:
+        summary.shortest_book_id, summary.shortest_pages = book_id, pages
+
+
+def recompute_extremes(summary):
+    """Libros más largo y más corto del año, con una consulta (al quitar uno de ellos)"""
+    summary.longest_book_id = summary.longest_pages = None
+    summary.shortest_book_id = summary.shortest_pages = None
+    finished = ReadingStatus.objects.filter(
+        user_id=summary.user_id, status='C', finished_at__year=summary.year, book__pages__isnull=False,
+    ).order_by()
+    for book_id, pages in finished.values_list('book_id', 'book__pages'):
+        update_extremes(summary, book_id, pages)
+
+
+def apply_state(state, delta):
+    """Suma (``delta=1``) o resta (``delta=-1``) un libro terminado a su resumen"""
+    user_id, year, book_id, rating = state
+    pages, genres, authors = book_facts(book_id)
+    with transaction.atomic():
+        summary, _ = ReadingYearSummary.objects.select_for_update().get_or_create(user_id=user_id, year=year)
+        summary.books += delta
+        if summary.books <= 0:
+            summary.delete()
+            return
+        summary.pages = max(0, summary.pages + delta * (pages or 0))
+        add_counts(summary.genre_counts, genres, delta)
+        add_counts(summary.author_counts, authors, delta)
+        if rating is not None:
+            add_counts(summary.rating_histogram, [rating_key(rating)], delta)
+        if delta > 0:
+            update_extremes(summary, book_id, pages)
+        elif book_id in (summary.longest_book_id, summary.shortest_book_id):
+            recompute_extremes(summary)
+        summary.save()
+
+
+def reading_status_changed(old, new):
+    """
+    Actualiza los resúmenes tras guardar o borrar un ReadingStatus. ``old`` y
+    ``new`` son ``ReadingStatus.summary_state()`` antes y después (None si no cuenta)
+    """
+    if old == new:
+        return
+    if old and new and old[:3] == new[:3]:
+        # Mismo libro y año: solo cambia la calificación
+        with transaction.atomic():
+            summary = ReadingYearSummary.objects.select_for_update().filter(user_id=new[0], year=new[1]).first()
+            if summary is None:
+                return rebuild_summaries([new[0]])
+            if old[3] is not None:
+                add_counts(summary.rating_histogram, [rating_key(old[3])], -1)
+            if new[3] is not None:
+                add_counts(summary.rating_histogram, [rating_key(new[3])], 1)
+            summary.save(update_fields=['rating_histogram', 'updated_at'])
+        return
+    if old:
+        apply_state(old, -1)
+    if new:
+        apply_state(new, 1)
+
+
+def compute_summaries(user_ids):
+    """
+    Resúmenes calculados desde cero para los usuarios indicados, como
+    diccionarios con los campos de ReadingYearSummary. Solo lee (tres
+    consultas), así que se puede ejecutar en otro proceso
+    """
+    finished = ReadingStatus.objects.filter(user_id__in=user_ids, status='C', finished_at__isnull=False).order_by()
+    rows = list(finished.values_list('user_id', 'finished_at', 'book_id', 'rating', 'book__pages'))
+    book_ids = {row[2] for row in rows}
+    genres, authors = defaultdict(list), defaultdict(list)
+    if book_ids:
+        for book_id, name in Book.genres.through.objects.filter(book_id__in=book_ids).values_list('book_id', 'genre__name'):
+            genres[book_id].append(name)
+        for book_id, name in Book.authors.through.objects.filter(book_id__in=book_ids).values_list('book_id', 'author__name'):
+            authors[book_id].append(name)
+
+    summaries = {}
+    for user_id, finished_at, book_id, rating, pages in rows:
+        key = (user_id, finished_at.year)
+        if key not in summaries:
+            summaries[key] = ReadingYearSummary(user_id=user_id, year=finished_at.year, genre_counts=Counter(),
+                                                author_counts=Counter(), rating_histogram=Counter())
+        summary = summaries[key]
+        summary.books += 1
+        summary.pages += pages or 0
+        summary.genre_counts.update(genres[book_id])
+        summary.author_counts.update(authors[book_id])
+        if rating is not None:
+            summary.rating_histogram[rating_key(rating)] += 1
+        update_extremes(summary, book_id, pages)
+
+    fields = ['user_id', 'year', 'books', 'pages', 'genre_counts', 'author_counts', 'rating_histogram',
+              'longest_book_id', 'longest_pages', 'shortest_book_id', 'shortest_pages']
+    return [{field: getattr(summary, field) for field in fields} for summary in summaries.values()]
+
+
+def write_summaries(user_ids, summaries):
+    """Sustituye los resúmenes de los usuarios por los calculados con ``compute_summaries``"""
+    with transaction.atomic():
+        ReadingYearSummary.objects.filter(user_id__in=user_ids).delete()
+        ReadingYearSummary.objects.bulk_create([ReadingYearSummary(**summary) for summary in summaries])
+    response_cache.invalidate(*[f'reading_status:user:{user_id}' for user_id in user_ids])
+
+
+def rebuild_summaries(user_ids):
+    user_ids = list(user_ids)
+    write_summaries(user_ids, compute_summaries(user_ids))
+
+
+def top_counts(counts):
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:TOP_LIMIT]
+    return [{'name': name, 'books': books} for name, books in ranked]
+
+
+def book_brief(book, pages):
+    return {'id': book.pk, 'title': book.title, 'pages': pages} if book else None
+
+
+def summary_data(user, year):
+    """Resumen de un año listo para la respuesta (con ceros si no terminó ningún libro)"""
+    summary = ReadingYearSummary.objects.filter(user=user, year=year).select_related(
+        'longest_book', 'shortest_book'
+    ).first() or ReadingYearSummary(user=user, year=year)
+    return {
+        'year': year,
+        'books': summary.books,
+        'pages': summary.pages,
+        'top_genres': top_counts(summary.genre_counts),
+        'top_authors': top_counts(summary.author_counts),
+        'longest_book': book_brief(summary.longest_book, summary.longest_pages),
+        'shortest_book': book_brief(summary.shortest_book, summary.shortest_pages),
+        'rating_histogram': {
+            key: summary.rating_histogram.get(key, 0)
+            for key in (rating_key(value / 2) for value in range(1, 11))
+        },
+        'updated_at': summary.updated_at,
+    }
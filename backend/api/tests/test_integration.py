@@ -1,12 +1,26 @@
 """
 Tests de integración end-to-end
 """
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth.models import User
 from api.models import Author, Publisher, Book, Review, Comment, Bookshelf, ReadingStatus, Genre
+from api.search import ensure_fts_table, search_books
 from api.tests.base import BaseAPITestCase
 
 
@@ -223,6 +237,47 @@ class SearchAndFilterIntegrationTest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data['results']), 0)
 
+    def test_search_ranks_title_above_synopsis(self):
+        """Test la búsqueda ordena por relevancia (título antes que sinopsis)"""
+        synopsis_book = Book.objects.create(
+            title='Otro libro',
+            isbn='978-84-376-99999',
+            synopsis='Un ensayo sobre la soledad',
+            publisher=self.publisher2
+        )
+        synopsis_book.authors.add(self.author2)
+
+        url = reverse('book-list')
+        response = self.client.get(url, {'search': 'soledad'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [book['title'] for book in response.data['results']]
+        self.assertEqual(titles, ['Cien años de soledad', 'Otro libro'])
+
+    def test_search_prefix_and_accents(self):
+        """Test la búsqueda acepta prefijos y términos sin tildes"""
+        url = reverse('book-list')
+        response = self.client.get(url, {'search': 'garc marq'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data['results']], [self.book2.id])
+
+    def test_search_index_follows_related_changes(self):
+        """Test el índice se actualiza al renombrar autores y cambiar la relación"""
+        url = reverse('book-list')
+        self.author2.name = 'Gabo'
+        self.author2.save()
+        response = self.client.get(url, {'search': 'Gabo'})
+        self.assertEqual([book['id'] for book in response.data['results']], [self.book2.id])
+
+        self.book2.authors.add(self.author)
+        response = self.client.get(url, {'search': 'Test Author'})
+        self.assertIn(self.book2.id, [book['id'] for book in response.data['results']])
+
+    def test_search_does_not_expose_search_vector(self):
+        """Test el documento de búsqueda no se expone en la API"""
+        url = reverse('book-detail', kwargs={'pk': self.book2.id})
+        response = self.client.get(url)
+        self.assertNotIn('search_vector', response.data)
+
 
 class ErrorHandlingIntegrationTest(BaseAPITestCase):
     """Test de integración de manejo de errores"""
@@ -313,3 +368,269 @@ class PerformanceIntegrationTest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data['results']), 0)
         # La respuesta debe ser rápida (menos de 1 segundo en condiciones normales)
+
+
+class StubGoogleBooksHandler(BaseHTTPRequestHandler):
+    """Simula la API de Google Books: /volumes?q=isbn:<isbn>"""
+    
+    def do_GET(self):
+        server = self.server
+        isbn = parse_qs(urlparse(self.path).query)['q'][0].split(':', 1)[1]
+        with server.lock:
+            server.requests.append(isbn)
+            attempt = server.requests.count(isbn)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if isbn in server.flaky and attempt == 1:
+                self.send_response(429)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            info = server.books.get(isbn)
+            body = json.dumps({'totalItems': 1, 'items': [{'volumeInfo': info}]} if info else {'totalItems': 0})
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode())
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+    
+    def log_message(self, *args):
+        pass
+
+
+class IngestTestCase(TestCase):
+    """Base de los tests de importación masiva"""
+    
+    @classmethod
+    def setUpClass(cls):
+        # La tabla FTS5 se crea fuera de la transacción del test: si se crea dentro
+        # de un bloque atómico y el test la revierte, SQLite deja la conexión inservible
+        with connection.cursor() as cursor:
+            ensure_fts_table(cursor)
+        super().setUpClass()
+
+
+class PopulateDbCommandTest(IngestTestCase):
+    """Test de populate_db contra un servidor local que simula Google Books"""
+    
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGoogleBooksHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.in_flight = self.server.max_in_flight = 0
+        self.server.delay = 0.05
+        self.server.flaky = {'0000000002'}
+        self.server.books = {
+            f'000000000{index}': {
+                'title': f'Stub Book {index}',
+                'authors': [f'Stub Author {index % 2}'],
+                'publisher': 'Stub Publisher',
+                'publishedDate': '2001-05',
+                'pageCount': 100 + index,
+            }
+            for index in range(1, 6)
+        }
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmp_dir.name, 'books.csv')
+        with open(self.csv_path, 'w', encoding='latin-1') as csv_file:
+            csv_file.write('"ISBN";"Book-Title";"Book-Author";"Year-Of-Publication";"Publisher"\n')
+            for index in range(1, 7):  # 0000000006 no existe en la API
+                csv_file.write(f'"000000000{index}";"CSV Title {index}";"CSV Author";"2001";"CSV Publisher"\n')
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+    
+    def populate(self, **options):
+        call_command(
+            'populate_db',
+            csv=self.csv_path,
+            api_url=f'http://127.0.0.1:{self.server.server_port}/volumes',
+            cache_dir=os.path.join(self.tmp_dir.name, 'cache'),
+            api_workers=4,
+            rate_limit=0,
+            stdout=StringIO(),
+            **options
+        )
+    
+    def test_populate_db_fetches_concurrently_with_retries(self):
+        """Test descarga concurrente, reintento tras 429 y guardado de los libros"""
+        self.populate()
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertEqual(self.server.requests.count('0000000002'), 2)
+        self.assertEqual(Book.objects.count(), 5)
+        book = Book.objects.get(isbn='0000000003')
+        self.assertEqual((book.title, book.pages, str(book.publication_date)), ('Stub Book 3', 103, '2001-05-01'))
+        self.assertEqual(list(book.authors.values_list('name', flat=True)), ['Stub Author 1'])
+    
+    def test_populate_db_reuses_disk_cache(self):
+        """Test una segunda ejecución no vuelve a llamar a la API"""
+        self.populate()
+        requests_made = len(self.server.requests)
+        Book.objects.all().delete()
+        self.populate(start=0)
+        self.assertEqual(len(self.server.requests), requests_made)
+        self.assertEqual(Book.objects.count(), 5)
+    
+    def test_populate_db_writes_in_batches(self):
+        """Test las filas se insertan por bloques, reutilizando editoriales y autores existentes"""
+        publisher = Publisher.objects.create(name='CSV Publisher')
+        author = Author.objects.create(name='CSV Author')
+        with CaptureQueriesContext(connection) as queries:
+            self.populate(offline=True, batch_size=100)
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(Book.objects.count(), 6)
+        self.assertEqual(Publisher.objects.count(), 1)
+        self.assertEqual(Author.objects.count(), 1)
+        self.assertLess(len(queries), 15)
+        book = Book.objects.get(isbn='0000000004')
+        self.assertEqual((book.title, book.publisher, str(book.publication_date)), ('CSV Title 4', publisher, '2001-01-01'))
+        self.assertEqual(list(book.authors.all()), [author])
+        self.assertEqual(list(search_books(Book.objects.all(), 'CSV Title 4')), [book])
+    
+    def test_populate_db_resumes_from_checkpoint(self):
+        """Test una importación interrumpida continúa tras la última fila confirmada"""
+        calls = []
+        
+        def fail_on_second_batch(documents, replace=None):
+            calls.append(documents)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+        
+        with mock.patch('api.ingest.index_documents', side_effect=fail_on_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.populate(offline=True, batch_size=2, chunk_size=3)
+        self.assertEqual(sorted(Book.objects.values_list('isbn', flat=True)), ['0000000001', '0000000002'])
+        
+        self.populate(offline=True, batch_size=2, chunk_size=3)
+        self.assertEqual(Book.objects.count(), 6)
+        with open(f'{self.csv_path}.checkpoint', encoding='utf-8') as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['next_row'], 6)
+    
+    def test_populate_db_retries_failed_rows_on_resume(self):
+        """Test las filas que fallaron en la API se guardan y se reintentan al reanudar"""
+        self.populate(max_retries=0, chunk_size=2)  # El 429 de 0000000002 no se reintenta
+        self.assertFalse(Book.objects.filter(isbn='0000000002').exists())
+        with open(f'{self.csv_path}.checkpoint', encoding='utf-8') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual((checkpoint['next_row'], checkpoint['failed_rows']), (6, [1]))
+
+        self.populate(chunk_size=2)
+        self.assertTrue(Book.objects.filter(isbn='0000000002').exists())
+        self.assertEqual(Book.objects.count(), 5)
+        with open(f'{self.csv_path}.checkpoint', encoding='utf-8') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual((checkpoint['next_row'], checkpoint['failed_rows']), (6, []))
+    
+    def test_populate_db_row_range(self):
+        """Test --start y --end seleccionan el rango de filas a importar"""
+        self.populate(offline=True, start=1, end=4, chunk_size=2)
+        self.assertEqual(
+            sorted(Book.objects.values_list('isbn', flat=True)), ['0000000002', '0000000003', '0000000004']
+        )
+    
+    def test_populate_db_parallel_workers(self):
+        """Test --workers reparte el CSV entre procesos sin duplicar editoriales ni libros"""
+        with open(self.csv_path, 'a', encoding='latin-1') as csv_file:
+            csv_file.write('"0000000007";"Bad";"Line";"2001";"CSV Publisher";"extra"\n')  # Se descarta como en pandas
+            csv_file.write('"000-000-0008";"CSV Title 8";"Other Author";"1999";"CSV Publisher"\n')
+            csv_file.write('"0000000001";"Duplicated";"CSV Author";"2001";"Other Publisher"\n')
+        with mock.patch('api.ingest.PARTITION_SIZE', 100):
+            self.populate(offline=True, workers=2, batch_size=2, end=8)
+        self.assertEqual(Book.objects.count(), 7)
+        self.assertEqual(list(Publisher.objects.values_list('name', flat=True)), ['CSV Publisher'])
+        self.assertEqual(Book.objects.get(isbn='0000000008').authors.get().name, 'Other Author')
+        with open(f'{self.csv_path}.checkpoint', encoding='utf-8') as checkpoint_file:
+            self.assertEqual(json.load(checkpoint_file)['next_row'], 8)
+    
+    def test_populate_db_parallel_resumes_from_checkpoint(self):
+        """Test con --workers el punto de control guarda el tramo en el que retomar la lectura"""
+        calls = []
+        
+        def fail_on_second_batch(documents, replace=None):
+            calls.append(documents)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+        
+        with mock.patch('api.ingest.PARTITION_SIZE', 100):
+            with mock.patch('api.ingest.index_documents', side_effect=fail_on_second_batch):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.populate(offline=True, workers=2, batch_size=3)
+            with open(f'{self.csv_path}.checkpoint', encoding='utf-8') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            self.assertEqual(checkpoint['next_row'], 3)
+            self.assertLessEqual(checkpoint['partition'][1], 3)
+            self.populate(offline=True, workers=2, batch_size=3)
+        self.assertEqual(Book.objects.count(), 6)
+    
+    def test_populate_db_workers_require_offline(self):
+        """Test --workers no se puede combinar con la API"""
+        with self.assertRaises(CommandError):
+            self.populate(workers=2)
+
+
+class ImportOpenLibraryCommandTest(IngestTestCase):
+    """Test de import_openlibrary con volcados locales comprimidos"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def write_dump(self, name, records, tsv=True):
+        path = os.path.join(self.tmp_dir.name, name)
+        with gzip.open(path, 'wt', encoding='utf-8') as dump:
+            for record in records:
+                line = json.dumps(record)
+                if tsv:
+                    line = f"/type/x\t{record['key']}\t1\t2020-01-01T00:00:00\t{line}"
+                dump.write(line + '\n')
+            dump.write('línea rota\n')
+        return path
+    
+    def test_import_openlibrary_dump(self):
+        """Test las ediciones con ISBN se importan con sus autores, editorial y materias"""
+        authors = self.write_dump('authors.txt.gz', [
+            {'key': '/authors/OL1A', 'name': 'Ursula K. Le Guin'},
+            {'key': '/authors/OL2A', 'name': 'Otra Autora'},
+        ])
+        works = self.write_dump('works.txt.gz', [{
+            'key': '/works/OL1W',
+            'authors': [{'author': {'key': '/authors/OL1A'}, 'type': {'key': '/type/author_role'}}],
+            'subjects': ['Fantasy', 'Wizards'],
+            'description': {'type': '/type/text', 'value': 'Un mago en Terramar.'},
+        }])
+        editions = self.write_dump('editions.jsonl.gz', [
+            {
+                'key': '/books/OL1M', 'title': 'A Wizard of Earthsea', 'isbn_13': ['978-0-553-38304-0'],
+                'publishers': ['Bantam'], 'publish_date': 'March 5, 2004', 'number_of_pages': 183,
+                'covers': [12345], 'works': [{'key': '/works/OL1W'}],
+            },
+            {
+                'key': '/books/OL2M', 'title': 'Otro libro', 'isbn_10': ['0000000011'], 'publishers': ['Bantam'],
+                'publish_date': 'c1999', 'authors': [{'key': '/authors/OL2A'}],
+            },
+            {'key': '/books/OL3M', 'title': 'Sin ISBN', 'publishers': ['Bantam'], 'authors': [{'key': '/authors/OL2A'}]},
+            {'key': '/books/OL4M', 'title': 'Autor desconocido', 'isbn_10': ['0000000012'], 'publishers': ['Bantam']},
+        ], tsv=False)
+        
+        call_command('import_openlibrary', authors=authors, works=works, editions=editions, stdout=StringIO())
+        
+        self.assertEqual(Book.objects.count(), 2)
+        book = Book.objects.get(isbn='9780553383040')
+        self.assertEqual((book.title, book.publisher.name, str(book.publication_date), book.pages),
+                         ('A Wizard of Earthsea', 'Bantam', '2004-03-05', 183))
+        self.assertEqual(book.synopsis, 'Un mago en Terramar.')
+        self.assertEqual(book.cover_image_url, 'https://covers.openlibrary.org/b/id/12345-L.jpg')
+        self.assertEqual(list(book.authors.values_list('name', flat=True)), ['Ursula K. Le Guin'])
+        self.assertEqual(sorted(book.genres.values_list('name', flat=True)), ['Fantasy', 'Wizards'])
+        self.assertEqual(str(Book.objects.get(isbn='0000000011').publication_date), '1999-01-01')
+        self.assertEqual(list(search_books(Book.objects.all(), 'wizards')), [book])
@@ -1,11 +1,26 @@
 """
 Tests unitarios para modelos
 """
+import importlib
+from unittest import mock
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils import timezone
 from datetime import date, timedelta
-from api.models import Author, Publisher, Book, ReadingStatus, Review, Comment, Bookshelf
+from decimal import Decimal
+from io import StringIO
+from api.models import (
+    Author, Publisher, Book, ReadingStatus, ReadingYearSummary, Review, Comment, Bookshelf, bulk_operation,
+    trusted_write, validate_books_have_authors, MAX_COMMENT_DEPTH,
+)
+from api.summaries import compute_summaries, rebuild_summaries
 from api.tests.base import BaseTestCase
 
 
@@ -129,6 +144,56 @@ class BookModelTest(BaseTestCase):
         )
         # No debe lanzar excepción al crear (antes de save)
         book.clean()
+    
+    def test_book_remove_last_author(self):
+        """Test quitar el último autor de un libro (desde el libro o desde el autor) lanza error"""
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.book.authors.remove(self.author)
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.author.books.remove(self.book)
+        self.assertEqual(list(self.book.authors.all()), [self.author])
+    
+    def test_book_add_authors_without_existence_query(self):
+        """Test añadir autores no consulta si el libro tiene autores"""
+        other = Author.objects.create(name='Other Author')
+        with CaptureQueriesContext(connection) as queries:
+            self.book.authors.add(other)
+        self.assertFalse(any('LIMIT 1' in query['sql'] for query in queries))
+    
+    def test_book_bulk_operation_validates_once(self):
+        """Test dentro de bulk_operation se puede reasignar el único autor y se valida al final"""
+        other = Author.objects.create(name='Other Author')
+        with bulk_operation():
+            self.book.authors.set([other])
+        validate_books_have_authors([self.book.pk])
+        self.assertEqual(list(self.book.authors.all()), [other])
+        
+        with bulk_operation():
+            self.book.authors.clear()
+        with self.assertRaises(ValidationError):
+            validate_books_have_authors([self.book.pk])
+
+    def test_book_set_replacing_sole_author(self):
+        """Test set() fuera de bulk_operation no puede sustituir el único autor; en el admin sí"""
+        other = Author.objects.create(name='Other Author')
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.book.authors.set([other])
+        self.assertEqual(list(self.book.authors.all()), [self.author])
+
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass123')
+        self.client.force_login(admin_user)
+        url = reverse('admin:api_book_change', args=[self.book.pk])
+        data = {
+            'title': self.book.title, 'isbn': '9780123456789', 'synopsis': '', 'publication_date': '',
+            'pages': self.book.pages, 'cover_image_url': '', 'publisher': self.publisher.pk,
+        }
+        response = self.client.post(url, {**data, 'authors': [other.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(self.book.authors.all()), [other])
+        # Sin autores el formulario no se guarda
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.book.authors.all()), [other])
 
 
 class ReadingStatusModelTest(BaseTestCase):
@@ -221,6 +286,31 @@ class ReadingStatusModelTest(BaseTestCase):
         )
         status_max.clean()  # No debe lanzar excepción
 
+    def test_reading_status_trusted_write_skips_queries(self):
+        """Test trusted_write() guarda sin las consultas de unicidad y claves ajenas de full_clean()"""
+        status = ReadingStatus.objects.create(
+            user=self.user, book=self.book, status='R', started_at=date.today() - timedelta(days=7)
+        )
+        status.status = 'C'
+        status.finished_at = date.today()
+        status.save()
+        with CaptureQueriesContext(connection) as full:
+            status.save()
+        with CaptureQueriesContext(connection) as trusted:
+            with trusted_write():
+                status.save()
+        self.assertEqual(len(full) - len(trusted), 3)  # Usuario, libro y (usuario, libro) único
+        self.assertFalse(any('"api_readingstatus"."user_id" =' in query['sql'] for query in trusted.captured_queries))
+
+    def test_reading_status_trusted_write_keeps_business_rules(self):
+        """Test trusted_write() sigue aplicando clean() y la base de datos rechaza duplicados"""
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='R', started_at=date.today())
+        with trusted_write():
+            with self.assertRaises(ValidationError):
+                ReadingStatus(user=self.user, book=self.book, status='C').save()
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                ReadingStatus(user=self.user, book=self.book, status='N').save()
+
 
 class ReviewModelTest(BaseTestCase):
     """Tests para el modelo Review"""
@@ -309,6 +399,72 @@ class CommentModelTest(BaseTestCase):
         with self.assertRaises(ValidationError):
             comment.clean()
 
+    def reply(self, parent, text='Respuesta al comentario'):
+        return Comment.objects.create(user=self.user, review=self.review, parent_comment=parent, comment_text=text)
+
+    def test_comment_path(self):
+        """Test ruta materializada y nivel de las respuestas"""
+        first = self.reply(self.comment)
+        nested = self.reply(first)
+        self.assertEqual(self.comment.path, f'{self.comment.id:010d}')
+        self.assertEqual(nested.path, f'{self.comment.id:010d}{first.id:010d}{nested.id:010d}')
+        self.assertEqual(nested.depth, 2)
+        self.assertEqual(Comment.objects.get(pk=nested.pk).path, nested.path)
+        # El subárbol es un rango de rutas, en orden de hilo
+        second = self.reply(self.comment)
+        self.assertEqual(list(self.comment.descendants()), [first, nested, second])
+        self.assertEqual(list(first.descendants()), [nested])
+
+    def test_comment_move_subtree(self):
+        """Test cambiar de padre mueve la ruta de todas las respuestas"""
+        first = self.reply(self.comment)
+        nested = self.reply(first)
+        other = self.reply(None)
+        first.parent_comment = other
+        first.save()
+        nested.refresh_from_db()
+        self.assertEqual(nested.path, f'{other.id:010d}{first.id:010d}{nested.id:010d}')
+        self.assertEqual(nested.depth, 2)
+        self.assertEqual(list(self.comment.descendants()), [])
+
+        # Una respuesta propia no puede ser el nuevo padre
+        first = Comment.objects.get(pk=first.pk)
+        first.parent_comment = nested
+        with self.assertRaises(ValidationError):
+            first.save()
+
+    def test_comment_move_respects_max_depth(self):
+        """Test mover un hilo no puede dejar a sus respuestas por debajo del nivel máximo"""
+        deep = self.comment
+        for _ in range(MAX_COMMENT_DEPTH - 3):
+            deep = self.reply(deep)
+        thread = self.reply(None)
+        self.reply(self.reply(thread))  # Dos niveles de respuestas bajo thread
+
+        thread = Comment.objects.get(pk=thread.pk)
+        thread.parent_comment = deep  # thread en el nivel 48, sus respuestas en 49 y 50
+        with self.assertRaises(ValidationError):
+            thread.save()
+        self.assertEqual(Comment.objects.aggregate(Max('depth'))['depth__max'], MAX_COMMENT_DEPTH - 3)
+
+        # Un nivel más arriba sí cabe
+        thread.parent_comment = deep.parent_comment
+        thread.save()
+        self.assertEqual(Comment.objects.aggregate(Max('depth'))['depth__max'], MAX_COMMENT_DEPTH - 1)
+
+    def test_comment_path_backfill(self):
+        """Test la migración calcula por lotes la ruta de los comentarios existentes"""
+        from django.apps import apps
+        migration = importlib.import_module('api.migrations.0010_comment_path')
+        nested = self.reply(self.reply(self.comment))
+        expected = dict(Comment.objects.values_list('pk', 'path'))
+        Comment.objects.update(path='', depth=0)
+
+        with mock.patch.object(migration, 'BACKFILL_BATCH_SIZE', 1):
+            migration.backfill_comment_paths(apps, None)
+        self.assertEqual(dict(Comment.objects.values_list('pk', 'path')), expected)
+        self.assertEqual(Comment.objects.get(pk=nested.pk).depth, 2)
+
 
 class BookshelfModelTest(BaseTestCase):
     """Tests para el modelo Bookshelf"""
@@ -331,3 +487,205 @@ class BookshelfModelTest(BaseTestCase):
                 name='Test Bookshelf',  # Mismo nombre para mismo usuario
                 description='Another description'
             )
+
+
+class BookCountersTest(BaseTestCase):
+    """Tests para los contadores desnormalizados de Book"""
+    
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass123')
+    
+    def test_counters_on_create(self):
+        """Test contadores al crear estados de lectura y reseñas"""
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='C', rating=4, finished_at=date.today())
+        ReadingStatus.objects.create(user=self.other_user, book=self.book, status='N')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.reader_count, 2)
+        self.assertEqual(self.book.rating_count, 1)
+        self.assertEqual(self.book.rating_avg, Decimal('4.00'))
+        self.assertEqual(self.book.review_count, 1)  # La reseña del setUp
+    
+    def test_counters_on_update(self):
+        """Test contadores al cambiar la calificación o el libro"""
+        status = ReadingStatus.objects.create(user=self.user, book=self.book, status='C', rating=4, finished_at=date.today())
+        ReadingStatus.objects.create(user=self.other_user, book=self.book, status='C', rating=3, finished_at=date.today())
+        status.rating = 5
+        status.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 2)
+        self.assertEqual(self.book.rating_avg, Decimal('4.00'))
+        
+        # Recargado desde la base de datos: se resta la calificación anterior, no la nueva
+        status = ReadingStatus.objects.get(pk=status.pk)
+        status.rating = None
+        status.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.rating_count, 1)
+        self.assertEqual(self.book.rating_avg, Decimal('3.00'))
+        
+        new_book = Book.objects.create(title='Another Book', isbn='978-0-987-65432-1', publisher=self.publisher)
+        new_book.authors.add(self.author)
+        self.review.book = new_book
+        self.review.save()
+        self.book.refresh_from_db()
+        new_book.refresh_from_db()
+        self.assertEqual(self.book.review_count, 0)
+        self.assertEqual(new_book.review_count, 1)
+    
+    def test_counters_on_delete(self):
+        """Test contadores al borrar estados de lectura y reseñas"""
+        status = ReadingStatus.objects.create(user=self.user, book=self.book, status='C', rating=4.5, finished_at=date.today())
+        ReadingStatus.objects.filter(pk=status.pk).first().delete()
+        self.review.delete()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.reader_count, 0)
+        self.assertEqual(self.book.rating_count, 0)
+        self.assertIsNone(self.book.rating_avg)
+        self.assertEqual(self.book.review_count, 0)
+    
+    def test_recompute_command_repairs_drift(self):
+        """Test que recompute_book_counters corrige contadores desviados"""
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='C', rating=2, finished_at=date.today())
+        ReadingStatus.objects.bulk_create([
+            ReadingStatus(user=self.other_user, book=self.book, status='C', rating=5, finished_at=date.today())
+        ])  # bulk_create no dispara señales
+        Book.objects.filter(pk=self.book.pk).update(review_count=7)
+        
+        call_command('recompute_book_counters', batch_size=1, stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.reader_count, 2)
+        self.assertEqual(self.book.rating_count, 2)
+        self.assertEqual(self.book.rating_avg, Decimal('3.50'))
+        self.assertEqual(self.book.review_count, 1)
+
+
+class ReviewCountersTest(BaseTestCase):
+    """Tests para los contadores de comentarios de Review"""
+
+    def test_counters_on_create_and_delete(self):
+        """Test comentarios y respuestas suman y al borrarlos se restan"""
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.comment_count, 1)  # El comentario del setUp
+        self.assertEqual(self.review.last_comment_at, self.comment.created_at)
+
+        reply = Comment.objects.create(user=self.user, review=self.review, parent_comment=self.comment, comment_text='Una respuesta')
+        Comment.objects.create(user=self.user, review=self.review, parent_comment=reply, comment_text='Otra respuesta')
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.comment_count, 3)
+        self.assertGreaterEqual(self.review.last_comment_at, reply.created_at)
+
+        # Borrar una respuesta borra también las suyas
+        reply.delete()
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.comment_count, 1)
+        self.assertEqual(self.review.last_comment_at, self.comment.created_at)
+        self.comment.delete()
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.comment_count, 0)
+        self.assertIsNone(self.review.last_comment_at)
+
+    def test_recompute_command_repairs_drift(self):
+        """Test que recompute_review_counters corrige contadores desviados"""
+        Comment.objects.bulk_create([
+            Comment(user=self.user, review=self.review, comment_text='Comentario masivo')
+        ])  # bulk_create no dispara señales
+        Review.objects.filter(pk=self.review.pk).update(comment_count=7, last_comment_at=None)
+
+        call_command('recompute_review_counters', batch_size=1, stdout=StringIO())
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.comment_count, 2)
+        self.assertEqual(self.review.last_comment_at, Comment.objects.latest('created_at').created_at)
+
+
+class ReadingYearSummaryTest(BaseTestCase):
+    """Tests para el resumen anual de lectura mantenido por señales"""
+
+    def setUp(self):
+        super().setUp()
+        self.year = date.today().year - 1
+        self.long_book = Book.objects.create(title='Long Book', isbn='978-0-987-65432-1', publisher=self.publisher, pages=900)
+        self.long_book.authors.add(self.author)
+        self.long_book.genres.add(self.genre)
+
+    def finish(self, book, rating=None, month=6):
+        return ReadingStatus.objects.create(
+            user=self.user, book=book, status='C', rating=rating,
+            started_at=date(self.year, month, 1), finished_at=date(self.year, month, 20),
+        )
+
+    def assertMatchesRebuild(self):
+        """El resumen mantenido por diferencia coincide con el recalculado desde cero"""
+        fields = ['books', 'pages', 'genre_counts', 'author_counts', 'rating_histogram',
+                  'longest_book_id', 'longest_pages', 'shortest_book_id', 'shortest_pages']
+        incremental = [
+            {field: getattr(summary, field) for field in ['year'] + fields}
+            for summary in ReadingYearSummary.objects.filter(user=self.user).order_by('year')
+        ]
+        rebuilt = sorted(
+            ({field: summary[field] for field in ['year'] + fields} for summary in compute_summaries([self.user.pk])),
+            key=lambda summary: summary['year'],
+        )
+        self.assertEqual(incremental, rebuilt)
+
+    def test_summary_on_finish(self):
+        """Test terminar libros suma libros, páginas, géneros, autores y calificaciones"""
+        self.finish(self.book, rating=4)
+        self.finish(self.long_book, rating=4.5)
+        ReadingStatus.objects.create(user=self.user, book=Book.objects.create(
+            title='Unread', isbn='978-0-987-65432-2', publisher=self.publisher, pages=50
+        ), status='N')
+
+        summary = ReadingYearSummary.objects.get(user=self.user, year=self.year)
+        self.assertEqual(summary.books, 2)
+        self.assertEqual(summary.pages, 1200)
+        self.assertEqual(summary.genre_counts, {'Fiction': 2})
+        self.assertEqual(summary.author_counts, {'Test Author': 2})
+        self.assertEqual(summary.rating_histogram, {'4': 1, '4.5': 1})
+        self.assertEqual((summary.longest_book_id, summary.shortest_book_id), (self.long_book.pk, self.book.pk))
+        self.assertMatchesRebuild()
+
+    def test_summary_on_update_and_delete(self):
+        """Test cambiar la calificación, el año o el estado y borrar actualizan el resumen"""
+        status = self.finish(self.book, rating=4)
+        long_status = self.finish(self.long_book, rating=5)
+
+        status = ReadingStatus.objects.get(pk=status.pk)
+        status.rating = 3
+        status.save()
+        self.assertMatchesRebuild()
+
+        # Quitar el libro más largo recalcula los extremos
+        long_status = ReadingStatus.objects.get(pk=long_status.pk)
+        long_status.status, long_status.rating, long_status.finished_at = 'R', None, None
+        long_status.save()
+        summary = ReadingYearSummary.objects.get(user=self.user, year=self.year)
+        self.assertEqual((summary.books, summary.longest_book_id), (1, self.book.pk))
+        self.assertMatchesRebuild()
+
+        # Cambia de año
+        status.finished_at = date(self.year - 1, 12, 31)
+        status.started_at = date(self.year - 1, 12, 1)
+        status.save()
+        self.assertFalse(ReadingYearSummary.objects.filter(user=self.user, year=self.year).exists())
+        self.assertMatchesRebuild()
+
+        status.delete()
+        self.assertFalse(ReadingYearSummary.objects.filter(user=self.user).exists())
+
+    def test_rebuild_summaries(self):
+        """Test reconstruir desde cero repara resúmenes desviados y borra los sobrantes"""
+        self.finish(self.book, rating=4)
+        other_user = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass123')
+        ReadingYearSummary.objects.filter(user=self.user).update(books=10, pages=0)
+        ReadingYearSummary.objects.create(user=other_user, year=self.year, books=3)
+
+        call_command('rebuild_reading_summaries', chunk_size=1, stdout=StringIO())
+        summary = ReadingYearSummary.objects.get(user=self.user, year=self.year)
+        self.assertEqual((summary.books, summary.pages), (1, 300))
+        self.assertFalse(ReadingYearSummary.objects.filter(user=other_user).exists())
+
+        ReadingYearSummary.objects.all().delete()
+        rebuild_summaries([self.user.pk])
+        self.assertMatchesRebuild()
+        self.assertTrue(ReadingYearSummary.objects.filter(user=self.user, year=self.year).exists())
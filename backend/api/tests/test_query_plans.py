@@ -0,0 +1,150 @@
+"""
+Planes de consulta de los listados.
+
+Con un conjunto de datos sembrado de varios miles de filas de otros usuarios,
+cada consulta de los endpoints de listado se pasa por EXPLAIN: ninguna puede
+recorrer una tabla entera y la ordenación por defecto debe salir del índice,
+sin ordenar en memoria.
+"""
+import json
+import re
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+from api.models import Author, Book, Bookshelf, BookshelfEntry, Comment, Genre, Publisher, ReadingStatus, Review
+from api.tests.base import BaseAPITestCase
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)')
+
+
+def explain(sql, params):
+    """
+    Problemas del plan de una consulta: tablas recorridas enteras y
+    ordenaciones en memoria (SQLite o PostgreSQL)
+    """
+    scans, sorts = [], []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            nodes = [(json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    scans.append(f'Seq Scan on {node["Relation Name"]}')
+                elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+                    sorts.append(f'{node["Node Type"]} by {node["Sort Key"]}')
+                nodes.extend(node.get('Plans', []))
+        else:
+            tables = set(connection.introspection.table_names(cursor))
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            for row in cursor.fetchall():
+                detail = row[-1]
+                match = SQLITE_FULL_SCAN.match(detail)
+                # Las subconsultas y CTE también aparecen como SCAN: solo cuentan las tablas
+                if match and match.group(1) in tables:
+                    scans.append(detail)
+                elif detail == 'USE TEMP B-TREE FOR ORDER BY':
+                    sorts.append(detail)
+    return scans, sorts
+
+
+class QueryPlanTest(BaseAPITestCase):
+    """Tests de los planes de consulta de los listados sobre un conjunto de datos grande"""
+
+    USERS = 30
+    BOOKS = 200
+    PER_USER = 100
+
+    def setUp(self):
+        super().setUp()
+        users = User.objects.bulk_create([User(username=f'plan-user-{index}') for index in range(self.USERS)])
+        users.append(self.user)
+        publishers = Publisher.objects.bulk_create([Publisher(name=f'Plan Publisher {index}') for index in range(50)])
+        authors = Author.objects.bulk_create([Author(name=f'Plan Author {index}') for index in range(50)])
+        genres = Genre.objects.bulk_create([Genre(name=f'Plan Genre {index}') for index in range(20)])
+        books = Book.objects.bulk_create([
+            Book(title=f'Plan Book {index}', isbn=f'978-3-000-{index:05d}-0', publisher=publishers[index % 50])
+            for index in range(self.BOOKS)
+        ])
+        Book.authors.through.objects.bulk_create([
+            Book.authors.through(book=book, author=authors[index % 50]) for index, book in enumerate(books)
+        ])
+        Book.genres.through.objects.bulk_create([
+            Book.genres.through(book=book, genre=genres[index % 20]) for index, book in enumerate(books)
+        ])
+        today = date.today()
+        ReadingStatus.objects.bulk_create([
+            ReadingStatus(user=user, book=book, status='R', started_at=today - timedelta(days=offset))
+            for user in users for offset, book in enumerate(books[:self.PER_USER])
+        ])
+        reviews = Review.objects.bulk_create([
+            Review(user=user, book=book, review_text='Reseña sembrada para los planes de consulta.')
+            for user in users for book in books[:self.PER_USER]
+        ])
+        Comment.objects.bulk_create([
+            Comment(user=user, review=review, comment_text='Comentario sembrado')
+            for review in reviews[::10] for user in users[:10]
+        ])
+        shelves = Bookshelf.objects.bulk_create([
+            Bookshelf(user=user, name=f'Plan Shelf {index}') for user in users for index in range(5)
+        ])
+        BookshelfEntry.objects.bulk_create([
+            BookshelfEntry(bookshelf=shelf, book=book) for shelf in shelves for book in books[:20]
+        ])
+        # Estadísticas para el planificador, como en una base de datos en uso
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertIndexedPlans(self, url, params=None, ordered_table=None):
+        """
+        Pide el listado y comprueba el plan de cada SELECT que lanza. Con
+        ``ordered_table``, la consulta ordenada sobre esa tabla tampoco puede
+        ordenar en memoria (la ordenación debe salir del índice)
+        """
+        queries = []
+
+        def capture(execute, sql, sql_params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, sql_params))
+            return execute(sql, sql_params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        ordered = [sql for sql, _ in queries if f'FROM "{ordered_table}"' in sql and 'ORDER BY' in sql]
+        if ordered_table:
+            self.assertTrue(ordered)
+        for sql, sql_params in queries:
+            scans, sorts = explain(sql, sql_params)
+            self.assertEqual(scans, [], sql)
+            if sql in ordered:
+                self.assertEqual(sorts, [], sql)
+
+    def test_reading_statuses_plan(self):
+        """Test estados de lectura del usuario ordenados por fecha de inicio"""
+        self.assertIndexedPlans(reverse('reading-status-list'), ordered_table='api_readingstatus')
+
+    def test_reviews_plan(self):
+        """Test reseñas del usuario y reseñas de un libro"""
+        self.assertIndexedPlans(reverse('review-list'), ordered_table='api_review')
+        book = Book.objects.get(title='Plan Book 0')
+        self.assertIndexedPlans(reverse('book-reviews-list', kwargs={'book_pk': book.id}), ordered_table='api_review')
+
+    def test_comments_plan(self):
+        """Test comentarios de una reseña en orden de conversación"""
+        review = Review.objects.filter(comments__isnull=False).first()
+        self.assertIndexedPlans(
+            reverse('review-comments-list', kwargs={'review_pk': review.id}), ordered_table='api_comment'
+        )
+
+    def test_bookshelves_plan(self):
+        """Test estanterías del usuario y libros de una estantería"""
+        self.assertIndexedPlans(reverse('bookshelf-list'), ordered_table='api_bookshelf')
+        self.assertIndexedPlans(reverse('bookshelf-list'), {'view': 'summary'}, ordered_table='api_bookshelf')
+        shelf = Bookshelf.objects.filter(user=self.user).first()
+        self.assertIndexedPlans(reverse('bookshelf-books', kwargs={'pk': shelf.id}), {'ordering': 'added_at'})
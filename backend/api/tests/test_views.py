@@ -1,12 +1,22 @@
 """
 Tests de integración para views/API
 """
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import RefreshToken
-from api.models import Author, Publisher, Book, Review, Comment, Bookshelf, ReadingStatus
+from api.models import Author, Publisher, Book, Review, Comment, Bookshelf, BookshelfEntry, ReadingStatus
+from api import response_cache
 from api.tests.base import BaseAPITestCase
 
 
@@ -83,6 +93,24 @@ class BookAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Book.objects.count(), 2)
     
+    def test_create_book_without_authors(self):
+        """Test crear libro sin autores"""
+        url = reverse('book-list')
+        data = {'title': 'New Book', 'isbn': '978-0-987-65432-1', 'publisher': self.publisher.id, 'authors': []}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('authors', response.data['details'])
+    
+    def test_update_book_replaces_only_author(self):
+        """Test sustituir el único autor de un libro"""
+        other = Author.objects.create(name='Other Author')
+        url = reverse('book-detail', kwargs={'pk': self.book.id})
+        response = self.client.patch(url, {'authors': [other.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(self.book.authors.all()), [other])
+        response = self.client.patch(url, {'authors': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
     def test_create_book_invalid_isbn(self):
         """Test crear libro con ISBN inválido"""
         url = reverse('book-list')
@@ -116,6 +144,194 @@ class BookAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data['results']), 0)
 
+    def test_filter_and_order_books_by_rating(self):
+        """Test filtrar y ordenar libros por calificación media"""
+        new_book = Book.objects.create(title='Another Book', isbn='978-0-987-65432-1', publisher=self.publisher)
+        new_book.authors.add(self.author)
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='C', rating=3, finished_at=date.today())
+        ReadingStatus.objects.create(user=self.user, book=new_book, status='C', rating=4.5, finished_at=date.today())
+        url = reverse('book-list')
+        
+        response = self.client.get(url, {'ordering': '-rating_avg'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data['results']], [new_book.id, self.book.id])
+        self.assertEqual(response.data['results'][0]['rating_avg'], '4.50')
+        self.assertEqual(response.data['results'][0]['reader_count'], 1)
+        self.assertNotIn('rating_sum', response.data['results'][0])
+        
+        response = self.client.get(url, {'min_rating': 4})
+        self.assertEqual([book['id'] for book in response.data['results']], [new_book.id])
+
+    def test_autocomplete_books(self):
+        """Test autocompletado devuelve solo los campos necesarios"""
+        url = reverse('book-autocomplete')
+        response = self.client.get(url, {'q': 'test bo'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{
+            'id': self.book.id,
+            'title': 'Test Book',
+            'author': 'Test Author',
+            'cover_image_url': '',
+        }])
+
+    def test_autocomplete_typo_tolerant(self):
+        """Test autocompletado tolera erratas"""
+        url = reverse('book-autocomplete')
+        response = self.client.get(url, {'q': 'Test Autor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book['id'] for book in response.data], [self.book.id])
+
+    def test_autocomplete_short_query(self):
+        """Test autocompletado con consulta demasiado corta"""
+        url = reverse('book-autocomplete')
+        response = self.client.get(url, {'q': 'T'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_autocomplete_cache_invalidated_on_new_book(self):
+        """Test la caché de autocompletado se invalida al crear libros"""
+        url = reverse('book-autocomplete')
+        self.assertEqual(self.client.get(url, {'q': 'nuevo'}).data, [])
+
+        new_book = Book.objects.create(title='Nuevo libro', isbn='978-0-987-65432-9', publisher=self.publisher)
+        new_book.authors.add(self.author)
+        response = self.client.get(url, {'q': 'nuevo'})
+        self.assertEqual([book['id'] for book in response.data], [new_book.id])
+
+
+class CatalogueResponseCacheTest(BaseAPITestCase):
+    """Tests para la caché de respuestas del catálogo"""
+    
+    def test_repeated_list_is_served_from_cache(self):
+        """Test la segunda petición igual se sirve desde la caché"""
+        url = reverse('book-list')
+        first = self.client.get(url, {'ordering': 'title', 'page_size': 10})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            # Mismos parámetros en otro orden
+            second = self.client.get(url, {'page_size': 10, 'ordering': 'title'})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertFalse([query for query in queries if 'api_book' in query['sql']])
+    
+    def test_author_change_only_evicts_related_responses(self):
+        """Test cambiar un autor invalida sus libros pero no el resto del catálogo"""
+        other_author = Author.objects.create(name='Other Author')
+        other_book = Book.objects.create(title='Other Book', isbn='978-0-987-65432-1', publisher=self.publisher)
+        other_book.authors.add(other_author)
+        urls = {
+            'books': reverse('book-list'),
+            'book': reverse('book-detail', kwargs={'pk': self.book.id}),
+            'other_book': reverse('book-detail', kwargs={'pk': other_book.id}),
+            'publishers': reverse('publisher-list'),
+            'other_author': reverse('author-detail', kwargs={'pk': other_author.id}),
+        }
+        for url in urls.values():
+            self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        
+        self.author.name = 'Renamed Author'
+        self.author.save()
+        
+        response = self.client.get(urls['book'])
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['authors'], ['Renamed Author'])
+        self.assertEqual(self.client.get(urls['books'])['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(urls['other_book'])['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(urls['publishers'])['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(urls['other_author'])['X-Cache'], 'HIT')
+    
+    def test_counter_update_evicts_book_detail(self):
+        """Test los contadores actualizados por señales invalidan el detalle del libro"""
+        url = reverse('book-detail', kwargs={'pk': self.book.id})
+        self.assertIsNone(self.client.get(url).data['rating_avg'])
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='C', rating=4, finished_at=date.today())
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['rating_avg'], '4.00')
+    
+    def test_cache_stats_command(self):
+        """Test el comando muestra los aciertos y fallos"""
+        response_cache.reset_stats()
+        url = reverse('genre-list')
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(response_cache.get_stats(), {'hits': 1, 'misses': 1})
+        out = StringIO()
+        call_command('response_cache_stats', reset=True, stdout=out)
+        self.assertIn('Tasa de aciertos: 50.0%', out.getvalue())
+        self.assertEqual(response_cache.get_stats(), {'hits': 0, 'misses': 0})
+
+
+class ConditionalGetTest(BaseAPITestCase):
+    """Tests para ETag y Last-Modified"""
+    
+    def test_book_list_not_modified(self):
+        """Test If-None-Match con el ETag actual devuelve 304 sin consultar libros"""
+        url = reverse('book-list')
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([query for query in queries if 'api_book' in query['sql']])
+        
+        etag = response['ETag']
+        self.book.title = 'Changed Title'
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_reading_statuses_etag_is_per_user(self):
+        """Test el ETag de los estados de lectura no cambia con los datos de otros usuarios"""
+        url = reverse('reading-status-list')
+        other_book = Book.objects.create(title='Other Book', isbn='978-0-987-65432-1', publisher=self.publisher)
+        other_book.authors.add(self.author)
+        etag = self.client.get(url)['ETag']
+        Bookshelf.objects.create(user=self.other_user, name='Other Bookshelf')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([query for query in queries if 'api_readingstatus' in query['sql']])
+        
+        ReadingStatus.objects.create(user=self.user, book=other_book, status='N')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+    
+    def test_reading_statuses_etag_follows_book_counters(self):
+        """Test la calificación de otro usuario cambia el ETag de quien muestra el libro"""
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='N')
+        url = reverse('reading-status-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIsNone(response.data['results'][0]['book_detail']['rating_avg'])
+        stats_etag = self.client.get(reverse('reading-status-stats'))['ETag']
+
+        ReadingStatus.objects.create(user=self.other_user, book=self.book, status='C', rating=5, finished_at=date.today())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['book_detail']['rating_avg'], '5.00')
+        # Las estadísticas del usuario no muestran contadores: siguen vigentes
+        response = self.client.get(reverse('reading-status-stats'), HTTP_IF_NONE_MATCH=stats_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_bookshelf_books_if_modified_since(self):
+        """Test If-Modified-Since en los libros de una estantería"""
+        url = reverse('bookshelf-books', kwargs={'pk': self.bookshelf.id})
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        etag = response['ETag']
+        self.client.post(reverse('bookshelf-add-book', kwargs={'pk': self.bookshelf.id}), {'book_id': self.book.id}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIn('no-cache', response['Cache-Control'])
+
 
 class ReviewAPITest(BaseAPITestCase):
     """Tests para Review API"""
@@ -127,6 +343,17 @@ class ReviewAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('count', response.data)
         self.assertIn('results', response.data)
+
+    def test_list_reviews_most_discussed(self):
+        """Test reseñas de un libro ordenadas por número de comentarios"""
+        other_user = User.objects.create_user(username='quietreviewer', password='testpass123')
+        quiet = Review.objects.create(user=other_user, book=self.book, review_text='Otra reseña sin comentarios.')
+        url = reverse('book-reviews-list', kwargs={'book_pk': self.book.id})
+        response = self.client.get(url, {'ordering': '-comment_count'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([review['id'] for review in response.data['results']], [self.review.id, quiet.id])
+        self.assertEqual(response.data['results'][0]['comment_count'], 1)
+        self.assertIsNotNone(response.data['results'][0]['last_comment_at'])
     
     def test_create_review_unauthorized(self):
         """Test crear reseña sin autenticación"""
@@ -190,11 +417,10 @@ class ReviewAPITest(BaseAPITestCase):
         response1 = self.client.post(url, data, format='json')
         self.assertEqual(response1.status_code, status.HTTP_201_CREATED)
         
-        # Segunda reseña (debería fallar por ValidationError del modelo)
-        # El test falla porque el handler no está funcionando, lo comentamos por ahora
-        # response2 = self.client.post(url, data, format='json')
-        # self.assertEqual(response2.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
-        self.assertTrue(True)  # Test placeholder
+        # Segunda reseña: la rechaza la restricción única de la base de datos
+        response2 = self.client.post(url, data, format='json')
+        self.assertEqual(response2.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Review.objects.filter(book=new_book).count(), 1)
 
 
 class CommentAPITest(BaseAPITestCase):
@@ -230,6 +456,61 @@ class CommentAPITest(BaseAPITestCase):
         self.assertEqual(Comment.objects.count(), 2)
         self.assertEqual(Comment.objects.last().parent_comment, self.comment)
 
+    def test_list_comments_tree(self):
+        """Test hilo de comentarios anidado y paginado por comentarios principales"""
+        def reply(parent, text):
+            return Comment.objects.create(user=self.user, review=self.review, parent_comment=parent, comment_text=text)
+
+        first_reply = reply(self.comment, 'First reply')
+        reply(first_reply, 'Nested reply')
+        reply(self.comment, 'Second reply')
+        second_root = reply(None, 'Second root comment')
+        reply(second_root, 'Reply to second root')
+
+        url = reverse('review-comments-list', kwargs={'review_pk': self.review.id})
+        response = self.client.get(url, {'tree': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        root = response.data['results'][0]
+        self.assertEqual(root['id'], self.comment.id)
+        self.assertEqual([node['comment_text'] for node in root['replies']], ['First reply', 'Second reply'])
+        self.assertEqual(root['replies'][0]['replies'][0]['comment_text'], 'Nested reply')
+        self.assertEqual(root['replies'][0]['replies'][0]['parent_comment'], first_reply.id)
+        self.assertEqual(response.data['results'][1]['replies'][0]['comment_text'], 'Reply to second root')
+
+        # Número fijo de consultas sea cual sea la profundidad del hilo
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url, {'tree': '1'})
+        parent = first_reply
+        for depth in range(5):
+            parent = reply(parent, f'Deep reply {depth}')
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, {'tree': '1', 'page_size': 1})
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_comment_thread(self):
+        """Test subárbol de un comentario y orden de hilo por ruta"""
+        first = Comment.objects.create(user=self.user, review=self.review, parent_comment=self.comment, comment_text='First reply')
+        Comment.objects.create(user=self.user, review=self.review, parent_comment=first, comment_text='Nested reply')
+        other = Comment.objects.create(user=self.user, review=self.review, comment_text='Other root comment')
+
+        url = reverse('review-comments-thread', kwargs={'review_pk': self.review.id, 'pk': first.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], first.id)
+        self.assertEqual(response.data['depth'], 1)
+        self.assertEqual([node['comment_text'] for node in response.data['replies']], ['Nested reply'])
+
+        # ?ordering=path recorre los hilos en profundidad
+        Comment.objects.create(user=self.user, review=self.review, parent_comment=self.comment, comment_text='Late reply')
+        url = reverse('review-comments-list', kwargs={'review_pk': self.review.id})
+        response = self.client.get(url, {'ordering': 'path'})
+        self.assertEqual(
+            [comment['comment_text'] for comment in response.data['results']],
+            [self.comment.comment_text, 'First reply', 'Nested reply', 'Late reply', other.comment_text],
+        )
+
 
 class BookshelfAPITest(BaseAPITestCase):
     """Tests para Bookshelf API"""
@@ -292,6 +573,168 @@ class BookshelfAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data), 0)
 
+    def test_add_books_to_bookshelf_in_bulk(self):
+        """Test añadir varios libros a una estantería con resultado por id"""
+        books = [
+            Book.objects.create(title=f'Bulk {index}', isbn=f'978-5-000-{index:05d}-0', publisher=self.publisher)
+            for index in range(30)
+        ]
+        self.bookshelf.entries.create(book=self.book)
+        book_ids = [self.book.id] + [book.id for book in books] + [999999]
+        
+        url = reverse('bookshelf-add-books', kwargs={'pk': self.bookshelf.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'book_ids': book_ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(len(queries), 15)  # No depende del número de libros
+        statuses = {result['book_id']: result['status'] for result in response.data['data']['results']}
+        self.assertEqual(statuses[self.book.id], 'already_present')
+        self.assertEqual(statuses[999999], 'not_found')
+        self.assertEqual([statuses[book.id] for book in books], ['added'] * 30)
+        self.assertEqual(self.bookshelf.entries.count(), 31)
+    
+    def test_add_books_to_bookshelf_invalid_payload(self):
+        """Test añadir libros en bloque sin lista de ids"""
+        url = reverse('bookshelf-add-books', kwargs={'pk': self.bookshelf.id})
+        response = self.client.post(url, {'book_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('book_ids', response.data['details'])
+    
+    def test_remove_books_from_bookshelf_in_bulk(self):
+        """Test quitar varios libros de una estantería con resultado por id"""
+        other_book = Book.objects.create(title='Not Shelved', isbn='978-0-987-65432-1', publisher=self.publisher)
+        self.bookshelf.entries.create(book=self.book)
+        
+        url = reverse('bookshelf-remove-books', kwargs={'pk': self.bookshelf.id})
+        response = self.client.post(url, {'book_ids': [self.book.id, other_book.id, 999999]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['data']['results']],
+            ['removed', 'not_in_shelf', 'not_found'],
+        )
+        self.assertEqual(self.bookshelf.entries.count(), 0)
+    
+    def test_list_books_in_bookshelf_paginated(self):
+        """Test libros de una estantería paginados por clave y ordenados por fecha de añadido"""
+        other_shelf = Bookshelf.objects.create(user=self.user, name='Other Shelf')
+        titles = ['Zeta', 'Alpha', 'Mu', 'Beta', 'Omega']
+        for index, title in enumerate(titles):
+            book = Book.objects.create(title=title, isbn=f'978-3-000-{index:05d}-0', publisher=self.publisher)
+            book.authors.add(self.author)
+            self.bookshelf.entries.create(book=book)
+        # El mismo libro en otra estantería no debe duplicar resultados
+        other_shelf.entries.create(book=Book.objects.get(title='Zeta'))
+        
+        url = reverse('bookshelf-books', kwargs={'pk': self.bookshelf.id})
+        seen = []
+        response = self.client.get(url, {'ordering': 'added_at', 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [book['title'] for book in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, titles)
+        
+        response = self.client.get(url, {'title': 'ta'})
+        self.assertEqual([book['title'] for book in response.data['results']], ['Beta', 'Zeta'])
+        
+        response = self.client.get(url, {'search': 'omega'})
+        self.assertEqual([book['title'] for book in response.data['results']], ['Omega'])
+    
+    def test_list_books_in_bookshelf_search_by_relevance(self):
+        """Test la búsqueda en una estantería ordena por relevancia y pagina por páginas"""
+        for index, (title, synopsis) in enumerate([('Alpha', 'Un ensayo sobre la soledad'), ('Soledad', ''), ('Gamma', '')]):
+            book = Book.objects.create(title=title, isbn=f'978-3-100-{index:05d}-0', synopsis=synopsis, publisher=self.publisher)
+            book.authors.add(self.author)
+            self.bookshelf.entries.create(book=book)
+
+        url = reverse('bookshelf-books', kwargs={'pk': self.bookshelf.id})
+        response = self.client.get(url, {'search': 'soledad', 'page_size': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        seen = [book['title'] for book in response.data['results']]
+        response = self.client.get(response.data['next'])
+        seen += [book['title'] for book in response.data['results']]
+        self.assertEqual(seen, ['Soledad', 'Alpha'])
+        self.assertIsNone(response.data['next'])
+
+    def test_list_books_in_bookshelf_streaming(self):
+        """Test listado completo de libros de una estantería en streaming"""
+        for index in range(3):
+            book = Book.objects.create(title=f'Stream {index}', isbn=f'978-4-000-{index:05d}-0', publisher=self.publisher)
+            book.authors.add(self.author)
+            self.bookshelf.entries.create(book=book)
+        
+        url = reverse('bookshelf-books', kwargs={'pk': self.bookshelf.id})
+        response = self.client.get(url, {'all': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([book['title'] for book in data], ['Stream 0', 'Stream 1', 'Stream 2'])
+        self.assertEqual(data[0]['authors'], ['Test Author'])
+    
+    def test_list_books_in_other_users_bookshelf(self):
+        """Test no se pueden listar libros de estanterías ajenas"""
+        other_shelf = Bookshelf.objects.create(user=self.other_user, name='Private Shelf')
+        response = self.client.get(reverse('bookshelf-books', kwargs={'pk': other_shelf.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_list_bookshelves_query_count_is_flat(self):
+        """Test el número de consultas no crece con las estanterías ni con los libros"""
+        url = reverse('bookshelf-list')
+        
+        def add_shelves(start, count):
+            for index in range(start, start + count):
+                bookshelf = Bookshelf.objects.create(user=self.user, name=f'Shelf {index}')
+                for offset in range(5):
+                    book = Book.objects.create(
+                        title=f'Book {index}-{offset}', isbn=f'978-1-{index:03d}-{offset:05d}-0', publisher=self.publisher
+                    )
+                    book.authors.add(self.author)
+                    book.genres.add(self.genre)
+                    bookshelf.entries.create(book=book)
+        
+        add_shelves(0, 2)
+        with CaptureQueriesContext(connection) as few_shelves:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        add_shelves(2, 6)
+        with CaptureQueriesContext(connection) as many_shelves:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(many_shelves), len(few_shelves))
+        
+        shelf = next(shelf for shelf in response.data['results'] if shelf['name'] == 'Shelf 7')
+        self.assertEqual(shelf['book_count'], 5)
+        self.assertEqual([book['title'] for book in shelf['auto_cover_books']], [f'Book 7-{offset}' for offset in range(4)])
+
+    def test_list_bookshelves_summary_view(self):
+        """Test vista resumen de estanterías sin las entradas completas"""
+        for offset in range(6):
+            book = Book.objects.create(title=f'Shelf Book {offset}', isbn=f'978-2-000-{offset:05d}-0', publisher=self.publisher)
+            book.authors.add(self.author)
+            self.bookshelf.entries.create(book=book)
+        
+        url = reverse('bookshelf-list')
+        response = self.client.get(url, {'view': 'summary'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        shelf = response.data['results'][0]
+        self.assertNotIn('entries', shelf)
+        self.assertEqual(shelf['book_count'], 6)
+        self.assertEqual([book['title'] for book in shelf['auto_cover_books']], [f'Shelf Book {offset}' for offset in range(4)])
+        latest = self.bookshelf.entries.order_by('-added_at').first().added_at
+        self.assertEqual(shelf['last_updated'], latest.isoformat().replace('+00:00', 'Z'))
+        
+        # Estantería vacía: la fecha de actualización es la de creación
+        empty = Bookshelf.objects.create(user=self.user, name='Empty Shelf')
+        response = self.client.get(reverse('bookshelf-detail', kwargs={'pk': empty.id}), {'view': 'summary'})
+        self.assertEqual(response.data['book_count'], 0)
+        self.assertEqual(response.data['auto_cover_books'], [])
+        self.assertIsNotNone(response.data['last_updated'])
+
 
 class ReadingStatusAPITest(BaseAPITestCase):
     """Tests para ReadingStatus API"""
@@ -318,6 +761,122 @@ class ReadingStatusAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(ReadingStatus.objects.count(), 1)
     
+    def test_create_duplicate_reading_status(self):
+        """Test crear un segundo estado de lectura para el mismo libro"""
+        url = reverse('reading-status-list')
+        data = {'book': self.book.id, 'status': 'R', 'started_at': '2024-01-01'}
+        self.assertEqual(self.client.post(url, data, format='json').status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertTrue(response.data['error'])
+        self.assertEqual(ReadingStatus.objects.filter(user=self.user).count(), 1)
+
+    def test_update_reading_status_validates_once(self):
+        """Test actualizar un estado de lectura sin repetir en el modelo las consultas del serializer"""
+        reading_status = ReadingStatus.objects.create(user=self.user, book=self.book, status='R', started_at='2024-01-01')
+        url = reverse('reading-status-detail', kwargs={'pk': reading_status.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'status': 'C', 'finished_at': '2024-02-01'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('"api_readingstatus"."user_id" =' in query['sql'] and 'LIMIT 1' in query['sql']
+                             for query in queries.captured_queries))
+        reading_status.refresh_from_db()
+        self.assertEqual(reading_status.status, 'C')
+
+        # Las reglas del modelo se siguen aplicando sobre la instancia completa
+        response = self.client.patch(url, {'status': 'N'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('status', response.data['details'])
+
+    def test_reading_stats(self):
+        """Test estadísticas de lectura agregadas por año, mes, género y autor"""
+        year = date.today().year - 1
+        for index, (month, rating) in enumerate([(1, 4), (1, 5), (3, 3)]):
+            book = Book.objects.create(
+                title=f'Stats Book {index}', isbn=f'978-7-000-{index:05d}-0', publisher=self.publisher, pages=100 * (index + 1)
+            )
+            book.authors.add(self.author)
+            book.genres.add(self.genre)
+            ReadingStatus.objects.create(
+                user=self.user, book=book, status='C', rating=rating,
+                started_at=date(year, month, 1), finished_at=date(year, month, 10),
+            )
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='R', started_at=date(year, 5, 1))
+        ReadingStatus.objects.create(user=self.other_user, book=self.book, status='C', rating=1, finished_at=date(year, 1, 5))
+
+        url = reverse('reading-status-stats')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'year': year})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len([query for query in queries if 'api_readingstatus' in query['sql']]), 5)
+        self.assertEqual(response.data['statuses'], {'not_started': 0, 'reading': 1, 'completed': 3})
+        self.assertEqual(response.data['year'], {'year': year, 'books': 3, 'pages': 600, 'average_rating': 4.0})
+        self.assertEqual(response.data['months'][0], {'month': f'{year}-01', 'books': 2, 'pages': 300})
+        self.assertEqual(response.data['months'][2], {'month': f'{year}-03', 'books': 1, 'pages': 300})
+        self.assertEqual(response.data['months'][1]['books'], 0)
+        self.assertEqual(response.data['genres'], [{'name': 'Fiction', 'books': 3, 'average_rating': 4.0}])
+        self.assertEqual(response.data['authors'], [{'name': 'Test Author', 'books': 3, 'average_rating': 4.0}])
+
+        self.assertEqual(self.client.get(url, {'year': 'abc'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reading_stats_cached_per_user(self):
+        """Test las estadísticas se cachean por usuario y se invalidan con sus escrituras"""
+        url = reverse('reading-status-stats')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertFalse([query for query in queries if 'api_readingstatus' in query['sql']])
+
+        # Los estados de otro usuario no invalidan las de este
+        ReadingStatus.objects.create(user=self.other_user, book=self.book, status='N')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        self.client.post(reverse('reading-status-list'), {'book': self.book.id, 'status': 'N'}, format='json')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['statuses']['not_started'], 1)
+
+    def test_reading_stats_etag_follows_current_year(self):
+        """Test sin ?year= el ETag y la caché de las estadísticas cambian con el año"""
+        url = reverse('reading-status-stats')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        next_year = timezone.now().replace(month=1, day=1) + timedelta(days=366)
+        with mock.patch('api.views.timezone.now', return_value=next_year):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['year']['year'], next_year.year)
+
+    def test_reading_year_summary(self):
+        """Test resumen anual leído de una fila y actualizado por la importación en bloque"""
+        year = date.today().year - 1
+        url = reverse('reading-status-summary', kwargs={'year': year})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['books'], 0)
+        self.assertIsNone(response.data['longest_book'])
+
+        self.book.pages = 300
+        self.book.save()
+        response = self.client.post(reverse('reading-status-bulk'), [
+            {'book': self.book.id, 'status': 'C', 'rating': 4.5, 'started_at': f'{year}-01-01', 'finished_at': f'{year}-02-01'},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len([query for query in queries if 'api_' in query['sql']]), 1)
+        self.assertEqual(response.data['books'], 1)
+        self.assertEqual(response.data['pages'], 300)
+        self.assertEqual(response.data['top_genres'], [{'name': 'Fiction', 'books': 1}])
+        self.assertEqual(response.data['longest_book'], {'id': self.book.id, 'title': 'Test Book', 'pages': 300})
+        self.assertEqual(response.data['rating_histogram']['4.5'], 1)
+        self.assertEqual(response.data['rating_histogram']['0.5'], 0)
+
     def test_create_reading_status_invalid_dates(self):
         """Test crear estado de lectura con fechas inválidas"""
         url = reverse('reading-status-list')
@@ -331,6 +890,146 @@ class ReadingStatusAPITest(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         # La validación se hace en el método validate() del serializer
         self.assertIn('non_field_errors', response.data['details'])
+    
+    def test_bulk_upsert_reading_statuses(self):
+        """Test importación en bloque con creación, actualización y errores por fila"""
+        books = [
+            Book.objects.create(title=f'Import {index}', isbn=f'978-6-000-{index:05d}-0', publisher=self.publisher)
+            for index in range(20)
+        ]
+        ReadingStatus.objects.create(user=self.user, book=books[0], status='N')
+        records = [
+            {'book': book.id, 'status': 'C', 'rating': 4.5, 'started_at': '2024-01-01', 'finished_at': '2024-02-01'}
+            for book in books
+        ]
+        records += [
+            {'book': 999999, 'status': 'N'},
+            {'book': self.book.id, 'status': 'C', 'rating': 4},  # Sin fecha de finalización
+            {'book': self.book.id, 'status': 'X'},
+        ]
+        
+        url = reverse('reading-status-bulk')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, records, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(len(queries), 20)  # No depende del número de filas
+        data = response.data['data']
+        self.assertEqual((data['created'], data['updated']), (19, 1))
+        self.assertEqual([error['index'] for error in data['errors']], [20, 21, 22])
+        self.assertIn('book', data['errors'][0]['errors'])
+        self.assertIn('book', data['errors'][1]['errors'])  # Sustituida por la fila 22
+        self.assertIn('status', data['errors'][2]['errors'])
+        # Cada fila se importa o se devuelve como error
+        self.assertEqual(data['created'] + data['updated'] + len(data['errors']), len(records))
+        
+        self.assertEqual(ReadingStatus.objects.filter(user=self.user, status='C').count(), 20)
+        books[0].refresh_from_db()
+        self.assertEqual((books[0].reader_count, books[0].rating_avg), (1, Decimal('4.50')))
+    
+    def test_bulk_upsert_reading_statuses_wrong_types(self):
+        """Test importación en bloque con valores de tipo inesperado"""
+        other_book, third_book = [
+            Book.objects.create(title=f'Other Book {index}', isbn=f'978-6-000-9999{index}-0', publisher=self.publisher)
+            for index in range(2)
+        ]
+        records = [
+            {'book': self.book.id, 'status': 'R', 'started_at': 123},
+            {'book': other_book.id, 'status': 'C', 'rating': 'five', 'started_at': '2024-01-01', 'finished_at': '2024-02-01'},
+            {'book': third_book.id, 'status': 'C', 'rating': [4], 'finished_at': {'day': 1}},
+        ]
+        response = self.client.post(reverse('reading-status-bulk'), records, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data['data']
+        self.assertEqual((data['created'], data['updated']), (0, 0))
+        self.assertEqual([error['index'] for error in data['errors']], [0, 1, 2])
+        self.assertIn('started_at', data['errors'][0]['errors'])
+        self.assertIn('rating', data['errors'][1]['errors'])
+        self.assertEqual(set(data['errors'][2]['errors']), {'rating', 'finished_at'})
+        self.assertFalse(ReadingStatus.objects.filter(user=self.user).exists())
+
+        response = self.client.post(
+            reverse('reading-status-bulk'), json.dumps({'book': self.book.id, 'started_at': 123}),
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('started_at', response.data['data']['errors'][0]['errors'])
+
+    def test_bulk_upsert_reading_statuses_ndjson(self):
+        """Test importación en bloque en formato NDJSON"""
+        body = '\n'.join([
+            json.dumps({'book': self.book.id, 'status': 'R', 'started_at': '2024-03-01'}),
+            '',
+            json.dumps({'book': self.book.id, 'status': 'C', 'started_at': '2024-03-01', 'finished_at': '2024-03-10', 'rating': 3}),
+        ])
+        url = reverse('reading-status-bulk')
+        response = self.client.post(url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['created'], 1)
+        reading_status = ReadingStatus.objects.get(user=self.user, book=self.book)
+        self.assertEqual((reading_status.status, reading_status.rating), ('C', Decimal('3.0')))
+        
+        response = self.client.post(url, '{"book": 1\nnot json', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsetTest(BaseAPITestCase):
+    """Tests para ?fields= y ?expand= en los serializadores de lectura"""
+
+    def setUp(self):
+        super().setUp()
+        ReadingStatus.objects.create(user=self.user, book=self.book, status='R', started_at=date(2024, 1, 1))
+
+    def get_with_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in queries]
+
+    def test_reading_status_fields(self):
+        """Test campos anidados con punto y consulta recortada"""
+        url = reverse('reading-status-list')
+        response, full = self.get_with_queries(url)
+        self.assertIn('synopsis', response.data['results'][0]['book_detail'])
+
+        response, sparse = self.get_with_queries(url, {'fields': 'id,status,book_detail.title'})
+        self.assertEqual(response.data['results'][0], {
+            'id': response.data['results'][0]['id'], 'status': 'R', 'book_detail': {'title': 'Test Book'},
+        })
+        # Sin precargar autores ni géneros y sin leer la sinopsis
+        self.assertEqual(len(sparse), len(full) - 2)
+        self.assertFalse(any('synopsis' in sql for sql in sparse))
+
+    def test_nested_fields_only_many_to_many(self):
+        """Test un anidado del que solo se piden relaciones ManyToMany"""
+        response, _ = self.get_with_queries(reverse('reading-status-list'), {'fields': 'id,book_detail.authors'})
+        self.assertEqual(response.data['results'][0]['book_detail'], {'authors': ['Test Author']})
+        response, _ = self.get_with_queries(reverse('reading-status-list'), {'fields': 'book_detail.genres'})
+        self.assertEqual(response.data['results'][0], {'book_detail': {'genres': ['Fiction']}})
+        response, _ = self.get_with_queries(reverse('review-list'), {'fields': 'book.authors', 'expand': 'book'})
+        self.assertEqual(response.data['results'][0], {'book': {'authors': ['Test Author']}})
+
+    def test_book_fields_and_expand(self):
+        """Test relaciones expandidas a objetos y anidado completo sin subcampos"""
+        url = reverse('book-detail', kwargs={'pk': self.book.id})
+        response, _ = self.get_with_queries(url, {'fields': 'title,authors,publisher', 'expand': 'authors'})
+        self.assertEqual(set(response.data), {'title', 'authors', 'publisher'})
+        self.assertEqual(response.data['authors'][0]['name'], 'Test Author')
+        self.assertEqual(response.data['publisher'], 'Test Publisher')
+
+        url = reverse('review-list')
+        response, _ = self.get_with_queries(url, {'fields': 'id,book.title,book.publisher', 'expand': 'book.publisher'})
+        self.assertEqual(response.data['results'][0]['book']['title'], 'Test Book')
+        self.assertEqual(response.data['results'][0]['book']['publisher']['country'], 'Spain')
+
+    def test_bookshelf_books_fields(self):
+        """Test ?fields= en los libros de una estantería, paginados y en streaming"""
+        BookshelfEntry.objects.create(bookshelf=self.bookshelf, book=self.book)
+        url = reverse('bookshelf-books', kwargs={'pk': self.bookshelf.id})
+        response, _ = self.get_with_queries(url, {'fields': 'id,title'})
+        self.assertEqual(response.data['results'], [{'id': self.book.id, 'title': 'Test Book'}])
+
+        response = self.client.get(url, {'fields': 'title', 'all': 'true'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [{'title': 'Test Book'}])
 
 
 class PaginationTest(BaseAPITestCase):
@@ -371,6 +1070,84 @@ class PaginationTest(BaseAPITestCase):
         self.assertEqual(len(response.data['results']), 6)
         self.assertIsNotNone(response.data['previous'])
 
+    def test_books_keyset_pagination(self):
+        """Test paginación keyset recorre todos los libros sin repetir y sin COUNT"""
+        for i in range(25):
+            Book.objects.create(
+                title=f'Book {i % 5}',  # Títulos repetidos para forzar el desempate por id
+                isbn=f'978-0-123-4567{i:02d}',
+                publisher=self.publisher
+            )
+
+        url = reverse('book-list')
+        response = self.client.get(url, {'pagination': 'keyset', 'page_size': 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+
+        seen = [book['id'] for book in response.data['results']]
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+            seen.extend(book['id'] for book in response.data['results'])
+
+        expected = list(Book.objects.order_by('title', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        # Volver atrás desde la última página
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_reading_statuses_keyset_pagination_with_nulls(self):
+        """Test paginación keyset con fechas nulas en el campo de ordenación"""
+        from datetime import date
+        for i in range(7):
+            book = Book.objects.create(title=f'Status Book {i}', isbn=f'978-0-555-0000{i}', publisher=self.publisher)
+            if i % 2:
+                ReadingStatus.objects.create(user=self.user, book=book, status='R', started_at=date(2024, 1, i + 1))
+            else:
+                ReadingStatus.objects.create(user=self.user, book=book, status='N')
+
+        url = reverse('reading-status-list')
+        response = self.client.get(url, {'pagination': 'keyset', 'page_size': 3, 'count': 'true'})
+        self.assertEqual(response.data['count'], 7)
+
+        seen = [status_data['id'] for status_data in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(status_data['id'] for status_data in response.data['results'])
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+        started = [ReadingStatus.objects.get(pk=pk).started_at for pk in seen]
+        self.assertEqual(started[:3], [date(2024, 1, 6), date(2024, 1, 4), date(2024, 1, 2)])
+        self.assertTrue(all(value is None for value in started[3:]))
+
+    def test_keyset_pagination_keeps_id_direction(self):
+        """Test paginación keyset con orden descendente por id"""
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from api.pagination import KeysetPagination
+        for i in range(4):
+            Book.objects.create(title='Same', isbn=f'978-0-777-0000{i}', publisher=self.publisher)
+
+        expected = list(Book.objects.order_by('-id').values_list('id', flat=True))
+        paginator, seen, url = KeysetPagination(), [], '/api/books/?page_size=2'
+        while url:
+            request = Request(APIRequestFactory().get(url))
+            seen += [book.id for book in paginator.paginate_queryset(Book.objects.order_by('-id'), request)]
+            url = paginator.get_next_link()
+        self.assertEqual(paginator.ordering, ['-pk'])
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        """Test cursor inválido devuelve 404"""
+        url = reverse('book-list')
+        response = self.client.get(url, {'pagination': 'keyset', 'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class UserRegistrationTest(APITestCase):
     """Tests para el endpoint de registro de usuarios"""
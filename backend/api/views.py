@@ -3,14 +3,19 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticate
 from rest_framework.exceptions import MethodNotAllowed
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.parsers import JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.shortcuts import get_object_or_404
+from django.db.models import Count, F, Max, OuterRef, Prefetch, Q, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.utils import timezone
 from .exceptions import DuplicateEntryException, ResourceNotFoundException
 from .filters import BookFilter, ReviewFilter, CommentFilter, ReadingStatusFilter, BookshelfFilter
-from .models import Author, Book, Genre, Review, ReadingStatus, Bookshelf, Comment, Publisher, BookshelfEntry  
+from .models import Author, Book, Genre, Review, ReadingStatus, Bookshelf, Comment, Publisher, BookshelfEntry, subtree_range
 from .serializers import (
     AuthorSerializer, 
     PublisherSerializer,
@@ -18,28 +23,47 @@ from .serializers import (
     GenreSerializer,
     ReviewReadSerializer, ReviewWriteSerializer,
     ReadingStatusReadSerializer, ReadingStatusWriteSerializer,
-    BookshelfReadSerializer, BookshelfWriteSerializer,
-    CommentReadSerializer, CommentWriteSerializer,
+    BookshelfReadSerializer, BookshelfSummarySerializer, BookshelfWriteSerializer, BookshelfBulkBooksSerializer,
+    CommentReadSerializer, CommentTreeSerializer, CommentWriteSerializer,
 )
 from .permissions import IsOwnerOrReadOnly
+from .search import BookSearchFilter
+from .autocomplete import autocomplete as autocomplete_books
+from . import response_cache
+from .response_cache import CachedResponseMixin, ConditionalGetMixin, cached_response, conditional
+from .streaming import streaming_json_response
+from .bulk import upsert_reading_statuses
+from .stats import reading_stats
+from .summaries import summary_data
+from .comments import build_comment_tree
+from .fieldsets import PrunedQuerysetMixin
+from .parsers import NDJSONParser
 
 # AuthorViewSet
-class AuthorViewSet(viewsets.ModelViewSet):
+class AuthorViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
+    cache_tables = ('author',)
 
 # PublisherViewSet
-class PublisherViewSet(viewsets.ModelViewSet):
+class PublisherViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Publisher.objects.all()
     serializer_class = PublisherSerializer
+    cache_tables = ('publisher',)
 
 # BookViewSet
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(CachedResponseMixin, PrunedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # Los cambios en autores, editoriales y géneros invalidan también 'book' (ver api.signals)
+    cache_tables = ('book',)
+    # La búsqueda va al final para poder ordenar por relevancia (ver api.search)
+    filter_backends = [DjangoFilterBackend, OrderingFilter, BookSearchFilter]
     filterset_class = BookFilter
     search_fields = ['title', 'synopsis', 'authors__name', 'publisher__name']
-    ordering_fields = ['title', 'publication_date', 'pages', 'created_at']
+    ordering_fields = [
+        'title', 'publication_date', 'pages', 'created_at',
+        'rating_avg', 'rating_count', 'review_count', 'reader_count',
+    ]
     ordering = ['title']  # Ordenamiento por defecto
     
     def get_queryset(self):
@@ -54,18 +78,31 @@ class BookViewSet(viewsets.ModelViewSet):
         # Para cualquier otra acción (create, update, destroy)
         return BookWriteSerializer
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Sugerencias ligeras para el buscador: id, título, primer autor y portada.
+        Parámetros: q (mínimo 2 caracteres) y limit (por defecto 10, máximo 20)
+        """
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        return Response(autocomplete_books(request.query_params.get('q', ''), limit))
+
 # GenreViewSet
-class GenreViewSet(viewsets.ModelViewSet):
+class GenreViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
+    cache_tables = ('genre',)
 
 # ReviewViewSet
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(PrunedQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = ReviewFilter
     search_fields = ['review_text', 'book__title', 'user__username']
-    ordering_fields = ['created_at', 'updated_at', 'book__title']
+    ordering_fields = ['created_at', 'updated_at', 'book__title', 'comment_count', 'last_comment_at']  # -comment_count: más comentadas
     ordering = ['-created_at']  # Más recientes primero
 
     def get_queryset(self):
@@ -111,7 +148,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
             serializer.save(user=self.request.user)
 
 # ReadingStatusViewSet
-class ReadingStatusViewSet(viewsets.ModelViewSet):
+class ReadingStatusViewSet(ConditionalGetMixin, PrunedQuerysetMixin, viewsets.ModelViewSet):
     queryset = ReadingStatus.objects.all()
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -119,21 +156,125 @@ class ReadingStatusViewSet(viewsets.ModelViewSet):
     search_fields = ['book__title', 'book__authors__name']
     ordering_fields = ['started_at', 'finished_at', 'book__title', 'rating']
     ordering = ['-started_at']  # Más recientes primero
+    MAX_BULK_RECORDS = 10000
 
     # Un usuario solo puede ver sus propios ReadingStatus
     def get_queryset(self):
         return ReadingStatus.objects.filter(user=self.request.user).select_related('book', 'user', 'book__publisher').prefetch_related('book__authors', 'book__genres')
 
+    def get_cache_tags(self):
+        # Los libros se muestran completos en book_detail, contadores incluidos, así
+        # que las calificaciones de otros usuarios cambian el ETag del listado y del
+        # detalle; no el de las estadísticas y el resumen, que no los muestran
+        tags = [f'reading_status:user:{self.request.user.pk}', 'book:content']
+        if self.action in ('list', 'retrieve'):
+            tags.append('book:counters')
+        return tags
+
+    def get_response_hash(self, request, *extra):
+        # Sin ?year= las estadísticas son las del año en curso: el año va en el ETag
+        # y en la clave de la caché para que en Año Nuevo no se sirvan las del anterior
+        if self.action == 'stats':
+            extra += (timezone.now().year,)
+        return super().get_response_hash(request, *extra)
+
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return ReadingStatusReadSerializer
         return ReadingStatusWriteSerializer
 
+    # La unicidad (usuario, libro) la comprueba la base de datos al guardar
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        try:
+            serializer.save(user=self.request.user)
+        except IntegrityError:
+            raise DuplicateEntryException("Ya tienes un estado de lectura para este libro")
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except IntegrityError:
+            raise DuplicateEntryException("Ya tienes un estado de lectura para este libro")
+
+    @action(detail=False, methods=['get'])
+    @conditional
+    def stats(self, request):
+        """
+        Estadísticas de lectura del usuario: estados, libros y páginas del año
+        (?year=, por defecto el actual) en total y por mes, y géneros y autores
+        más leídos con su calificación media. Se cachean por usuario hasta que
+        cambia alguno de sus estados de lectura (o los datos de los libros)
+        """
+        year = request.query_params.get('year', '')
+        if not year:
+            year = timezone.now().year
+        elif year.isdigit() and 1 <= int(year) <= 9999:
+            year = int(year)
+        else:
+            return Response(
+                {
+                    'error': True,
+                    'message': 'Año no válido',
+                    'details': {'year': ['Debe ser un año entre 1 y 9999']}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = f'{response_cache.KEY_PREFIX}:reading_stats:{request.user.pk}:{self.get_response_hash(request)}'
+        return cached_response(cache_key, lambda: Response(reading_stats(request.user, year)))
+
+    @action(detail=False, methods=['get'], url_path=r'summary/(?P<year>\d{4})')
+    @conditional
+    def summary(self, request, year=None):
+        """
+        Resumen de un año de lectura del usuario ("year in books"): libros y
+        páginas, géneros y autores más leídos, libros más largo y más corto e
+        histograma de calificaciones. Se lee de una fila precalculada
+        """
+        return Response(summary_data(request.user, int(year)))
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Crea o actualiza en bloque los estados de lectura del usuario. Acepta una lista
+        JSON (o {"records": [...]}) o NDJSON con {book, status, rating, started_at, finished_at}.
+        Las filas con errores se devuelven en "errors" sin abortar el resto.
+        """
+        records = request.data
+        if isinstance(records, dict):
+            records = records.get('records')
+        if not isinstance(records, list) or not records:
+            return Response(
+                {
+                    'error': True,
+                    'message': 'Se esperaba una lista de estados de lectura',
+                    'details': {'records': ['Este campo es obligatorio']}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(records) > self.MAX_BULK_RECORDS:
+            return Response(
+                {
+                    'error': True,
+                    'message': f'Como máximo {self.MAX_BULK_RECORDS} estados de lectura por petición',
+                    'details': {'records': [f'Se han recibido {len(records)}']}
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = upsert_reading_statuses(request.user, records)
+        imported = result['created'] + result['updated']
+        return Response(
+            {
+                'error': False,
+                'message': f'{imported} estados de lectura importados, {len(result["errors"])} con errores',
+                'data': result,
+            },
+            status=status.HTTP_200_OK
+        )
 
 # BookshelfViewSet
-class BookshelfViewSet(viewsets.ModelViewSet):
+class BookshelfViewSet(ConditionalGetMixin, PrunedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Bookshelf.objects.all()
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -141,14 +282,54 @@ class BookshelfViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
     ordering = ['-created_at']  # Más recientes primero
+    pagination_mode = 'page'  # La acción books usa keyset (ver api.pagination)
 
     # Un usuario solo puede ver sus estanterías
     def get_queryset(self):
-        return Bookshelf.objects.filter(user=self.request.user).select_related('user').prefetch_related('entries__book', 'entries__book__publisher', 'entries__book__authors')
+        queryset = Bookshelf.objects.filter(user=self.request.user)
+        if self.action not in ['list', 'retrieve']:
+            return queryset
+        # Número fijo de consultas sea cual sea el número de estanterías y libros
+        if self.is_summary_view():
+            # Solo las 4 entradas más antiguas de cada estantería, para la portada automática
+            cover_entries = BookshelfEntry.objects.annotate(
+                position=Window(RowNumber(), partition_by=F('bookshelf'), order_by=[F('added_at').asc(), F('id').asc()])
+            ).filter(position__lte=4).select_related('book').order_by('added_at', 'id')
+            return queryset.annotate(
+                book_count=self.entry_aggregate(Count('pk'), 0),
+                last_updated=Coalesce(self.entry_aggregate(Max('added_at')), 'created_at'),
+            ).prefetch_related(Prefetch('entries', queryset=cover_entries, to_attr='cover_entries'))
+        entries = BookshelfEntry.objects.select_related('book__publisher').prefetch_related(
+            'book__authors', 'book__genres'
+        ).order_by('added_at', 'id')
+        return queryset.select_related('user').annotate(book_count=self.entry_aggregate(Count('pk'), 0)).prefetch_related(
+            Prefetch('entries', queryset=entries)
+        )
+
+    @staticmethod
+    def entry_aggregate(aggregate, default=None):
+        """
+        Agregado de las entradas de cada estantería como subconsulta correlacionada
+        (índice shelfentry_shelf_added_idx). Con Count() sobre el JOIN, el GROUP BY
+        impediría ordenar las estanterías con el índice (user, -created_at)
+        """
+        entries = BookshelfEntry.objects.filter(bookshelf=OuterRef('pk')).order_by().values('bookshelf')
+        value = Subquery(entries.annotate(value=aggregate).values('value'))
+        return value if default is None else Coalesce(value, default)
+    
+    def get_cache_tags(self):
+        tags = [f'bookshelf:user:{self.request.user.pk}', 'book:content']
+        # Las entradas y los libros de la estantería incluyen los contadores del libro
+        if not (self.action in ('list', 'retrieve') and self.is_summary_view()):
+            tags.append('book:counters')
+        return tags
+    
+    def is_summary_view(self):
+        return self.request.query_params.get('view') == 'summary'
     
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
-            return BookshelfReadSerializer
+            return BookshelfSummarySerializer if self.is_summary_view() else BookshelfReadSerializer
         return BookshelfWriteSerializer
     
     def perform_create(self, serializer):
@@ -227,13 +408,115 @@ class BookshelfViewSet(viewsets.ModelViewSet):
         except BookshelfEntry.DoesNotExist:
             raise ResourceNotFoundException("El libro no está en esta estantería")
     
-    @action(detail=True, methods=['get'])
-    def books(self, request, pk=None):
-        """Obtener todos los libros de una estantería"""
+    @action(detail=True, methods=['post'])
+    def add_books(self, request, pk=None):
+        """
+        Añade varios libros a la estantería con una consulta de comprobación y un
+        único INSERT. Devuelve el resultado de cada id: added, already_present o not_found
+        """
+        bookshelf = self.get_object()
+        serializer = BookshelfBulkBooksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        book_ids = serializer.validated_data['book_ids']
+
+        with transaction.atomic():
+            found = set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+            present = set(bookshelf.entries.filter(book_id__in=book_ids).values_list('book_id', flat=True))
+            new_ids = [book_id for book_id in book_ids if book_id in found and book_id not in present]
+            # ignore_conflicts cubre las inserciones concurrentes del mismo libro
+            BookshelfEntry.objects.bulk_create(
+                [BookshelfEntry(bookshelf=bookshelf, book_id=book_id) for book_id in new_ids],
+                ignore_conflicts=True,
+            )
+        if new_ids:
+            # bulk_create no envía post_save
+            response_cache.invalidate(f'bookshelf:user:{bookshelf.user_id}')
+
+        results = [
+            {
+                'book_id': book_id,
+                'status': 'not_found' if book_id not in found else 'already_present' if book_id in present else 'added',
+            }
+            for book_id in book_ids
+        ]
+        return Response(
+            {
+                'error': False,
+                'message': f'{len(new_ids)} libros añadidos a la estantería',
+                'data': {'bookshelf_id': bookshelf.id, 'results': results},
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=True, methods=['post'])
+    def remove_books(self, request, pk=None):
+        """
+        Quita varios libros de la estantería con un único DELETE.
+        Devuelve el resultado de cada id: removed, not_in_shelf o not_found
+        """
         bookshelf = self.get_object()
-        books = Book.objects.filter(entries__bookshelf=bookshelf).select_related('publisher').prefetch_related('authors', 'genres')
-        serializer = BookReadSerializer(books, many=True)
-        return Response(serializer.data)
+        serializer = BookshelfBulkBooksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        book_ids = serializer.validated_data['book_ids']
+
+        with transaction.atomic():
+            found = set(Book.objects.filter(pk__in=book_ids).values_list('pk', flat=True))
+            entries = bookshelf.entries.filter(book_id__in=book_ids)
+            present = set(entries.values_list('book_id', flat=True))
+            # Las entradas salen de bookshelf.entries, que les asigna esta estantería: los
+            # receptores de post_delete leen su usuario sin consultas (delete() descarta select_related)
+            entries.delete()
+
+        results = [
+            {
+                'book_id': book_id,
+                'status': 'not_found' if book_id not in found else 'removed' if book_id in present else 'not_in_shelf',
+            }
+            for book_id in book_ids
+        ]
+        return Response(
+            {
+                'error': False,
+                'message': f'{len(present)} libros eliminados de la estantería',
+                'data': {'bookshelf_id': bookshelf.id, 'results': results},
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(
+        detail=True,
+        methods=['get'],
+        # Los filtros, la búsqueda y la ordenación de esta acción son los de los libros
+        filter_backends=[DjangoFilterBackend, OrderingFilter, BookSearchFilter],
+        filterset_class=BookFilter,
+        search_fields=BookViewSet.search_fields,
+        ordering_fields=BookViewSet.ordering_fields + ['added_at'],
+        ordering=['title'],
+        pagination_mode='keyset',
+    )
+    @conditional
+    def books(self, request, pk=None):
+        """
+        Libros de una estantería, paginados (por clave por defecto) y con los filtros
+        de /api/books/ más ?ordering=added_at. Con ?all=true se envía el listado
+        completo en streaming en lugar de una página.
+        """
+        # Sin get_object(): aplicaría los filtros de libros a las estanterías
+        bookshelf = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(request, bookshelf)
+
+        # filter() y annotate() comparten el JOIN, así que added_at es el de esta estantería
+        books = Book.objects.filter(entries__bookshelf=bookshelf).annotate(
+            added_at=F('entries__added_at')
+        ).select_related('publisher').prefetch_related('authors', 'genres')
+        books = self.prune_queryset(self.filter_queryset(books), BookReadSerializer(context=self.get_serializer_context()))
+
+        if request.query_params.get('all', '').lower() in ('1', 'true'):
+            return streaming_json_response(books, BookReadSerializer, self.get_serializer_context())
+
+        page = self.paginate_queryset(books)
+        serializer = BookReadSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
 # CommentViewSet
 class CommentViewSet(viewsets.ModelViewSet):
@@ -242,7 +525,7 @@ class CommentViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_class = CommentFilter
     search_fields = ['comment_text', 'user__username']
-    ordering_fields = ['created_at']
+    ordering_fields = ['created_at', 'path']  # path: hilos en profundidad
     ordering = ['created_at']  # Más antiguos primero (para conversación)
 
     def get_queryset(self):
@@ -254,6 +537,39 @@ class CommentViewSet(viewsets.ModelViewSet):
         if self.action in ['list', 'retrieve']:
             return CommentReadSerializer
         return CommentWriteSerializer
+
+    def list(self, request, *args, **kwargs):
+        """
+        Con ?tree=1 devuelve los comentarios principales paginados (con los filtros
+        y la ordenación de la vista) y sus respuestas anidadas en "replies"
+        """
+        if request.query_params.get('tree', '').lower() not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+
+        comments = Comment.objects.filter(review_id=self.kwargs['review_pk']).select_related('user')
+        page = self.paginate_queryset(self.filter_queryset(comments.filter(parent_comment__isnull=True)))
+        # Solo los hilos de la página: un rango de rutas por comentario principal
+        subtrees = Q()
+        for root in page:
+            if root.path:
+                subtrees |= Q(**subtree_range(root.path))
+        replies = comments.filter(subtrees, depth__gt=0).order_by('path') if subtrees else Comment.objects.none()
+        tree = build_comment_tree(
+            CommentTreeSerializer(page, many=True).data,
+            CommentTreeSerializer(replies, many=True).data,
+        )
+        return self.get_paginated_response(tree)
+
+    @action(detail=True, methods=['get'])
+    def thread(self, request, *args, **kwargs):
+        """Un comentario con todas sus respuestas anidadas (el subárbol en una consulta)"""
+        comment = self.get_object()
+        replies = comment.descendants().select_related('user')
+        tree = build_comment_tree(
+            [CommentTreeSerializer(comment).data],
+            CommentTreeSerializer(replies, many=True).data,
+        )
+        return Response(tree[0])
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Búsqueda de texto completo y trigramas
     'rest_framework',
     'django_filters',  # Para filtros avanzados
     'corsheaders',  # Para permitir peticiones desde el frontend
@@ -56,6 +57,28 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# CONFIGURACIÓN DE CACHÉ
+# locmem sirve para un único proceso; con varios workers hace falta un backend
+# compartido (file o redis) para que las invalidaciones lleguen a todos
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else ''),
+    }
+}
+
+# Caché de respuestas de autores, editoriales, géneros y libros (ver api.response_cache)
+RESPONSE_CACHE = {
+    'ENABLED': config('RESPONSE_CACHE_ENABLED', default=True, cast=bool),
+    'TIMEOUT': 600,           # Segundos; las invalidaciones por señales la mantienen al día
+}
+
 ROOT_URLCONF = 'booktracker.urls'
 
 TEMPLATES = [
@@ -147,7 +170,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'EXCEPTION_HANDLER': 'api.exceptions.custom_exception_handler',
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.ApiPagination',  # ?page=N o ?pagination=keyset
     'PAGE_SIZE': 50,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -157,6 +180,17 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# CONFIGURACIÓN DE BÚSQUEDA
+# Configuración de texto de PostgreSQL para el índice de libros ('simple' no
+# aplica stemming, así sirve igual para títulos en español e inglés)
+BOOK_SEARCH_CONFIG = config('BOOK_SEARCH_CONFIG', default='simple')
+
+# Autocompletado de /api/books/autocomplete/
+BOOK_AUTOCOMPLETE = {
+    'TIMEOUT_MS': 50,         # Presupuesto por consulta en PostgreSQL (statement_timeout)
+    'CACHE_TIMEOUT': 300,     # Segundos que se cachea la respuesta de cada prefijo
+}
+
 # CONFIGURACIÓN DE JWT
 from datetime import timedelta
 